@@ -1,6 +1,8 @@
+import itertools
 import math
 from collections import deque
-from typing import Optional, Tuple, Dict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Optional, Tuple, Dict, List, Callable
 import numpy as np
 
 def detect_bounce(
@@ -172,6 +174,444 @@ def detect_bounce(
     return None
 
 
+class BounceDetector:
+    """
+    Allocation-free equivalent of detect_bounce for the live loop.
+
+    Same parameters and exactly the same decisions, but the state lives
+    in fixed-size ring lists with running sums instead of a dict of
+    deques, and the tiny means are plain arithmetic instead of np.mean.
+    """
+
+    __slots__ = (
+        "field_width", "field_height",
+        "velocity_threshold", "angle_threshold", "boundary_margin",
+        "min_frames_between", "min_frames_boundary", "history_size",
+        "min_movement_threshold", "noise_filter_size",
+        # smoothing ring (raw positions) + running sums
+        "_fx", "_fy", "_f_head", "_f_count", "_f_sum_x", "_f_sum_y",
+        # last smoothed position and history length
+        "_last_x", "_last_y", "_hist_len",
+        # velocity rings: dx/dy for the last 4 steps, magnitudes for the last 10
+        "_vdx", "_vdy", "_vmag", "_v_head", "_mov_count",
+        "frames_since_bounce", "last_bounce_coords",
+    )
+
+    _VEL_RING = 4    # detect_bounce only looks at the last 4 velocities
+    _MOV_RING = 10   # movement_history maxlen
+
+    def __init__(
+        self,
+        field_width: int,
+        field_height: int,
+        velocity_threshold: float = 15.0,
+        angle_threshold: float = 45.0,
+        boundary_margin: int = 25,
+        min_frames_between: int = 6,
+        min_frames_boundary: int = 3,
+        history_size: int = 15,
+        min_movement_threshold: float = 2.0,
+        noise_filter_size: int = 3
+    ):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.velocity_threshold = velocity_threshold
+        self.angle_threshold = angle_threshold
+        self.boundary_margin = boundary_margin
+        self.min_frames_between = min_frames_between
+        self.min_frames_boundary = min_frames_boundary
+        self.history_size = history_size
+        self.min_movement_threshold = min_movement_threshold
+        self.noise_filter_size = noise_filter_size
+
+        self._fx = [0] * noise_filter_size
+        self._fy = [0] * noise_filter_size
+        self._vdx = [0] * self._VEL_RING
+        self._vdy = [0] * self._VEL_RING
+        self._vmag = [0.0] * self._MOV_RING
+        self.reset()
+
+    def reset(self) -> None:
+        self._f_head = 0
+        self._f_count = 0
+        self._f_sum_x = 0
+        self._f_sum_y = 0
+        self._last_x = 0
+        self._last_y = 0
+        self._hist_len = 0
+        self._v_head = 0
+        self._mov_count = 0
+        self.frames_since_bounce = 0
+        self.last_bounce_coords = None
+
+    def update(self, current_x: int, current_y: int) -> Optional[Tuple[int, int]]:
+        """
+        Feeds one ball position; returns the bounce coordinates or None.
+        """
+        fw = self.field_width
+        fh = self.field_height
+
+        # ---- 1. Reject garbage coordinates immediately ----
+        if not (0 <= current_x <= fw and 0 <= current_y <= fh):
+            return None
+
+        # ---- 3. Position smoothing (running sums over the ring) ----
+        n = self.noise_filter_size
+        head = self._f_head
+        if self._f_count == n:
+            self._f_sum_x -= self._fx[head]
+            self._f_sum_y -= self._fy[head]
+        else:
+            self._f_count += 1
+        self._fx[head] = current_x
+        self._fy[head] = current_y
+        self._f_sum_x += current_x
+        self._f_sum_y += current_y
+        self._f_head = (head + 1) % n
+
+        if self._f_count >= n:
+            smoothed_x = int(self._f_sum_x / n)
+            smoothed_y = int(self._f_sum_y / n)
+        else:
+            smoothed_x, smoothed_y = current_x, current_y
+
+        # ---- 4. Book-keeping with smoothed positions ----
+        if self._hist_len < self.history_size:
+            self._hist_len += 1
+        self.frames_since_bounce += 1
+
+        vmag = self._vmag
+        if self._hist_len >= 2:
+            dx = smoothed_x - self._last_x
+            dy = smoothed_y - self._last_y
+            v_head = self._v_head
+            self._vdx[v_head % self._VEL_RING] = dx
+            self._vdy[v_head % self._VEL_RING] = dy
+            vmag[v_head % self._MOV_RING] = math.hypot(dx, dy)
+            self._v_head = v_head + 1
+            if self._mov_count < self._MOV_RING:
+                self._mov_count += 1
+        self._last_x = smoothed_x
+        self._last_y = smoothed_y
+
+        # ---- 5. Early exit for static ball ----
+        head = self._v_head
+        if self._mov_count >= 3:
+            avg_movement = (vmag[(head - 3) % 10] + vmag[(head - 2) % 10]
+                            + vmag[(head - 1) % 10]) / 3
+            if avg_movement < self.min_movement_threshold:
+                return None
+
+        if self._hist_len < 4:
+            return None
+
+        # ---- 6. Lock-out ----
+        margin = self.boundary_margin
+        near_x = smoothed_x <= margin or smoothed_x >= fw - margin
+        near_y = smoothed_y <= margin or smoothed_y >= fh - margin
+        near_boundary = near_x or near_y
+        in_corner = near_x and near_y
+
+        lockout = self.min_frames_boundary if near_boundary else self.min_frames_between
+        if self.frames_since_bounce < lockout:
+            return None
+
+        # ---- 7. Velocity changes over the last (up to) 4 steps ----
+        count = self._hist_len - 1
+        if count < 3:
+            return None
+        if count > 4:
+            count = 4
+        first = head - count
+
+        mags = [vmag[(first + i) % 10] for i in range(count)]
+        max_velocity_change = 0.0
+        change = 0.0
+        prev_change = 0.0
+        for i in range(count - 1):
+            prev_change = change
+            change = abs(mags[i + 1] - mags[i])
+            if i == 0 or change > max_velocity_change:
+                max_velocity_change = change
+
+        # ---- 8. Angle changes (same pairs as detect_bounce) ----
+        max_angle_change = 0.0
+        found_angle = False
+        for i in range(max(1, count - 2)):
+            v1 = mags[i]
+            v2 = mags[i + 1]
+            if v1 > 0.5 and v2 > 0.5:
+                j1 = (first + i) % 4
+                j2 = (first + i + 1) % 4
+                dot = self._vdx[j1] * self._vdx[j2] + self._vdy[j1] * self._vdy[j2]
+                cos_angle = max(-1.0, min(1.0, dot / (v1 * v2 + 1e-6)))
+                angle_change = math.acos(cos_angle)
+                if not found_angle or angle_change > max_angle_change:
+                    max_angle_change = angle_change
+                    found_angle = True
+
+        # ---- 9. Adaptive thresholds ----
+        total = 0.0
+        for m in mags:
+            total += m
+        recent_avg_velocity = total / count
+
+        velocity_threshold = self.velocity_threshold
+        if recent_avg_velocity < 10:
+            v_thresh = velocity_threshold * 0.7
+        elif recent_avg_velocity > 50:
+            v_thresh = velocity_threshold * 1.3
+        else:
+            v_thresh = velocity_threshold
+
+        a_thresh = math.radians(self.angle_threshold)
+
+        if in_corner:
+            v_thresh *= 0.4
+            a_thresh *= 0.5
+
+        # ---- 10. Decision ----
+        bounce_detected = (
+            max_velocity_change >= v_thresh
+            or (max_velocity_change >= v_thresh * 0.6 and
+                max_angle_change >= a_thresh * 0.8)
+            or (near_boundary and
+                (max_velocity_change >= v_thresh * 0.5 or
+                 max_angle_change >= a_thresh * 0.6))
+            # sudden deceleration followed by acceleration
+            or (count >= 3 and
+                change > v_thresh * 0.4 and
+                prev_change > v_thresh * 0.3)
+        )
+
+        if bounce_detected:
+            self.frames_since_bounce = 0
+            self.last_bounce_coords = (smoothed_x, smoothed_y)
+            return (smoothed_x, smoothed_y)
+
+        return None
+
+    def metrics(self) -> Dict:
+        """
+        Same diagnostics as get_bounce_metrics.
+        """
+        if self._hist_len == 0:
+            return {}
+        n = self._mov_count
+        total = 0.0
+        for i in range(n):
+            total += self._vmag[(self._v_head - n + i) % 10]
+        return {
+            'avg_movement': total / n if n else 0,
+            'frames_since_bounce': self.frames_since_bounce,
+            'position_history_length': self._hist_len,
+            'last_bounce': self.last_bounce_coords
+        }
+
+
+# ------------------------------------------------------------
+# Batch / offline mode
+# ------------------------------------------------------------
+
+_BOUNCE_DEFAULTS = dict(
+    velocity_threshold=15.0,
+    angle_threshold=45.0,
+    boundary_margin=25,
+    min_frames_between=6,
+    min_frames_boundary=3,
+    history_size=15,
+    min_movement_threshold=2.0,
+    noise_filter_size=3,
+)
+
+
+def _acos_exact(cos_angle: np.ndarray, thresholds) -> np.ndarray:
+    """
+    np.arccos, except that values within a hair of a decision threshold
+    are recomputed with math.acos so comparisons match the streaming code.
+    """
+    angles = np.arccos(cos_angle)
+    close = np.zeros(angles.shape, bool)
+    for t in thresholds:
+        close |= np.abs(angles - t) < 1e-9
+    for i in np.flatnonzero(close):
+        angles[i] = math.acos(cos_angle[i])
+    return angles
+
+
+def detect_bounces_batch(xs, ys, field_width: int, field_height: int, **params) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Runs bounce detection over a whole trajectory at once.
+
+    Same semantics as feeding the points one by one to detect_bounce /
+    BounceDetector (smoothing, static-ball suppression, lock-outs), with
+    the same keyword parameters, for integer pixel coordinates (what the
+    live loop feeds). Points outside the field (or NaN) are dropped as
+    garbage; an in-field coordinate with a fractional part raises
+    ValueError (round first), the integer arithmetic below can't follow
+    the float means detect_bounce would take of it.
+    Returns (indices into xs/ys, (k, 2) array of bounce coordinates).
+    """
+    p = dict(_BOUNCE_DEFAULTS)
+    unknown = set(params) - set(p)
+    if unknown:
+        raise TypeError(f"unknown bounce parameters: {sorted(unknown)}")
+    p.update(params)
+
+    xs = np.asarray(xs)
+    ys = np.asarray(ys)
+    fw, fh = field_width, field_height
+    empty = (np.empty(0, np.int64), np.empty((0, 2), np.int64))
+
+    # ---- 1. Reject garbage coordinates (they leave no trace in the state) ----
+    # on the values as given: -0.4 is garbage, not 0
+    valid = (xs >= 0) & (xs <= fw) & (ys >= 0) & (ys <= fh)
+    vidx = np.flatnonzero(valid)
+    x = xs[vidx]
+    y = ys[vidx]
+    for v in (x, y):
+        if v.dtype.kind == 'f' and np.any(v != np.floor(v)):
+            raise ValueError("detect_bounces_batch needs integer pixel coordinates")
+    x = x.astype(np.int64)
+    y = y.astype(np.int64)
+    n = len(x)
+    hs = p['history_size']
+    if n < 4 or hs < 4:
+        return empty
+
+    # ---- 3. Moving-average smoothing ----
+    nf = p['noise_filter_size']
+    cx = np.concatenate(([0], np.cumsum(x)))
+    cy = np.concatenate(([0], np.cumsum(y)))
+    sx = x.copy()
+    sy = y.copy()
+    if nf <= n:
+        sx[nf - 1:] = ((cx[nf:] - cx[:-nf]) / nf).astype(np.int64)
+        sy[nf - 1:] = ((cy[nf:] - cy[:-nf]) / nf).astype(np.int64)
+
+    # ---- 4. Step velocities (mag[i] is the step into point i) ----
+    dx = np.zeros(n, np.int64)
+    dy = np.zeros(n, np.int64)
+    dx[1:] = np.diff(sx)
+    dy[1:] = np.diff(sy)
+    # sqrt of the exact integer sum matches math.hypot bit for bit
+    mag = np.sqrt((dx * dx + dy * dy).astype(np.float64))
+
+    # evaluate points 3..n-1 (history of at least 4)
+    i = np.arange(3, n)
+    m0, m1, m2, m3 = mag[i - 3], mag[i - 2], mag[i - 1], mag[i]
+
+    # ---- 5. Static ball ----
+    moving = (m1 + m2 + m3) / 3 >= p['min_movement_threshold']
+
+    # ---- 6. Boundary / corner ----
+    margin = p['boundary_margin']
+    px, py = sx[i], sy[i]
+    near_x = (px <= margin) | (px >= fw - margin)
+    near_y = (py <= margin) | (py >= fh - margin)
+    near_boundary = near_x | near_y
+    in_corner = near_x & near_y
+
+    # ---- 7. Velocity changes over the last 3 or 4 steps ----
+    four = np.minimum(np.minimum(i + 1, hs) - 1, 4) == 4
+    change = np.abs(m3 - m2)
+    prev_change = np.abs(m2 - m1)
+    first_change = np.abs(m1 - m0)
+    max_velocity_change = np.maximum(change, prev_change)
+    max_velocity_change = np.where(four, np.maximum(first_change, max_velocity_change),
+                                   max_velocity_change)
+
+    # ---- 9. Adaptive thresholds (needed before exact acos) ----
+    recent_avg = np.where(four, (m0 + m1 + m2 + m3) / 4, (m1 + m2 + m3) / 3)
+    vt = p['velocity_threshold']
+    v_thresh = np.where(recent_avg < 10, vt * 0.7, np.where(recent_avg > 50, vt * 1.3, vt))
+    v_thresh = np.where(in_corner, v_thresh * 0.4, v_thresh)
+    a = math.radians(p['angle_threshold'])
+    a_corner = a * 0.5
+    a_thresh = np.where(in_corner, a_corner, a)
+
+    # ---- 8. Angle changes: pair (i-2, i-1), plus (i-3, i-2) with 4 steps ----
+    def pair_angle(j1, j2):
+        v1, v2 = mag[j1], mag[j2]
+        ok = (v1 > 0.5) & (v2 > 0.5)
+        dot = (dx[j1] * dx[j2] + dy[j1] * dy[j2]).astype(np.float64)
+        cos_angle = np.clip(dot / (v1 * v2 + 1e-6), -1.0, 1.0)
+        angle = _acos_exact(cos_angle, (a * 0.8, a * 0.6, a_corner * 0.8, a_corner * 0.6))
+        return np.where(ok, angle, 0.0)
+
+    max_angle_change = pair_angle(i - 2, i - 1)
+    max_angle_change = np.where(four, np.maximum(max_angle_change, pair_angle(i - 3, i - 2)),
+                                max_angle_change)
+
+    # ---- 10. Decision (before lock-out) ----
+    candidate = moving & (
+        (max_velocity_change >= v_thresh)
+        | ((max_velocity_change >= v_thresh * 0.6) & (max_angle_change >= a_thresh * 0.8))
+        | (near_boundary & ((max_velocity_change >= v_thresh * 0.5) |
+                            (max_angle_change >= a_thresh * 0.6)))
+        | ((change > v_thresh * 0.4) & (prev_change > v_thresh * 0.3))
+    )
+
+    # ---- Lock-out: sequential, but only over the candidates ----
+    lockout = np.where(near_boundary, p['min_frames_boundary'], p['min_frames_between'])
+    accepted = []
+    last = -1
+    for j in np.flatnonzero(candidate).tolist():
+        point = j + 3
+        if point - last >= lockout[j]:
+            accepted.append(point)
+            last = point
+
+    if not accepted:
+        return empty
+    accepted = np.array(accepted, np.int64)
+    return vidx[accepted], np.stack((sx[accepted], sy[accepted]), axis=1)
+
+
+# process-pool globals for sweep_bounce_params
+_sweep_data = None
+
+
+def _sweep_init(trajectories, field_width, field_height):
+    global _sweep_data
+    _sweep_data = (trajectories, field_width, field_height)
+
+
+def _sweep_one(args):
+    params, score = args
+    trajectories, fw, fh = _sweep_data
+    results = [detect_bounces_batch(xs, ys, fw, fh, **params) for xs, ys in trajectories]
+    return params, score(results) if score is not None else results
+
+
+def sweep_bounce_params(
+    trajectories: List[Tuple[np.ndarray, np.ndarray]],
+    grid: Dict[str, list],
+    field_width: int,
+    field_height: int,
+    score: Optional[Callable] = None,
+    processes: Optional[int] = None
+) -> List[Tuple[Dict, object]]:
+    """
+    Runs detect_bounces_batch for every combination in `grid`
+    (parameter name -> list of values) over all (xs, ys) trajectories,
+    spread over a process pool.
+
+    Returns [(params, result)], where result is the list of per-trajectory
+    (indices, coords), or score(that list) if a (picklable, module-level)
+    score function is given.
+    """
+    names = list(grid)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(grid[k] for k in names))]
+    with ProcessPoolExecutor(
+        max_workers=processes,
+        initializer=_sweep_init,
+        initargs=(trajectories, field_width, field_height)
+    ) as pool:
+        chunksize = max(1, len(combos) // ((processes or 4) * 4))
+        return list(pool.map(_sweep_one, [(c, score) for c in combos], chunksize=chunksize))
+
+
 def reset_bounce_detector(state: Dict) -> None:
     """
     Reset the bounce detector state with enhanced cleanup
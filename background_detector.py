@@ -0,0 +1,232 @@
+# background_detector.py
+"""
+Ball detection against a model of the empty field.
+
+detect_ball keeps the largest orange contour, so anything orange that
+is bigger than the ball wins: a logo on the field, a jersey leaning
+over the table edge. BackgroundBallDetector only looks at orange pixels
+that also differ from the background model, and picks among the blobs
+it finds by shape and by distance from the predicted position:
+
+1. background: the per-pixel median of the first `warmup` samples
+   (taken every `update_every` frames, so a moving ball doesn't stay
+   in it), then a running average with rate `alpha`, updated every
+   `update_every` frames everywhere except around the detected ball.
+   Light changes, shadows and static orange things are absorbed
+   within a few seconds; a ball lying still is not.
+2. candidates: orange mask AND a hue change against the background
+   (a shadow darkens a printed logo, but keeps its hue),
+   tested only inside the box around the orange pixels
+3. connectedComponentsWithStats: area, bounding box and centroid of
+   every blob in one pass, no contour tracing, again only on the box
+   around the remaining pixels
+4. filter: area within [min_area, max_area], and round enough. There is
+   no perimeter without contours, so roundness is the fill ratio
+   (area / box, pi/4 for a disc) and the box aspect ratio (kept loose,
+   a fast ball is blurred into a stadium shape)
+5. pick: locked onto the ball, the blob nearest the predicted position
+   within `gate` px, otherwise the one closest in area to the ball
+   found so far (anything bigger is more likely a logo or a jersey)
+
+Same contract as detect_ball / BallTracker.detect: frames in capture
+order, (cx, cy, x, y, w, h) in frame coordinates or None.
+"""
+import cv2
+import numpy as np
+
+from kicker_vision import BallTracker, orange_mask
+
+# "contour": detect_ball / BallTracker, "background": BackgroundBallDetector
+DETECTORS = ("contour", "background")
+
+
+class BackgroundBallDetector(BallTracker):
+    def __init__(self, roi=None, warmup=15, alpha=0.02, update_every=4, hue_threshold=8,
+                 grey_saturation=60,
+                 min_area=None, max_area=1500, min_fill=0.5, min_aspect=0.35,
+                 gate=48, max_misses=5, colors=None):
+        """
+        roi:   search area (x, y, w, h), None = whole frame
+        min_area: None = the minimum of `colors` (colour profile)
+        colors: the session's ColorThresholds (None: the defaults)
+        gate:  largest distance (px) from the predicted position while
+               locked; None = no prediction, always pick by size
+        hue_threshold:   hue change (of 180) that counts as not background
+        grey_saturation: background pixels below this saturation have
+                         no reliable hue; anything orange there counts
+        """
+        self.warmup = warmup
+        self.alpha = alpha
+        self.update_every = update_every
+        self.hue_threshold = hue_threshold
+        self.grey_saturation = grey_saturation
+        self.min_area = min_area
+        self.max_area = max_area
+        self.min_fill = min_fill
+        self.min_aspect = min_aspect
+        self.gate = gate
+        self.ball_area = None   # running average of the detected ball's area
+        self._drop_background()
+        super().__init__(roi=roi, window=2 * (gate or 0), max_misses=max_misses, colors=colors)
+
+        # counters
+        self.frames = 0
+        self.blobs = 0          # connected components looked at
+        self.rejected = 0       # ... failing size / shape / gate
+
+    def _drop_background(self):
+        self._samples = []
+        self._bg = None         # float32 running average
+        self._bg_hue = None     # its hue, and 255 where it has none
+        self._bg_grey = None
+        self._keep = None       # update mask: 0 around the ball
+        self._shape = None
+
+    def set_roi(self, roi):
+        # a moved ROI is a different region: build the model again
+        super().set_roi(roi)
+        self._drop_background()
+
+    @property
+    def ready(self):
+        """
+        True once the warm-up is over; before that only colour is used.
+        """
+        return self._bg is not None
+
+    # ------------------------------------------------------------
+
+    def detect(self, frame, debug=False):
+        x0, y0, x1, y1 = self._roi_bounds(frame)
+        region = frame[y0:y1, x0:x1]
+        if region.size == 0:
+            return None
+        if region.shape != self._shape:
+            self._drop_background()
+            self._shape = region.shape
+        self.frames += 1
+
+        mask = orange_mask(region, self.colors)
+        # everything after the colour mask only needs the box around
+        # the orange pixels (usually just the ball)
+        bx, by, bw, bh = cv2.boundingRect(mask)
+        result = None
+        if bw:
+            box = (slice(by, by + bh), slice(bx, bx + bw))
+            mask = mask[box]
+            if self._bg is not None:
+                cv2.bitwise_and(mask, self._changed(region[box], box), dst=mask)
+            result = self._pick(mask, x0 + bx, y0 + by)
+
+        if result is None:
+            self._missed()
+        else:
+            self._found(result[0], result[1])
+
+        if self.frames % self.update_every == 0:
+            self._update_background(region, result, x0, y0)
+        return result
+
+    def _changed(self, pixels, box):
+        """
+        0/255 mask of the pixels in `box` whose hue differs from the
+        background's by more than hue_threshold (OpenCV units, 180 per
+        turn), or whose background has no hue to speak of (grey border,
+        white lines). A shadow or a light change darkens all channels
+        alike and keeps the hue, so it doesn't count.
+        """
+        hue = cv2.cvtColor(pixels, cv2.COLOR_RGB2HSV)[:, :, 0]
+        diff = cv2.absdiff(hue, self._bg_hue[box])
+        # hue is circular
+        cv2.min(diff, cv2.subtract(180, diff), dst=diff)
+        _, changed = cv2.threshold(diff, self.hue_threshold, 255, cv2.THRESH_BINARY)
+        return cv2.bitwise_or(changed, self._bg_grey[box])
+
+    def _pick(self, mask, x0, y0):
+        # labelling writes every pixel it is given: only hand it the box
+        # around what survived the background test
+        bx, by, bw, bh = cv2.boundingRect(mask)
+        if bw == 0:
+            return None
+        x0 += bx
+        y0 += by
+        n, _, stats, centroids = cv2.connectedComponentsWithStatsWithAlgorithm(
+            mask[by:by + bh, bx:bx + bw], 8, cv2.CV_16U, cv2.CCL_DEFAULT)
+        if n < 2:
+            return None
+        # row 0 is the background label
+        stats = stats[1:]
+        centroids = centroids[1:]
+        self.blobs += n - 1
+
+        min_area = self.min_area if self.min_area is not None else self.colors.min_ball_area
+        area = stats[:, cv2.CC_STAT_AREA]
+        w = stats[:, cv2.CC_STAT_WIDTH]
+        h = stats[:, cv2.CC_STAT_HEIGHT]
+        ok = ((area >= min_area) & (area <= self.max_area)
+              & (area >= self.min_fill * w * h)
+              & (np.minimum(w, h) >= self.min_aspect * np.maximum(w, h)))
+
+        predicted = self.predicted() if self.gate is not None else None
+        if predicted is not None:
+            dx = centroids[:, 0] + x0 - predicted[0]
+            dy = centroids[:, 1] + y0 - predicted[1]
+            d2 = dx * dx + dy * dy
+            ok &= d2 <= self.gate * self.gate
+            candidates = np.flatnonzero(ok)
+            best = candidates[np.argmin(d2[candidates])] if len(candidates) else None
+        else:
+            # searching: the blob closest in size to the ball seen so far
+            candidates = np.flatnonzero(ok)
+            size = self.ball_area or 2 * min_area
+            best = (candidates[np.argmin(np.abs(area[candidates] - size))]
+                    if len(candidates) else None)
+        self.rejected += n - 1 - len(candidates)
+        if best is None:
+            return None
+        # slow average: one odd frame (blur, partly hidden) barely moves it
+        a = float(area[best])
+        self.ball_area = a if self.ball_area is None else self.ball_area + 0.05 * (a - self.ball_area)
+
+        x, y = int(stats[best, cv2.CC_STAT_LEFT]) + x0, int(stats[best, cv2.CC_STAT_TOP]) + y0
+        cx = int(round(centroids[best, 0])) + x0
+        cy = int(round(centroids[best, 1])) + y0
+        return (cx, cy, x, y, int(w[best]), int(h[best]))
+
+    def _update_background(self, region, result, x0, y0):
+        if self._bg is None:
+            self._samples.append(region.copy())
+            if len(self._samples) >= self.warmup:
+                # one-off cost at start-up (and after a ROI move)
+                self._bg = np.median(np.stack(self._samples), axis=0).astype(np.float32)
+                self._keep = np.full(region.shape[:2], 255, np.uint8)
+                self._samples = []
+                self._background_hue()
+            return
+
+        keep = self._keep
+        if result is not None:
+            # the ball never becomes background, even lying still
+            _, _, x, y, w, h = result
+            bx0, by0 = max(0, x - x0 - w // 2), max(0, y - y0 - h // 2)
+            bx1, by1 = x - x0 + w + w // 2, y - y0 + h + h // 2
+            keep[by0:by1, bx0:bx1] = 0
+            cv2.accumulateWeighted(region, self._bg, self.alpha, mask=keep)
+            keep[by0:by1, bx0:bx1] = 255
+        else:
+            cv2.accumulateWeighted(region, self._bg, self.alpha, mask=keep)
+        self._background_hue()
+
+    def _background_hue(self):
+        hsv = cv2.cvtColor(self._bg.astype(np.uint8), cv2.COLOR_RGB2HSV)
+        self._bg_hue = np.ascontiguousarray(hsv[:, :, 0])
+        _, self._bg_grey = cv2.threshold(hsv[:, :, 1], self.grey_saturation, 255,
+                                         cv2.THRESH_BINARY_INV)
+
+    def stats(self):
+        return {
+            "ready": self.ready,
+            "frames": self.frames,
+            "blobs": self.blobs,
+            "rejected": self.rejected,
+        }
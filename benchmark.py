@@ -0,0 +1,1763 @@
+# benchmark.py
+"""
+Offline benchmarks for the kicker hot path.
+
+    python benchmark.py pipeline [--source synthetic|recording.npy|video.mp4]
+    python benchmark.py color [--bits 8] [--frames 200]
+    python benchmark.py bounce [--recording incident.npy]
+    python benchmark.py sweep [--processes 4]
+    python benchmark.py locate
+    python benchmark.py zones
+    python benchmark.py ble [--updates 2000]
+    python benchmark.py schedule [--seconds 3]
+    python benchmark.py codec
+    python benchmark.py buffer [--events 200000]
+    python benchmark.py payload [--recording incident.npy]
+    python benchmark.py extended [--position-rate 30]
+    python benchmark.py receiver [--loss 0.1]
+    python benchmark.py metrics [--frames 100000]
+    python benchmark.py calibration
+    python benchmark.py roi [--checks 60]
+    python benchmark.py instruments
+    python benchmark.py debug [--frames 1200]
+    python benchmark.py tables [--tables 3] [--seconds 5]
+    python benchmark.py detectors [--source recording.npy]
+    python benchmark.py colors [--frames 900]
+"""
+import argparse
+import io
+import json
+import logging
+import math
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import urllib.request
+from collections import deque
+from functools import partial
+
+import cv2
+import numpy as np
+
+import kicker_vision
+from kicker_vision import find_playfield_corners
+from Bounce_detection import (detect_bounce, BounceDetector, detect_bounces_batch,
+                              sweep_bounce_params)
+from Quadrant_identifier import classify_region
+from bla import BLAAdvertiser, FakeHCI, negotiate_mode
+from bla_buffer import BLAData, BLAEventBuffer, Bounce
+from bla_receiver import BLAReceiver
+from color_profile import (ColorProfile, ColorRetuner, calibrate, load_profile, save_profile,
+                           camera_key)
+from calibration import Calibration, load_calibration, _distort, _loaded as _loaded_calibrations
+from bla_codec import (BLAEncoder, ENCODERS, DECODERS, capacity, decode, decode_v2,
+                       adv_header, payload_room, split_adv_data, NAME)
+from background_detector import BackgroundBallDetector
+from debug_view import DebugView
+from field_model import FieldModel
+from frame_source import (open_source, rally_script, SOURCES, RecordingSource, SyntheticSource,
+                          FRAME_SIZE, FPS)
+from goal_scored import GoalEngine
+from instrumentation import Histogram, Instruments, StatsServer, EventLog
+from spped_compute import MetricsEngine, quantize
+from table_session import TableSession, Supervisor, assign_cpus
+from roi_monitor import ROIMonitor
+from tracker import KalmanTracker
+
+# 31 bytes legacy advertising - len(BLAAdvertiser.header)
+MAX_PAYLOAD = 18
+
+
+def _timed(fn, frames, repeat=1):
+    """
+    Calls fn(frame) for every frame and returns the per-call times in seconds.
+    """
+    times = np.empty(len(frames) * repeat)
+    i = 0
+    for _ in range(repeat):
+        for frame in frames:
+            t0 = time.perf_counter()
+            fn(frame)
+            times[i] = time.perf_counter() - t0
+            i += 1
+    return times
+
+
+def _fmt_us(times):
+    return (f"mean {times.mean() * 1e6:8.1f} us | "
+            f"p50 {np.percentile(times, 50) * 1e6:8.1f} us | "
+            f"p99 {np.percentile(times, 99) * 1e6:8.1f} us")
+
+
+# ------------------------------------------------------------
+# pipeline: every hot-path stage over a recording
+# ------------------------------------------------------------
+
+PIPELINE_STAGES = ("capture", "detect", "bounce", "goal", "payload")
+
+
+def _run_stages(source, clock, limit):
+    """
+    Runs the main.py stages serially over `source`, calling
+    clock(stage, start) after each one. Returns the frame count.
+    """
+    frame = source.capture_array()
+    roi = kicker_vision.find_playfield_roi(frame)
+    if roi is None:
+        roi = (0, 0, frame.shape[1], frame.shape[0])
+    fx, fy, fw, fh = roi
+
+    bounce_detector = BounceDetector(fw, fh)
+    goal_engine = GoalEngine(fw, fh)
+    field_model = FieldModel(fw, fh)
+    prev_pos = None
+    BLAData.reset()
+    frames = 0
+
+    while frames < limit:
+        t = clock(None, None)
+        try:
+            frame = source.capture_array()
+        except EOFError:
+            break
+        t = clock("capture", t)
+
+        result = kicker_vision.detect_ball(frame, roi=roi)
+        t = clock("detect", t)
+        frames += 1
+        if result is None:
+            continue
+
+        field_x, field_y = result[0] - fx, result[1] - fy
+        bounce = bounce_detector.update(field_x, field_y)
+        t = clock("bounce", t)
+
+        goal_engine.check((field_x, field_y), prev_pos)
+        prev_pos = (field_x, field_y)
+        t = clock("goal", t)
+
+        if bounce is not None:
+            BLAData.add_bounce(Bounce(0, 0, frames, field_model.zone(*bounce)))
+        BLAData.consume_for_packet(MAX_PAYLOAD)
+        clock("payload", t)
+
+    return frames
+
+
+def bench_pipeline(args):
+    # ---- pass 1: latency ----
+    times = {stage: [] for stage in PIPELINE_STAGES}
+    perf = time.perf_counter
+
+    def clock(stage, start):
+        now = perf()
+        if stage is not None:
+            times[stage].append(now - start)
+        return now
+
+    source = open_source(args.source, loop=args.loop)
+    source.start()
+    t0 = perf()
+    frames = _run_stages(source, clock, args.frames)
+    elapsed = perf() - t0
+    source.stop()
+
+    print(f"{frames} frames in {elapsed:.2f} s -> {frames / elapsed:.1f} frames/s")
+    for stage in PIPELINE_STAGES:
+        if not times[stage]:
+            continue
+        t = np.array(times[stage]) * 1e6
+        print(f"{stage:8s} n={len(t):6d} | p50 {np.percentile(t, 50):8.1f} us | "
+              f"p90 {np.percentile(t, 90):8.1f} us | p99 {np.percentile(t, 99):8.1f} us | "
+              f"max {t.max():8.1f} us")
+
+    # ---- pass 2: allocations (tracemalloc slows everything down) ----
+    # CPython has no cheap per-call allocation counter, so each stage
+    # reports the peak of memory it allocated on top of what was live
+    # before it ran; the whole run reports how many blocks stayed alive.
+    peaks = {stage: [] for stage in PIPELINE_STAGES}
+    live = {"mem": 0}
+
+    def alloc_clock(stage, start):
+        if stage is not None:
+            peaks[stage].append(tracemalloc.get_traced_memory()[1] - live["mem"])
+        tracemalloc.reset_peak()
+        live["mem"] = tracemalloc.get_traced_memory()[0]
+        return None
+
+    source = open_source(args.source, loop=args.loop)
+    source.start()
+    tracemalloc.start()
+    blocks_before = sys.getallocatedblocks()
+    n = _run_stages(source, alloc_clock, min(args.frames, args.alloc_frames))
+    blocks_after = sys.getallocatedblocks()
+    tracemalloc.stop()
+    source.stop()
+
+    print(f"allocations over {n} frames (net live blocks {blocks_after - blocks_before:+d})")
+    for stage in PIPELINE_STAGES:
+        if peaks[stage]:
+            p = np.array(peaks[stage])
+            print(f"{stage:8s} | peak/call p50 {np.percentile(p, 50):10.0f} B | "
+                  f"max {p.max():10.0f} B | calls allocating {np.count_nonzero(p)}")
+    return 0
+
+
+# ------------------------------------------------------------
+# color: HSV inRange vs precomputed LUT
+# ------------------------------------------------------------
+
+def _all_colours_frame():
+    # every 8-bit RGB colour exactly once (4096 x 4096)
+    idx = np.arange(1 << 24, dtype=np.uint32)
+    frame = np.empty((1 << 24, 3), np.uint8)
+    frame[:, 0] = idx & 0xFF
+    frame[:, 1] = (idx >> 8) & 0xFF
+    frame[:, 2] = idx >> 16
+    return frame.reshape(4096, 4096, 3)
+
+
+def _field_frames(count, rng):
+    # green field with sensor noise and an orange ball, i.e. what the
+    # camera actually sees (few distinct colours -> LUT stays in cache)
+    frames = []
+    for _ in range(count):
+        frame = np.empty((216, 384, 3), np.uint8)
+        frame[:] = (40, 140, 40)
+        frame += rng.integers(0, 12, frame.shape, dtype=np.uint8)
+        cx, cy = int(rng.integers(20, 364)), int(rng.integers(20, 196))
+        cv2.circle(frame, (cx, cy), 7, (255, 120, 0), -1)
+        frames.append(frame)
+    return frames
+
+
+def bench_color(args):
+    rng = np.random.default_rng(0)
+    frame_sets = {
+        "field": _field_frames(args.frames, rng),
+        # worst case for the LUT: every lookup misses the cache
+        "noise": [rng.integers(0, 256, (216, 384, 3), dtype=np.uint8)
+                  for _ in range(args.frames)],
+    }
+
+    t0 = time.perf_counter()
+    colors = {backend: kicker_vision.ColorThresholds(backend=backend, bits=args.bits)
+              for backend in kicker_vision.COLOR_BACKENDS}
+    print(f"LUT ready ({args.bits} bits) in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+
+    # ---- equivalence over the whole colour space ----
+    everything = _all_colours_frame()
+    failed = False
+    for name, mask_fn in (("ball", kicker_vision.orange_mask),
+                          ("field", kicker_vision.green_mask)):
+        lut_mask = mask_fn(everything, colors["lut"])
+        hsv_mask = mask_fn(everything, colors["hsv"])
+        mismatched = int(np.count_nonzero(lut_mask != hsv_mask))
+        print(f"{name:5s} mask: {mismatched} of {lut_mask.size} colours differ "
+              f"({100.0 * mismatched / lut_mask.size:.3f} %)")
+        if args.bits == 8 and mismatched:
+            failed = True
+
+    # ---- per-frame cost ----
+    for frames_name, frames in frame_sets.items():
+        for backend in kicker_vision.COLOR_BACKENDS:
+            for name, mask_fn in (("ball", kicker_vision.orange_mask),
+                                  ("field", kicker_vision.green_mask)):
+                times = _timed(partial(mask_fn, colors=colors[backend]), frames, repeat=args.repeat)
+                print(f"{frames_name:5s} frames | {backend:3s} {name:5s} | {_fmt_us(times)}")
+
+    return 1 if failed else 0
+
+
+# ------------------------------------------------------------
+# bounce: detect_bounce vs BounceDetector
+# ------------------------------------------------------------
+
+BOUNCE_FIELD = (336, 192)
+
+
+def _bounce_trajectories(args):
+    """
+    Field-coordinate (x, y) integer trajectories: the detections stored
+    in a recording, or jittered synthetic rallies with dropouts/garbage.
+    """
+    if args.recording:
+        meta = RecordingSource(args.recording).meta
+        meta = meta[meta["found"] == 1]
+        x0, y0 = int(meta["cx"].min()), int(meta["cy"].min())
+        return [list(zip((meta["cx"] - x0).tolist(), (meta["cy"] - y0).tolist()))]
+
+    rng = np.random.default_rng(1)
+    w, h = BOUNCE_FIELD
+    trajectories = []
+    for i in range(args.rallies):
+        speed = float(rng.uniform(0.5, 30))
+        angle = float(rng.uniform(0, 2 * np.pi))
+        points = rally_script((0, 0, w, h), speed=speed, angle=angle, frames=args.length)
+        traj = []
+        for x, y in points:
+            x += rng.normal(0, 1.5)
+            y += rng.normal(0, 1.5)
+            r = rng.random()
+            if r < 0.01:
+                x, y = -5, y                    # garbage coordinate
+            elif r < 0.03:
+                x, y = w // 2, h // 2           # spurious blob
+            traj.append((int(x), int(y)))
+        # a resting ball at the end
+        traj += [traj[-1]] * 30
+        trajectories.append(traj)
+    return trajectories
+
+
+def bench_bounce(args):
+    trajectories = _bounce_trajectories(args)
+    w, h = BOUNCE_FIELD
+
+    # ---- per-call cost ----
+    perf = time.perf_counter
+    flat = [p for traj in trajectories for p in traj]
+
+    state = {}
+    t0 = perf()
+    for x, y in flat:
+        detect_bounce(x, y, w, h, state)
+    t_func = (perf() - t0) / len(flat)
+
+    detector = BounceDetector(w, h)
+    update = detector.update
+    t0 = perf()
+    for x, y in flat:
+        update(x, y)
+    t_class = (perf() - t0) / len(flat)
+
+    budget = 1.0 / 120
+    print(f"detect_bounce  {t_func * 1e6:7.2f} us/call ({100 * t_func / budget:.2f} % of a 120 Hz frame)")
+    print(f"BounceDetector {t_class * 1e6:7.2f} us/call ({100 * t_class / budget:.2f} % of a 120 Hz frame)"
+          f" -> {t_func / t_class:.1f}x faster")
+
+    arrays = [tuple(np.array(traj).T) for traj in trajectories]
+    t0 = perf()
+    for xs, ys in arrays:
+        detect_bounces_batch(xs, ys, w, h)
+    t_batch = (perf() - t0) / len(flat)
+    print(f"batch          {t_batch * 1e6:7.2f} us/point -> {t_func / t_batch:.1f}x faster")
+    return 0
+
+
+def _bounce_count(results):
+    # sweep score: total bounces over all trajectories
+    return sum(len(idx) for idx, _ in results)
+
+
+def bench_sweep(args):
+    trajectories = [tuple(np.array(traj).T) for traj in _bounce_trajectories(args)]
+    w, h = BOUNCE_FIELD
+    grid = {
+        'velocity_threshold': [5.0, 10.0, 15.0, 20.0, 25.0],
+        'angle_threshold': [20.0, 30.0, 45.0, 60.0],
+        'boundary_margin': [10, 25, 40],
+        'min_frames_between': [4, 6, 8],
+    }
+    t0 = time.perf_counter()
+    results = sweep_bounce_params(trajectories, grid, w, h, score=_bounce_count,
+                                  processes=args.processes)
+    elapsed = time.perf_counter() - t0
+    points = sum(len(xs) for xs, _ in trajectories)
+    print(f"{len(results)} combinations x {len(trajectories)} rallies ({points} points) "
+          f"in {elapsed:.2f} s -> {len(results) / elapsed:.1f} combinations/s")
+    for params, count in sorted(results, key=lambda r: r[1])[:3]:
+        print(f"  {count:6d} bounces  {params}")
+    return 0
+
+
+# ------------------------------------------------------------
+# locate: bounce position accuracy, moving average vs Kalman
+# ------------------------------------------------------------
+
+def _match_errors(found, truth, max_dist=40.0):
+    # distance from each reported bounce to the nearest true one
+    errors = []
+    for bx, by in found:
+        d = min((np.hypot(bx - tx, by - ty) for _, tx, ty in truth), default=None)
+        if d is not None and d <= max_dist:
+            errors.append(d)
+    return errors
+
+
+def bench_locate(args):
+    rng = np.random.default_rng(2)
+    w, h = BOUNCE_FIELD
+    dt = 1.0 / 120
+    plain_errors, kalman_errors = [], []
+    plain_found = kalman_found = total = 0
+
+    for _ in range(args.rallies):
+        truth = []
+        points = rally_script((0, 0, w, h), speed=float(rng.uniform(3, 20)),
+                              angle=float(rng.uniform(0, 2 * np.pi)),
+                              frames=args.length, bounces=truth)
+        total += len(truth)
+
+        plain = BounceDetector(w, h)
+        kalman = BounceDetector(w, h, noise_filter_size=1)
+        track = KalmanTracker()
+        found_plain, found_kalman = [], []
+        for i, (x, y) in enumerate(points):
+            mx = int(round(x + rng.normal(0, 0.7)))
+            my = int(round(y + rng.normal(0, 0.7)))
+            # the odd missed detection
+            measurement = None if rng.random() < 0.03 else (mx, my)
+
+            if measurement is not None:
+                b = plain.update(mx, my)
+                if b is not None:
+                    found_plain.append(b)
+
+            position = track.step(measurement, i * dt)
+            if position is not None:
+                b = kalman.update(int(round(position[0])), int(round(position[1])))
+                if b is not None:
+                    refined = track.locate_bounce()
+                    found_kalman.append(refined[1:] if refined is not None else b)
+
+        plain_found += len(found_plain)
+        kalman_found += len(found_kalman)
+        plain_errors += _match_errors(found_plain, truth)
+        kalman_errors += _match_errors(found_kalman, truth)
+
+    print(f"{total} true bounces")
+    for name, found, errors in (("moving average", plain_found, plain_errors),
+                                ("kalman + segments", kalman_found, kalman_errors)):
+        e = np.array(errors)
+        print(f"{name:18s} reported {found:5d}, matched {len(e):5d} | "
+              f"error mean {e.mean():5.2f} px, p90 {np.percentile(e, 90):5.2f} px")
+    return 0
+
+
+# ------------------------------------------------------------
+# zones: precomputed zone index vs classify_region
+# ------------------------------------------------------------
+
+def bench_zones(args):
+    mismatches = 0
+    for fw in range(16, 400):
+        model = FieldModel(fw, 8)
+        expected = [classify_region(x, fw) - 1 for x in range(fw)]
+        mismatches += int(np.count_nonzero(model.zones(np.arange(fw), np.zeros(fw)) != expected))
+        mismatches += sum(model.zone(x, 3) != e for x, e in enumerate(expected))
+    print(f"quadrant strips vs classify_region, widths 16..399: {mismatches} mismatches")
+
+    w, h = BOUNCE_FIELD
+    model = FieldModel(w, h)
+    rng = np.random.default_rng(3)
+    xs = rng.uniform(0, w, args.points)
+    ys = rng.uniform(0, h, args.points)
+    points = list(zip(xs.tolist(), ys.tolist()))
+
+    t0 = time.perf_counter()
+    for x, _ in points:
+        classify_region(x, w)
+    t_func = (time.perf_counter() - t0) / len(points)
+
+    t0 = time.perf_counter()
+    for x, y in points:
+        model.zone(x, y)
+    t_zone = (time.perf_counter() - t0) / len(points)
+
+    t0 = time.perf_counter()
+    model.zones(xs, ys)
+    t_batch = (time.perf_counter() - t0) / len(points)
+
+    t0 = time.perf_counter()
+    model.set_roi(w, h)
+    t_build = time.perf_counter() - t0
+
+    print(f"layers {model.layers}, rebuilt in {t_build * 1e3:.2f} ms")
+    print(f"classify_region {t_func * 1e6:7.3f} us/point (quadrant only)")
+    print(f"zone()          {t_zone * 1e6:7.3f} us/point (any layer)")
+    print(f"zones() batch   {t_batch * 1e6:7.3f} us/point")
+    return 1 if mismatches else 0
+
+
+# ------------------------------------------------------------
+# ble: advertising-data updates over a persistent HCI socket
+# ------------------------------------------------------------
+
+def bench_ble(args):
+    controller = FakeHCI()
+    adv = BLAAdvertiser(backend=controller.backend())
+    adv.backend.open()
+
+    packets = [adv.header + i.to_bytes(2, 'big') for i in range(args.updates)]
+    t0 = time.perf_counter()
+    for packet in packets:
+        # every packet twice: the repeat must not reach the controller
+        adv._send_packet(packet)
+        adv._send_packet(packet)
+    elapsed = time.perf_counter() - t0
+
+    written = sum(1 for op, _ in controller.commands if op == 0x2008)
+    ok = written == args.updates and controller.adv_data == packets[-1]
+
+    controller.fail_next(3)
+    for i in range(3):
+        adv._send_packet(adv.header + b'\xff' + bytes([i]))
+    ok = ok and adv.failures == 3 and adv._current == packets[-1]
+    adv.backend.close()
+
+    stats = adv.stats()
+    print(f"fake HCI: {stats['updates']} updates, {stats['unchanged']} unchanged skipped, "
+          f"{stats['failures']} failures (3 injected), {written} writes on the socket")
+    print(f"  {elapsed / (2 * args.updates) * 1e6:.1f} us per call | update latency "
+          f"p50 {stats['latency_p50_ms']:.3f} ms, p99 {stats['latency_p99_ms']:.3f} ms")
+
+    # what the old path paid before even reaching hcitool: two process spawns
+    spawns = 50
+    t0 = time.perf_counter()
+    for _ in range(spawns):
+        subprocess.run(['true'], check=False)
+    per_spawn = (time.perf_counter() - t0) / spawns
+    print(f"process spawn: {per_spawn * 1e3:.2f} ms each -> {2 * per_spawn * 1e3:.2f} ms "
+          f"per hcitool advertisement (data + enable)")
+    if not ok:
+        print("MISMATCH: controller state differs from what was sent")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# schedule: event-driven payload updates vs fixed polling
+# ------------------------------------------------------------
+
+def _schedule_run(adv, bounce_times, poll_interval=None):
+    """
+    Feeds bounces at the given offsets (seconds) into BLAData and returns
+    (bounce-to-air latencies, packets built). With `poll_interval` the old
+    fixed-sleep loop drives the advertiser instead of the scheduler.
+    """
+    BLAData.reset()
+    built = [0]
+    build = adv._build_packet
+
+    def counting_build():
+        built[0] += 1
+        return build()
+    adv._build_packet = counting_build
+
+    pending = []
+    latencies = []
+    lock = threading.Lock()
+    running = [True]
+
+    def poll():
+        while running[0]:
+            adv._send_packet(adv._build_packet())
+            now = time.perf_counter()
+            with lock:
+                latencies.extend(now - t for t in pending)
+                pending.clear()
+            time.sleep(poll_interval)
+
+    if poll_interval is None:
+        adv.start()
+    else:
+        adv.backend.open()
+        poller = threading.Thread(target=poll, daemon=True)
+        poller.start()
+
+    t0 = time.perf_counter()
+    for i, offset in enumerate(bounce_times):
+        delay = t0 + offset - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        BLAData.add_bounce(Bounce(i, i, i, i))
+        if poll_interval is None:
+            adv.notify("bounce")
+        else:
+            with lock:
+                pending.append(time.perf_counter())
+    time.sleep(0.1)
+
+    if poll_interval is None:
+        adv.stop()
+        latencies = list(adv.scheduler.latencies.get("bounce", []))
+    else:
+        running[0] = False
+        poller.join()
+        adv.backend.close()
+    return latencies, built[0]
+
+
+def bench_schedule(args):
+    rng = np.random.default_rng(4)
+    # rallies: bursts of bounces a few frames apart, then quiet
+    times, t = [], 0.0
+    while t < args.seconds:
+        for _ in range(int(rng.integers(1, 6))):
+            t += float(rng.uniform(0.02, 0.15))
+            times.append(t)
+        t += float(rng.uniform(0.3, 1.0))
+
+    print(f"{len(times)} bounces over {t:.1f} s")
+    for name, kwargs, poll in (
+            ("fixed 5 ms poll", dict(), 0.005),
+            ("fixed 50 ms poll", dict(), 0.05),
+            ("event-driven", dict(interval=1.0, min_interval=0.02), None)):
+        controller = FakeHCI()
+        adv = BLAAdvertiser(backend=controller.backend(), **kwargs)
+        latencies, built = _schedule_run(adv, times, poll)
+        writes = sum(1 for op, _ in controller.commands if op == 0x2008)
+        lat = np.array(latencies) * 1e3
+        print(f"{name:17s} built {built:5d} packets, {writes:4d} written | bounce->air "
+              f"p50 {np.percentile(lat, 50):6.2f} ms, max {lat.max():6.2f} ms")
+    return 0
+
+
+# ------------------------------------------------------------
+# codec: BLA payload encode/decode
+# ------------------------------------------------------------
+
+def bench_codec(args):
+    # round trips and the bit layout are checked in tests/test_bla_codec.py
+    bounces = [Bounce(i * 37, i * 11, i, i) for i in range(capacity(MAX_PAYLOAD))]
+    encoder = BLAEncoder(MAX_PAYLOAD)
+    data = bytes(encoder.encode(1, 100, 50, bounces))
+    encoder_v2 = ENCODERS[2](MAX_PAYLOAD)
+    data_v2 = bytes(encoder_v2.encode(1, 100, 50, bounces))
+    for name, fn in (
+            ("BLAEncoder", lambda: encoder.encode(1, 100, 50, bounces)),
+            ("decode", lambda: decode(data)),
+            ("BLAEncoderV2", lambda: encoder_v2.encode(1, 100, 50, bounces)),
+            ("decode_v2", lambda: decode_v2(data_v2))):
+        t0 = time.perf_counter()
+        for _ in range(args.repeat):
+            fn()
+        per_call = (time.perf_counter() - t0) / args.repeat
+        print(f"{name:16s} {per_call * 1e6:6.2f} us/packet ({len(bounces)} bounces) "
+              f"-> {1 / per_call / 1e3:7.1f} k packets/s")
+    return 0
+
+
+# ------------------------------------------------------------
+# buffer: lock-free SPSC event buffer
+# ------------------------------------------------------------
+
+def bench_buffer(args):
+    ok = True
+
+    # producer and consumer threads hammering one small ring
+    buf = BLAEventBuffer(capacity=32)
+    taken = []
+    done = threading.Event()
+
+    def consume():
+        while not done.is_set() or buf.pending_bounces():
+            taken.extend(buf.take_bounces(4))
+
+    consumer = threading.Thread(target=consume)
+    consumer.start()
+    for i in range(args.events):
+        buf.add_bounce(i)
+        if i % 16 == 0:
+            time.sleep(0)   # let the consumer interleave
+    done.set()
+    consumer.join()
+
+    in_order = all(a < b for a, b in zip(taken, taken[1:]))
+    accounted = len(taken) + buf.dropped == args.events
+    ok = ok and in_order and accounted
+    print(f"{args.events} bounces through a 32-slot ring: {len(taken)} taken, "
+          f"{buf.dropped} dropped | in order: {in_order}, all accounted for: {accounted}")
+
+    # goal stays for goal_cycles packets; buffers don't share state
+    a, b = BLAEventBuffer(), BLAEventBuffer()
+    a.push_goal(2)
+    a.set_initial_coord(100, 50)
+    goals = [decode(a.consume_for_packet(MAX_PAYLOAD))[0] for _ in range(7)]
+    other = decode(b.consume_for_packet(MAX_PAYLOAD))
+    ok = ok and goals == [2] * 5 + [0] * 2 and other[:3] == (0, 0, 0)
+    print(f"goal bits over 7 packets: {goals}; second buffer: {other[:3]}")
+
+    # producer cost: old lock + deque vs ring
+    lock = threading.Lock()
+    queue = deque()
+    buf = BLAEventBuffer(capacity=64)
+    bounce = Bounce(1, 2, 3, 4)
+    for name, add in (("lock + deque", None), ("SPSC ring", buf.add_bounce)):
+        t0 = time.perf_counter()
+        if add is None:
+            for _ in range(args.events):
+                with lock:
+                    queue.append(bounce)
+        else:
+            for _ in range(args.events):
+                add(bounce)
+        print(f"{name:13s} add_bounce {(time.perf_counter() - t0) / args.events * 1e6:.3f} us")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# payload: v1 vs v2 bounces per packet and queue drain
+# ------------------------------------------------------------
+
+def _rally_bounces(trajectory, field_model):
+    """
+    (frame, Bounce) events the way main.py produces them.
+    """
+    w, h = BOUNCE_FIELD
+    track = KalmanTracker()
+    detector = BounceDetector(w, h, noise_filter_size=1)
+    metrics = MetricsEngine(w, h)
+    events = []
+    for i, (x, y) in enumerate(trajectory):
+        position = track.step((x, y), i / 120)
+        b = detector.update(int(round(position[0])), int(round(position[1])))
+        if b is None:
+            continue
+        angle, speed = metrics.direction_bits(track.velocity)
+        events.append((i, Bounce(angle, speed, i, field_model.zone(*b))))
+    return events
+
+
+def bench_payload(args):
+    w, h = BOUNCE_FIELD
+    field_model = FieldModel(w, h)
+    rallies = [_rally_bounces(t, field_model) for t in _bounce_trajectories(args)]
+    total = sum(len(r) for r in rallies)
+    frames_per_packet = max(1, int(round(args.packet_interval * 120)))
+    print(f"{total} bounces in {len(rallies)} rallies, one packet every "
+          f"{args.packet_interval * 1e3:.0f} ms")
+
+    ok = True
+    for name, version, header in (
+            ("v1 (full name)", 1, adv_header(1)),
+            ("v2 (full name)", 2, adv_header(2, NAME)),
+            ("v2 (name 'kk')", 2, adv_header(2, b"kk")),
+            ("v2 (no name)", 2, adv_header(2, None))):
+        room = payload_room(header, version, sequenced=True)
+        per_packet, full, waits = [], [], []
+        max_depth = 0
+        for events in rallies:
+            buf = BLAEventBuffer(capacity=256)
+            queued = []
+            i = 0
+            last = events[-1][0] if events else 0
+            frame = 0
+            while i < len(events) or buf.pending_bounces():
+                while i < len(events) and events[i][0] <= frame:
+                    buf.add_bounce(events[i][1])
+                    queued.append(events[i][0])
+                    i += 1
+                max_depth = max(max_depth, buf.pending_bounces())
+                if frame % frames_per_packet == 0:
+                    before = buf.pending_bounces()
+                    payload = buf.consume_for_packet(room, version)
+                    sent = before - buf.pending_bounces()
+                    if sent:
+                        per_packet.append(sent)
+                        if buf.pending_bounces():
+                            # more were waiting: the packet was full
+                            full.append(sent)
+                        waits += [frame - f for f in queued[:sent]]
+                        got = (decode if version == 1 else decode_v2)(payload)[3]
+                        ok = ok and [b.frame for b in got] == [f & 0x7F for f in queued[:sent]]
+                        del queued[:sent]
+                frame += 1
+                if frame > last + 100000:
+                    break
+        n = np.mean(per_packet)
+        backlog = np.mean(full) if full else n
+        wait_ms = np.array(waits) / 120 * 1e3
+        print(f"{name:15s} payload {room:2d} B | bounces/packet mean {n:4.2f}, "
+              f"backlogged {backlog:4.2f} | drain {backlog / args.packet_interval:5.1f} bounces/s | "
+              f"queue max {max_depth:3d}, wait p50 {np.percentile(wait_ms, 50):6.1f} ms "
+              f"p99 {np.percentile(wait_ms, 99):6.1f} ms")
+    if not ok:
+        print("MISMATCH: decoded bounces differ from the queued ones")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# extended: legacy vs extended vs periodic advertising
+# ------------------------------------------------------------
+
+def bench_extended(args):
+    w, h = BOUNCE_FIELD
+    field_model = FieldModel(w, h)
+    trajectories = _bounce_trajectories(args)
+    rallies = [_rally_bounces(t, field_model) for t in trajectories]
+    frames_per_packet = max(1, int(round(args.packet_interval * 120)))
+    position_every = max(1, int(round(120 / args.position_rate)))
+    print(f"{sum(len(r) for r in rallies)} bounces in {len(rallies)} rallies, one packet every "
+          f"{args.packet_interval * 1e3:.0f} ms, positions at {120 / position_every:.0f} Hz")
+
+    ok = True
+    for controller_ext, requested in ((False, "auto"), (True, "legacy"),
+                                      (True, "extended"), (True, "periodic")):
+        controller = FakeHCI(extended=controller_ext)
+        buf = BLAEventBuffer(capacity=256)
+        adv = BLAAdvertiser(backend=controller.backend(), buffer=buf, payload_version=2,
+                            name=None, mode=requested)
+        adv.backend.open()
+        adv._configure(negotiate_mode(adv.backend, requested))
+        adv.mode.start(adv.header)
+
+        sizes, waits = [], []
+        positions_sent = positions_total = 0
+        for traj, events in zip(trajectories, rallies):
+            buf.reset()
+            queued = []
+            i = 0
+            for frame in range(len(traj) + 2000):
+                if frame >= len(traj) and not buf.pending_bounces():
+                    break
+                while i < len(events) and events[i][0] <= frame:
+                    buf.add_bounce(events[i][1])
+                    queued.append(frame)
+                    i += 1
+                if frame < len(traj) and frame % position_every == 0:
+                    positions_total += 1
+                    if adv.extended:
+                        x, y = traj[frame]
+                        buf.add_position(frame, max(x, 0) * 127 // w, max(y, 0) * 63 // h)
+                if frame % frames_per_packet:
+                    continue
+                before = buf.pending_bounces()
+                packet = adv._build_packet()
+                sent = before - buf.pending_bounces()
+                ok = adv._send_packet(packet) and ok
+                version, payload = split_adv_data(packet)
+                decoded = DECODERS[version](payload)
+                ok = ok and len(decoded[3]) == sent
+                if version == 3:
+                    positions_sent += len(decoded[4])
+                sizes.append(len(packet))
+                waits += [frame - f for f in queued[:sent]]
+                del queued[:sent]
+        adv.mode.stop()
+        adv.backend.close()
+
+        wait_ms = np.array(waits) / 120 * 1e3
+        on_air = controller.periodic_data or controller.ext_adv_data or controller.adv_data
+        ok = ok and split_adv_data(on_air) is not None
+        print(f"{'ext' if controller_ext else 'legacy'} controller, {requested:8s} -> "
+              f"{adv.mode.name:8s} payload {adv.max_payload:3d} B | packet mean "
+              f"{np.mean(sizes):5.1f} B | bounce wait p99 {np.percentile(wait_ms, 99):6.1f} ms | "
+              f"positions {positions_sent}/{positions_total} | failures {adv.failures}")
+    if not ok:
+        print("MISMATCH: a packet failed or decoded to the wrong bounce count")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# receiver: de-duplication, gap detection, reassembly
+# ------------------------------------------------------------
+
+def _advertised_packets(adv, buf, events, position_every, traj):
+    """
+    Distinct packets of one rally as the advertiser builds them, each
+    with the (stream index, Bounce) pairs it carries.
+    """
+    w, h = BOUNCE_FIELD
+    buf.reset()
+    packets = []
+    index = 0
+    i = 0
+    last = None
+    for frame in range(len(traj) + 2000):
+        if frame >= len(traj) and not buf.pending_bounces():
+            break
+        while i < len(events) and events[i][0] <= frame:
+            buf.add_bounce(events[i][1])
+            i += 1
+        if adv.extended and frame < len(traj) and frame % position_every == 0:
+            x, y = traj[frame]
+            buf.add_position(frame, max(x, 0) * 127 // w, max(y, 0) * 63 // h)
+        if frame % 12:
+            continue
+        before = buf.pending_bounces()
+        packet = adv._build_packet()
+        sent = before - buf.pending_bounces()
+        if packet == last:
+            continue            # the controller keeps advertising the same data
+        last = packet
+        carried = events[index:index + sent]
+        packets.append((packet, [(index + k, b) for k, (_, b) in enumerate(carried)]))
+        index += sent
+    return packets
+
+
+def bench_receiver(args):
+    w, h = BOUNCE_FIELD
+    field_model = FieldModel(w, h)
+    trajectories = _bounce_trajectories(args)
+    rallies = [_rally_bounces(t, field_model) for t in trajectories]
+    rng = np.random.default_rng(7)
+    print(f"{sum(len(r) for r in rallies)} bounces in {len(rallies)} rallies, "
+          f"{args.loss:.0%} packet loss, up to {args.repeats} copies per packet")
+
+    ok = True
+    for extended, requested, name in ((False, "legacy", NAME), (False, "legacy", None),
+                                      (True, "extended", None)):
+        controller = FakeHCI(extended=extended)
+        buf = BLAEventBuffer(capacity=256)
+        adv = BLAAdvertiser(backend=controller.backend(), buffer=buf, payload_version=2,
+                            name=name, mode=requested)
+        adv.backend.open()
+        adv._configure(negotiate_mode(adv.backend, requested))
+        receiver = BLAReceiver(simulate=True)
+        receiver.start()
+
+        sent = deliveries = received = 0
+        lost_packets = lost_bounces = counted_packets = counted_bounces = 0
+        mismatched = 0
+        elapsed = 0.0
+        for traj, events in zip(trajectories, rallies):
+            packets = _advertised_packets(adv, buf, events, 4, traj)
+            receiver.reset()
+            stream, expected = [], []
+            for n, (packet, carried) in enumerate(packets):
+                # the first and last packet always arrive, so every loss
+                # lies between two received packets and can be detected
+                if 0 < n < len(packets) - 1 and rng.random() < args.loss:
+                    lost_packets += 1
+                    lost_bounces += len(carried)
+                    continue
+                stream += [packet] * int(rng.integers(1, args.repeats + 1))
+                if n > 2 and rng.random() < 0.05:
+                    # an old packet a scanner reports late
+                    stream.append(packets[n - 2][0])
+                expected += carried
+            sent += len(packets)
+            deliveries += len(stream)
+
+            t0 = time.perf_counter()
+            for packet in stream:
+                receiver.inject_packet(packet)
+            elapsed += time.perf_counter() - t0
+
+            log = receiver.bounce_log()
+            received += len(log)
+            counted_packets += receiver.lost_packets
+            counted_bounces += receiver.lost_bounces
+            # receiver indices are mod 256 at the start; compare relative ones
+            base = log[0].index - expected[0][0] if log and expected else 0
+            if [(e.index - base, e.data) for e in log] != expected:
+                mismatched += 1
+        receiver.stop()
+        adv.backend.close()
+
+        ok = (ok and mismatched == 0 and counted_packets == lost_packets and
+              counted_bounces == lost_bounces)
+        print(f"{adv.mode.name:8s} name {str(name):11s} | {sent:5d} packets, {deliveries:5d} "
+              f"deliveries, {deliveries / elapsed:7.0f} packets/s | lost packets "
+              f"{counted_packets}/{lost_packets}, lost bounces {counted_bounces}/{lost_bounces} "
+              f"| {received} bounces in order, {mismatched} rallies mismatched")
+    if not ok:
+        print("MISMATCH: receiver log or loss counts differ from the channel")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# metrics: streaming vs batch, accuracy, cost
+# ------------------------------------------------------------
+
+def _shot_track(n, rng, scale_x, scale_y, piece=60):
+    """
+    Ball path with jittered frame times and occasional dropouts: pieces
+    of `piece` frames, each starting with a new velocity (a hit) and
+    moving with constant acceleration. Returns t, x, y (field px,
+    NaN = no ball) and the true vx, vy, ax, ay in m/s.
+    """
+    t = np.cumsum(rng.uniform(0.0075, 0.0092, n))
+    k = np.arange(n) // piece
+    pieces = k[-1] + 1
+    start = t[np.minimum(np.arange(pieces) * piece, n - 1)]
+    tau = t - start[k]
+    ax = rng.uniform(-30, 30, pieces)[k]
+    ay = rng.uniform(-20, 20, pieces)[k]
+    v0x = rng.uniform(-3, 3, pieces)[k]
+    v0y = rng.uniform(-2, 2, pieces)[k]
+    x0 = rng.uniform(0.2, 1.0, pieces)[k]
+    y0 = rng.uniform(0.1, 0.6, pieces)[k]
+    x = (x0 + v0x * tau + 0.5 * ax * tau * tau) / scale_x
+    y = (y0 + v0y * tau + 0.5 * ay * tau * tau) / scale_y
+    gone = rng.random(n) < 0.01
+    x[gone] = np.nan
+    y[gone] = np.nan
+    return t, x, y, v0x + ax * tau, v0y + ay * tau, ax, ay
+
+
+def bench_metrics(args):
+    w, h = BOUNCE_FIELD
+    engine = MetricsEngine(w, h, window=args.window)
+    rng = np.random.default_rng(3)
+    t, x, y, vx, vy, ax, ay = _shot_track(args.frames, rng, engine.scale_x, engine.scale_y)
+    positions = [None if np.isnan(px) else (px, py) for px, py in zip(x, y)]
+    print(f"{args.frames} frames, window {engine.window}, "
+          f"{engine.scale_x * 1e3:.2f} x {engine.scale_y * 1e3:.2f} mm/px")
+
+    engine.reset()
+    t0 = time.perf_counter()
+    streamed = [engine.update(ti, p) for ti, p in zip(t.tolist(), positions)]
+    stream_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    batch = engine.batch(t, x, y)
+    batch_s = time.perf_counter() - t0
+    angle_bits, speed_bits = engine.batch_bits(batch)
+
+    ok = True
+    valid = np.array([m is not None for m in streamed])
+    ok = ok and np.array_equal(valid, ~np.isnan(batch["speed"]))
+    worst = 0.0
+    bit_mismatches = 0
+    for i in np.flatnonzero(valid):
+        m = streamed[i]
+        for key in ("vx", "vy", "ax", "ay", "power"):
+            worst = max(worst, abs(getattr(m, key) - batch[key][i]))
+        bit_mismatches += m.bits() != (angle_bits[i], speed_bits[i])
+
+    # the fit lags a change of acceleration by up to a window; compare
+    # only windows inside one constant-acceleration piece
+    steady = valid & (np.arange(args.frames) % 60 >= engine.window)
+    speed_err = np.abs(batch["speed"] - np.hypot(vx, vy))[steady]
+    acc_err = np.abs(batch["acceleration"] - np.hypot(ax, ay))[steady]
+    print(f"streaming vs batch: max |diff| {worst:.2e}, 8-bit mismatches {bit_mismatches}, "
+          f"validity {'same' if ok else 'DIFFERS'}")
+    print(f"accuracy (noise-free): speed max err {speed_err.max():.2e} m/s, "
+          f"acceleration max err {acc_err.max():.2e} m/s^2")
+    print(f"streaming {stream_s / args.frames * 1e6:6.2f} us/frame | "
+          f"batch {batch_s / args.frames * 1e6:6.3f} us/frame "
+          f"({stream_s / batch_s:.0f}x)")
+    print(f"sample: {streamed[np.flatnonzero(valid)[-1]]!r}, bits "
+          f"{quantize(batch['speed'][-1], batch['angle'][-1])}")
+    ok = ok and worst < 1e-6 and bit_mismatches == 0
+    if not ok:
+        print("MISMATCH: streaming and batch metrics differ")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# calibration: centroid lookup vs exact mapping vs full remap
+# ------------------------------------------------------------
+
+def _camera_model(size):
+    """
+    Wide-angle lens and a tilted view of the field: (K, dist, corners
+    in the undistorted image, corners as the camera sees them).
+    """
+    w, h = size
+    K = np.array([[300.0, 0, w / 2], [0, 300.0, h / 2], [0, 0, 1]])
+    dist = np.array([-0.28, 0.09, 0.0, 0.0, 0.0])
+    ideal = np.array([[52, 38], [w - 44, 30], [w - 36, h - 34], [40, h - 40]], np.float64)
+    return K, dist, ideal, _distort(ideal, K, dist)
+
+
+def _field_frame(size, K, dist, ideal):
+    """
+    Camera frame of a (lens-distorted) green field on grey.
+    """
+    w, h = size
+    edges = []
+    for a, b in zip(ideal, np.roll(ideal, -1, axis=0)):
+        for s in np.linspace(0, 1, 40, endpoint=False):
+            edges.append(a + (b - a) * s)
+    outline = _distort(np.array(edges), K, dist)
+    frame = np.full((h, w, 3), 90, np.uint8)
+    cv2.fillPoly(frame, [np.round(outline).astype(np.int32)], (40, 140, 40))
+    return frame
+
+
+def bench_calibration(args):
+    size = (384, 216)
+    field = (320, 180)
+    K, dist, ideal, corners = _camera_model(size)
+    ok = True
+
+    # corners found in a rendered frame vs the true ones
+    found = find_playfield_corners(_field_frame(size, K, dist, ideal))
+    corner_err = np.abs(found - corners).max() if found is not None else np.inf
+    print(f"field corners: max error {corner_err:.1f} px")
+    ok = ok and corner_err < 4
+
+    calib = Calibration.from_corners(corners, size, field, K, dist)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "calibration.npz")
+        calib.save(path)
+        t0 = time.perf_counter()
+        calib = load_calibration(path, cache_dir=tmp)
+        cold = time.perf_counter() - t0
+        _loaded_calibrations.clear()
+        t0 = time.perf_counter()
+        cached = load_calibration(path, cache_dir=tmp)
+        warm = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        again = load_calibration(path, cache_dir=tmp)
+        memo = time.perf_counter() - t0
+        ok = ok and again is cached and np.array_equal(cached._map_x, calib._map_x)
+    print(f"load: build tables {cold * 1e3:6.1f} ms | disk cache {warm * 1e3:6.2f} ms | "
+          f"in-process {memo * 1e6:5.1f} us")
+
+    # field points -> camera pixels (truth) -> back through the tables
+    rng = np.random.default_rng(5)
+    n = args.points
+    truth = np.column_stack([rng.uniform(0, field[0], n), rng.uniform(0, field[1], n)])
+    ideal_px = cv2.perspectiveTransform(truth.reshape(-1, 1, 2),
+                                        np.linalg.inv(calib.homography)).reshape(-1, 2)
+    image = _distort(ideal_px, K, dist)
+    pts = image.tolist()
+
+    t0 = time.perf_counter()
+    mapped = [calib.to_field(x, y) for x, y in pts]
+    lookup = (time.perf_counter() - t0) / n
+    err = np.hypot(*(np.array(mapped) - truth).T)
+    print(f"sub-pixel centroids: error p50 {np.median(err):.3f} max {err.max():.3f} field px")
+    ok = ok and err.max() < 0.5
+
+    centroids = np.round(image).astype(int).tolist()
+    t0 = time.perf_counter()
+    mapped = [calib.to_field(x, y) for x, y in centroids]
+    lookup_int = (time.perf_counter() - t0) / n
+    exact = calib.map_points(centroids)
+    diff = np.abs(np.array(mapped) - exact).max()
+    print(f"integer centroids vs exact mapping: max diff {diff:.4f} field px")
+    ok = ok and diff < 1e-3
+
+    t0 = time.perf_counter()
+    for p in centroids[:2000]:
+        calib.map_points([p])
+    per_call = (time.perf_counter() - t0) / 2000
+
+    t0 = time.perf_counter()
+    xs, ys = calib.to_field_many(image[:, 0], image[:, 1])
+    batch = (time.perf_counter() - t0) / n
+    ok = ok and np.abs(np.column_stack([xs, ys]) - truth).max() < 0.5
+
+    frame = _field_frame(size, K, dist, ideal)
+    full_maps = cv2.initUndistortRectifyMap(K, dist, None, K, size, cv2.CV_16SC2)
+    rect = _timed(lambda f: calib.remap_roi(f), [frame], repeat=200)
+    full = _timed(lambda f: cv2.remap(f, *full_maps, cv2.INTER_LINEAR), [frame], repeat=200)
+    print(f"per centroid: table {lookup_int * 1e6:5.2f} us (sub-pixel {lookup * 1e6:5.2f} us) | "
+          f"exact cv2 {per_call * 1e6:5.1f} us | batch {batch * 1e6:5.3f} us")
+    print(f"per frame: remap_roi {_fmt_us(rect)} | undistort whole frame {_fmt_us(full)}")
+    if not ok:
+        print("MISMATCH: calibration lookup or corner detection out of tolerance")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# roi: background field ROI monitor
+# ------------------------------------------------------------
+
+def _roi_frame(size, roi, rng):
+    w, h = size
+    x, y, rw, rh = roi
+    frame = np.full((h, w, 3), 90, np.uint8)
+    frame[y:y + rh, x:x + rw] = (40, 140, 40)
+    frame += rng.integers(0, 12, frame.shape, dtype=np.uint8)
+    return frame
+
+
+def bench_roi(args):
+    size = (384, 216)
+    rng = np.random.default_rng(11)
+    start = (40, 30, 300, 156)
+    bumped = (52, 22, 300, 156)
+    bump_at = args.checks // 2
+    monitor = ROIMonitor(start, interval=0.0, prepare=lambda roi: roi)
+
+    moved_at = None
+    false_moves = 0
+    for i in range(args.checks):
+        jitter = rng.integers(-1, 2, 2)
+        base = bumped if i >= bump_at else start
+        roi = (base[0] + jitter[0], base[1] + jitter[1], base[2], base[3])
+        frame = _roi_frame(size, roi, rng)
+        if i % 10 == 7:
+            frame[:] = 90           # light off / hand over the field
+        if monitor.check(frame):
+            if i < bump_at:
+                false_moves += 1
+            elif moved_at is None:
+                moved_at = i
+    final = monitor.roi
+    err = max(abs(a - b) for a, b in zip(final, bumped))
+    print(f"{args.checks} checks, field bumped by 12/-8 px at check {bump_at}: "
+          f"followed after {moved_at - bump_at if moved_at is not None else '-'} checks, "
+          f"final ROI {final} (error {err} px), false moves {false_moves}, "
+          f"full searches {monitor.recomputes}, misses {monitor.misses}")
+    ok = moved_at is not None and false_moves == 0 and err <= 2
+
+    frame = _roi_frame(size, start, rng)
+    quick = _timed(lambda f: monitor._measure(f), [frame], repeat=200)
+    full = _timed(lambda f: kicker_vision.find_playfield_roi(f), [frame], repeat=200)
+    monitor.interval = 1.0
+    hot = _timed(lambda f: monitor.submit(f), [frame], repeat=20000)
+    print(f"downscaled check  {_fmt_us(quick)}")
+    print(f"full search       {_fmt_us(full)}")
+    print(f"submit (hot loop) {_fmt_us(hot)}")
+    if not ok:
+        print("MISMATCH: monitor did not follow the bump cleanly")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# instruments: telemetry overhead and histogram accuracy
+# ------------------------------------------------------------
+
+def bench_instruments(args):
+    rng = np.random.default_rng(2)
+    values = rng.lognormal(np.log(2e-4), 0.8, args.samples)
+    h = Histogram()
+    for v in values.tolist():
+        h.record(v)
+    ok = True
+    print(f"{args.samples} latencies, histogram of {len(h.counts)} bins:")
+    for p in (50, 90, 99):
+        exact = np.percentile(values, p)
+        got = h.percentile(p)
+        rel = got / exact - 1
+        ok = ok and -0.01 <= rel <= 0.13
+        print(f"  p{p:<2d} exact {exact * 1e3:7.4f} ms | histogram {got * 1e3:7.4f} ms ({rel:+.1%})")
+    ok = ok and h.max == values.max() and h.count == len(values)
+
+    inst = Instruments()
+    n = 100000
+    t0 = time.perf_counter()
+    for _ in range(n):
+        inst.record("detect", 1e-4)
+    record = (time.perf_counter() - t0) / n
+    t0 = time.perf_counter()
+    for _ in range(n):
+        inst.count("frames")
+    count = (time.perf_counter() - t0) / n
+    timed = inst.wrap("noop", lambda: None)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        timed()
+    wrapped = (time.perf_counter() - t0) / n
+
+    # what the per-frame print cost, vs the rate-limited event line
+    sink = io.StringIO()
+    stdout = sys.stdout
+    sys.stdout = sink
+    t0 = time.perf_counter()
+    for i in range(n):
+        print("Ball:", 123.4, 56.7, "| bits:", 45, 33)
+    printed = (time.perf_counter() - t0) / n
+    sys.stdout = stdout
+    logger = logging.getLogger("kikicker.bench")
+    logger.propagate = False
+    logger.addHandler(logging.StreamHandler(sink))
+    logger.setLevel(logging.INFO)
+    events = EventLog("kikicker.bench", interval=1.0)
+    t0 = time.perf_counter()
+    for i in range(n):
+        events.event("ball", x=123.4, y=56.7, bits="45,33")
+    event = (time.perf_counter() - t0) / n
+    print(f"per call: record {record * 1e9:5.0f} ns | count {count * 1e9:5.0f} ns | "
+          f"wrap {wrapped * 1e9:5.0f} ns | print {printed * 1e9:5.0f} ns (to a buffer) | "
+          f"rate-limited event {event * 1e9:5.0f} ns")
+
+    # both endpoints return the same snapshot
+    with tempfile.TemporaryDirectory() as tmp:
+        http = StatsServer(inst, "127.0.0.1:0")
+        unix = StatsServer(inst, "unix:" + os.path.join(tmp, "stats.sock"))
+        http.start()
+        unix.start()
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{http.port}/stats") as r:
+                via_http = json.load(r)
+            with socket.socket(socket.AF_UNIX) as s:
+                s.connect(unix.address[len("unix:"):])
+                via_unix = json.loads(s.makefile().readline())
+        finally:
+            http.stop()
+            unix.stop()
+    same = via_http["counters"] == via_unix["counters"] == {"frames": n}
+    print(f"stats endpoint: http and unix socket {'agree' if same else 'DIFFER'}, "
+          f"detect count {via_http['latency']['detect']['count']}")
+    ok = ok and same
+    if not ok:
+        print("MISMATCH: histogram or endpoint check failed")
+    return 0 if ok else 1
+
+
+# ------------------------------------------------------------
+# debug: vision loop rate with the overlay off / inline / threaded
+# ------------------------------------------------------------
+
+def _inline_overlay(frame, roi, result):
+    # what main.py used to do per frame (imencode standing in for imshow)
+    image = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    rx, ry, rw, rh = roi
+    cv2.rectangle(image, (rx, ry), (rx + rw, ry + rh), (0, 0, 255), 2)
+    if result is not None:
+        _, _, x, y, w, h = result
+        cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+        cv2.putText(image, "0,0", (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
+    cv2.imencode(".jpg", image)
+
+
+def bench_debug(args):
+    source = SyntheticSource()
+    frames = [source.capture_array() for _ in range(min(args.frames, len(source)))]
+    roi = source.field
+
+    def loop(overlay):
+        t0 = time.perf_counter()
+        for frame in frames:
+            result = kicker_vision.detect_ball(frame, roi=roi)
+            overlay(frame, result)
+        return len(frames) / (time.perf_counter() - t0)
+
+    def threaded(view):
+        def overlay(frame, result):
+            if result is None:
+                view.lost()
+                view.submit(frame, roi)
+            else:
+                view.ball(result[0], result[1])
+                view.submit(frame, roi, result[2:], "0,0")
+        return overlay
+
+    view = DebugView(fps=args.fps, window=None, stream="127.0.0.1:0")
+    view.start()
+    received = []
+
+    def client():
+        with urllib.request.urlopen(f"http://127.0.0.1:{view.port}/") as r:
+            while view.running:
+                line = r.readline()
+                if not line:
+                    break
+                if line.startswith(b"--"):
+                    received.append(1)
+
+    reader = threading.Thread(target=client, daemon=True)
+    reader.start()
+    time.sleep(0.2)
+    # interleaved rounds, best of each: the machine's own jitter is
+    # larger than the difference we're looking for
+    off = inline = rate = 0.0
+    for _ in range(args.rounds):
+        off = max(off, loop(lambda f, r: None))
+        inline = max(inline, loop(lambda f, r: _inline_overlay(f, roi, r)))
+        rate = max(rate, loop(threaded(view)))
+    time.sleep(0.2)
+    view.stop()
+    print(f"{len(frames)} frames, detection + overlay, unpaced:")
+    print(f"  debug off        {off:7.0f} frames/s")
+    print(f"  inline overlay   {inline:7.0f} frames/s ({inline / off - 1:+.0%})")
+    print(f"  threaded view    {rate:7.0f} frames/s ({rate / off - 1:+.0%}), "
+          f"{view.drawn} drawn at <= {args.fps:.0f} fps, {len(received)} MJPEG frames streamed")
+    return 0
+
+
+def _table_options(n):
+    import main as kicker_main
+    out = []
+    for i in range(n):
+        options = kicker_main.parser.parse_args(
+            ['--source', 'synthetic', '--loop', '--ble-backend', 'fake', '--log-level', 'WARNING'])
+        options.name = f"table{i + 1}"
+        options.cpus = None
+        out.append(options)
+    return out
+
+
+def _table_rows(snapshots, seconds):
+    rows = []
+    for name, snap in snapshots:
+        latency = snap["latency"]
+        # the supervisor's rate leaves out the processes' start-up
+        fps = snap.get("fps") or snap["counters"].get("frames", 0) / seconds
+        rows.append((name, fps,
+                     latency["latency"]["p50_ms"], latency["latency"]["p99_ms"],
+                     latency["publish"]["p99_ms"]))
+    return rows
+
+
+def bench_tables(args):
+    tables = _table_options(args.tables)
+
+    # all sessions in one process, one publish thread each
+    logging.getLogger('kikicker').setLevel(logging.WARNING)
+    sessions = [TableSession(t, t.name) for t in tables]
+    for s in sessions:
+        s.start()
+    threads = [threading.Thread(target=s.run, daemon=True) for s in sessions]
+    for t in threads:
+        t.start()
+    time.sleep(args.seconds)
+    for s in sessions:
+        s.stop()
+    for t in threads:
+        t.join()
+    for s in sessions:
+        s.close()
+    shared = _table_rows([(s.name, s.snapshot()) for s in sessions], args.seconds)
+
+    # one pinned process per table
+    sup = Supervisor(tables, interval=0.5)
+    sup.start()
+    deadline = time.monotonic() + args.seconds
+    while time.monotonic() < deadline:
+        sup._collect(timeout=0.1)
+        sup._watch()
+    snap = sup.snapshot()
+    sup.stop()
+    separate = _table_rows([(name, t) for name, t in snap["tables"].items() if "latency" in t],
+                           args.seconds)
+
+    cpus = assign_cpus(tables)
+    print(f"{args.tables} synthetic tables at 120 fps for {args.seconds:.0f} s, "
+          f"{os.cpu_count()} cpus ({', '.join(f'{n}: {c}' for n, c in cpus.items())})")
+    print("  table       frames/s  capture->publish p50/p99  publish p99")
+    for title, rows in (("one process", shared), ("supervisor", separate)):
+        print(f"  {title}:")
+        for name, fps, p50, p99, publish in rows:
+            print(f"    {name:9s} {fps:8.0f}  {p50:10.2f} /{p99:7.2f} ms  {publish:8.2f} ms")
+    return 0
+
+
+def _arena_frames(n, rng):
+    """
+    Synthetic rally with what arena footage adds: an orange logo printed
+    on the field, a jersey leaning over the table edge, a hand's shadow
+    sweeping across, orange glints, and the ball hidden now and then.
+    Returns (frames, truth), truth[i] None while the ball is hidden.
+    """
+    field = (24, 12, 336, 192)
+    points = rally_script(field, frames=n)
+    for start in range(150, n, 200):
+        points[start:start + 12] = [None] * len(points[start:start + 12])
+    source = SyntheticSource(points=points, field=field)
+    logo = (field[0] + 250, field[1] + 60)
+    frames, truth = [], []
+    for i in range(n):
+        frame = source.capture_array()
+        truth.append(source.truth)
+        # static logo, bigger than the ball (the ball rolls over it)
+        if source.truth is None or math.dist(source.truth, logo) > 20:
+            cv2.circle(frame, logo, 10, (250, 110, 10), -1)
+        # jersey swaying in and out of the top left corner
+        sway = int(12 * math.sin(i / 40.0))
+        cv2.ellipse(frame, (10 + sway, 20), (40, 30), 0, 0, 360, (240, 100, 20), -1)
+        # shadow sweeping across the field
+        sx = int((i * 2) % 420) - 60
+        shadow = frame[40:120, max(0, sx):max(0, sx + 60)]
+        shadow[:] = (shadow * 0.55).astype(np.uint8)
+        # glints
+        for _ in range(3):
+            gx, gy = int(rng.integers(30, 354)), int(rng.integers(20, 196))
+            frame[gy:gy + 2, gx:gx + 2] = (255, 140, 30)
+        frames.append(frame)
+    return frames, truth
+
+
+def bench_detectors(args):
+    if args.source:
+        source = open_source(args.source)
+        frames = [f for _, f in zip(range(args.frames), source)]
+        truth = None
+    else:
+        frames, truth = _arena_frames(args.frames, np.random.default_rng(0))
+    roi = kicker_vision.find_playfield_roi(frames[0]) or (0, 0, frames[0].shape[1], frames[0].shape[0])
+
+    detectors = {
+        "contour": lambda: (lambda f: kicker_vision.detect_ball(f, roi=roi)),
+        "contour+window": lambda: kicker_vision.BallTracker(roi=roi).detect,
+        "background": lambda: BackgroundBallDetector(roi=roi).detect,
+    }
+    print(f"{len(frames)} frames ({args.source or 'synthetic arena'}), roi {roi}")
+    print(f"  {'detector':15s} {'p50 us':>7s} {'p99 us':>7s}  results")
+    for name, make in detectors.items():
+        # best of a few passes for the cost, the last one for the results
+        best = None
+        for _ in range(args.repeat):
+            detect = make()
+            times = np.empty(len(frames))
+            results = []
+            for i, frame in enumerate(frames):
+                t0 = time.perf_counter()
+                results.append(detect(frame))
+                times[i] = time.perf_counter() - t0
+            if best is None or np.median(times) < np.median(best):
+                best = times
+
+        if truth is not None:
+            hits = misses = false = 0
+            for result, point in zip(results, truth):
+                close = (result is not None and point is not None
+                         and math.hypot(result[0] - point[0], result[1] - point[1]) <= args.tolerance)
+                hits += close
+                misses += point is not None and not close
+                false += result is not None and not close
+            visible = sum(p is not None for p in truth)
+            detail = (f"hit {hits / visible:6.1%}  missed {misses:4d}  "
+                      f"false positives {false:4d} ({false / len(frames):.1%} of frames)")
+        else:
+            # no ground truth: a detection far from the last one is a likely false positive
+            found = [r for r in results if r is not None]
+            jumps = sum(1 for a, b in zip(found, found[1:])
+                        if math.hypot(a[0] - b[0], a[1] - b[1]) > 48)
+            detail = f"detections {len(found):5d}  jumps > 48 px {jumps:4d}"
+        print(f"  {name:15s} {np.percentile(best, 50) * 1e6:7.0f} {np.percentile(best, 99) * 1e6:7.0f}  {detail}")
+    return 0
+
+
+def _lit(frames, gain, tint=(1.0, 1.0, 1.0)):
+    """
+    frames under other light: every channel scaled (dim, warm, ...).
+    gain may be a number or one per frame.
+    """
+    gains = gain if isinstance(gain, (list, np.ndarray)) else [gain] * len(frames)
+    scale = np.asarray(tint, np.float32)
+    return [np.clip(f * (g * scale), 0, 255).astype(np.uint8) for f, g in zip(frames, gains)]
+
+
+def _hit_rate(detect, frames, truth, tolerance=5.0):
+    hits = visible = 0
+    for frame, point in zip(frames, truth):
+        result = detect(frame)
+        if point is None:
+            continue
+        visible += 1
+        hits += (result is not None
+                 and math.hypot(result[0] - point[0], result[1] - point[1]) <= tolerance)
+    return hits / max(1, visible)
+
+
+def bench_colors(args):
+    field = (24, 12, 336, 192)
+    source = SyntheticSource(points=rally_script(field, frames=args.frames), field=field)
+    plain, plain_truth = [], []
+    for _ in range(args.frames):
+        plain.append(source.capture_array())
+        plain_truth.append(source.truth)
+    arena, arena_truth = _arena_frames(args.frames, np.random.default_rng(0))
+    # calibrate on the first seconds of play, score on the rest
+    n = int(args.seconds * 30)
+
+    venues = {
+        "as rendered": (1.0, (1.0, 1.0, 1.0)),
+        "dim": (0.4, (1.0, 1.0, 1.0)),
+        "dim, warm": (0.45, (1.0, 0.85, 0.7)),
+        "bright, cool": (1.15, (0.9, 1.0, 1.2)),
+    }
+    print(f"calibrated on {n} frames, ball hit rate on the next {args.frames - n} "
+          f"(contour: plain rally, background model: arena)")
+    print(f"  {'venue':13s} {'contour':>17s} {'background':>17s} {'calib ms':>9s}  profile")
+    for venue, (gain, tint) in venues.items():
+        lit_plain, lit_arena = _lit(plain, gain, tint), _lit(arena, gain, tint)
+        roi = kicker_vision.find_playfield_roi(lit_plain[0]) or field
+        rates = []
+        for profile in (ColorProfile.default(), None):
+            if profile is None:
+                t0 = time.perf_counter()
+                profile, _ = calibrate(lit_arena[:n], previous=ColorProfile.default())
+                ms = (time.perf_counter() - t0) * 1e3
+            colors = profile.thresholds()
+            rates.append((
+                _hit_rate(lambda f: kicker_vision.detect_ball(f, roi=roi, colors=colors),
+                          lit_plain[n:], plain_truth[n:]),
+                _hit_rate(BackgroundBallDetector(roi=roi, colors=colors).detect, lit_arena, arena_truth)))
+        (c0, b0), (c1, b1) = rates
+        print(f"  {venue:13s} {c0:6.1%} -> {c1:6.1%} {b0:6.1%} -> {b1:6.1%} {ms:9.0f}  "
+              f"ball {profile.ball_range} field {profile.field_range} min {profile.min_ball_area}")
+
+    # ---- store: what startup pays ----
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "profiles.json")
+        camera = camera_key("synthetic", FRAME_SIZE, FPS)
+        for i in range(20):
+            save_profile(ColorProfile(
+                profile.ball_range, profile.field_range, profile.min_ball_area,
+                f"venue{i}", camera), path)
+        t0 = time.perf_counter()
+        loaded = load_profile("venue7", camera, path)
+        load_us = (time.perf_counter() - t0) * 1e6
+        assert loaded.to_dict()["ball"] == profile.to_dict()["ball"]
+        applied = []
+        for backend in kicker_vision.COLOR_BACKENDS:
+            # the LUT is built on the first start, loaded from its cache after that
+            t0 = time.perf_counter()
+            loaded.thresholds(backend)
+            applied.append(f"{backend} {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    print(f"profile store, 20 profiles: load {load_us:.0f} us; apply: {', '.join(applied)}")
+
+    # ---- re-tune: light fading to 20% ----
+    frames = args.frames * 3
+    source = SyntheticSource(points=rally_script(field, frames=frames), field=field)
+    fade, fade_truth = [], []
+    for _ in range(frames):
+        fade.append(source.capture_array())
+        fade_truth.append(source.truth)
+    gains = 1.0 - 0.8 * np.clip((np.arange(frames) - n) / (frames - 2 * n), 0, 1)
+    fade = _lit(fade, gains)
+    roi = kicker_vision.find_playfield_roi(fade[0]) or field
+    print(f"light fading to 20% over {frames - 2 * n} frames, calibrated at the start:")
+    for retune in (False, True):
+        profile, _ = calibrate(fade[:n])
+        colors = profile.thresholds()
+        retuner = ColorRetuner(profile, colors)
+        submits, adds = [], []
+        hits = visible = 0
+        for i, (frame, point) in enumerate(zip(fade, fade_truth)):
+            result = kicker_vision.detect_ball(frame, roi=roi, colors=colors)
+            if point is not None:
+                visible += 1
+                hits += (result is not None
+                         and math.hypot(result[0] - point[0], result[1] - point[1]) <= args.tolerance)
+            if retune and result is not None:
+                # the loop's side at 30 fps; the thread's side run inline
+                t0 = time.perf_counter()
+                retuner.submit(frame, roi, result, now=i / 30.0)
+                submits.append(time.perf_counter() - t0)
+                slot, retuner._slot = retuner._slot, None
+                if slot is not None:
+                    t0 = time.perf_counter()
+                    retuner.add(*slot)
+                    adds.append(time.perf_counter() - t0)
+        detail = ""
+        if retune:
+            detail = (f"  {retuner.updates} updates, submit p50 {np.median(submits) * 1e6:.1f} us, "
+                      f"sample p50 {np.median(adds) * 1e6:.0f} us (re-tune thread)")
+        print(f"  {'re-tune' if retune else 'fixed':8s} hit {hits / visible:6.1%}{detail}")
+    return 0
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Kicker benchmarks')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('pipeline', help='all hot-path stages over a recording')
+    p.add_argument('--source', default='synthetic', help=' | '.join(SOURCES))
+    p.add_argument('--frames', type=int, default=100000, help='stop after this many frames')
+    p.add_argument('--alloc-frames', type=int, default=500,
+                   help='frames for the (slow) allocation pass')
+    p.add_argument('--loop', action='store_true')
+    p.set_defaults(func=bench_pipeline)
+
+    p = sub.add_parser('color', help='HSV inRange vs RGB lookup table masks')
+    p.add_argument('--bits', type=int, default=8, help='LUT bits per channel')
+    p.add_argument('--frames', type=int, default=100)
+    p.add_argument('--repeat', type=int, default=5)
+    p.set_defaults(func=bench_color)
+
+    p = sub.add_parser('bounce', help='detect_bounce vs BounceDetector vs batch: cost per point')
+    p.add_argument('--recording', help='replay detections from a recorder dump')
+    p.add_argument('--rallies', type=int, default=200)
+    p.add_argument('--length', type=int, default=600)
+    p.set_defaults(func=bench_bounce)
+
+    p = sub.add_parser('sweep', help='parameter grid sweep over a process pool')
+    p.add_argument('--recording', help='replay detections from a recorder dump')
+    p.add_argument('--rallies', type=int, default=200)
+    p.add_argument('--length', type=int, default=600)
+    p.add_argument('--processes', type=int, default=None)
+    p.set_defaults(func=bench_sweep)
+
+    p = sub.add_parser('locate', help='bounce position accuracy vs synthetic ground truth')
+    p.add_argument('--rallies', type=int, default=200)
+    p.add_argument('--length', type=int, default=600)
+    p.set_defaults(func=bench_locate)
+
+    p = sub.add_parser('zones', help='precomputed zone lookup vs classify_region')
+    p.add_argument('--points', type=int, default=200000)
+    p.set_defaults(func=bench_zones)
+
+    p = sub.add_parser('ble', help='advertising updates via the fake HCI controller')
+    p.add_argument('--updates', type=int, default=2000)
+    p.set_defaults(func=bench_ble)
+
+    p = sub.add_parser('schedule', help='event-driven payload scheduler vs fixed polling')
+    p.add_argument('--seconds', type=float, default=3.0)
+    p.set_defaults(func=bench_schedule)
+
+    p = sub.add_parser('codec', help='BLA payload encode/decode throughput')
+    p.add_argument('--repeat', type=int, default=100000)
+    p.set_defaults(func=bench_codec)
+
+    p = sub.add_parser('buffer', help='SPSC bounce ring: ordering, drops, goal decay, cost')
+    p.add_argument('--events', type=int, default=200000)
+    p.set_defaults(func=bench_buffer)
+
+    p = sub.add_parser('payload', help='v1 vs v2 payload: bounces per packet, queue drain')
+    p.add_argument('--recording', help='replay detections from a recorder dump')
+    p.add_argument('--rallies', type=int, default=100)
+    p.add_argument('--length', type=int, default=1200)
+    p.add_argument('--packet-interval', type=float, default=0.1,
+                   help='seconds between advertised packets')
+    p.set_defaults(func=bench_payload)
+
+    p = sub.add_parser('extended', help='legacy vs extended vs periodic advertising (fake controller)')
+    p.add_argument('--recording', help='replay detections from a recorder dump')
+    p.add_argument('--rallies', type=int, default=50)
+    p.add_argument('--length', type=int, default=1200)
+    p.add_argument('--packet-interval', type=float, default=0.1)
+    p.add_argument('--position-rate', type=float, default=30.0, help='samples per second')
+    p.set_defaults(func=bench_extended)
+
+    p = sub.add_parser('receiver', help='receiver de-duplication, gap detection, reassembly')
+    p.add_argument('--recording', help='replay detections from a recorder dump')
+    p.add_argument('--rallies', type=int, default=50)
+    p.add_argument('--length', type=int, default=1200)
+    p.add_argument('--loss', type=float, default=0.1, help='fraction of packets dropped')
+    p.add_argument('--repeats', type=int, default=3, help='max copies of a received packet')
+    p.set_defaults(func=bench_receiver)
+
+    p = sub.add_parser('metrics', help='ball metrics: streaming vs batch, accuracy, cost')
+    p.add_argument('--frames', type=int, default=100000)
+    p.add_argument('--window', type=int, default=5)
+    p.set_defaults(func=bench_metrics)
+
+    p = sub.add_parser('calibration', help='calibrated centroid lookup vs exact mapping vs remap')
+    p.add_argument('--points', type=int, default=20000)
+    p.set_defaults(func=bench_calibration)
+
+    p = sub.add_parser('roi', help='background field ROI monitor: drift following, cost')
+    p.add_argument('--checks', type=int, default=60)
+    p.set_defaults(func=bench_roi)
+
+    p = sub.add_parser('instruments', help='telemetry overhead, histogram accuracy, stats endpoint')
+    p.add_argument('--samples', type=int, default=200000)
+    p.set_defaults(func=bench_instruments)
+
+    p = sub.add_parser('debug', help='vision loop rate with the debug overlay off/inline/threaded')
+    p.add_argument('--frames', type=int, default=1200)
+    p.add_argument('--fps', type=float, default=15.0, help='overlay rate cap')
+    p.add_argument('--rounds', type=int, default=5)
+    p.set_defaults(func=bench_debug)
+
+    p = sub.add_parser('tables', help='several tables: one process vs one pinned process each')
+    p.add_argument('--tables', type=int, default=3)
+    p.add_argument('--seconds', type=float, default=5.0)
+    p.set_defaults(func=bench_tables)
+
+    p = sub.add_parser('detectors', help='contour vs background-model ball detection: cost, false positives')
+    p.add_argument('--source', help='recording to run on instead of the synthetic arena (no ground truth)')
+    p.add_argument('--frames', type=int, default=1200)
+    p.add_argument('--repeat', type=int, default=3)
+    p.add_argument('--tolerance', type=float, default=5.0, help='px from the true centre that count as a hit')
+    p.set_defaults(func=bench_detectors)
+
+    p = sub.add_parser('colors', help='colour threshold calibration under other light, profile load, re-tune')
+    p.add_argument('--frames', type=int, default=900)
+    p.add_argument('--seconds', type=float, default=3.0, help='of play to calibrate on')
+    p.add_argument('--tolerance', type=float, default=5.0, help='px from the true centre that count as a hit')
+    p.set_defaults(func=bench_colors)
+
+    args = parser.parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
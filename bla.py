@@ -1,101 +1,744 @@
 # bla.py
+import logging
+import socket
+import struct
 import threading
 import time
 import subprocess
+from collections import deque
 from bla_buffer import BLAData
+from bla_codec import capacity, adv_header, frame_payload, payload_room
+from instrumentation import Histogram
 
-class BLAAdvertiser:
-    def __init__(self, interval=1):
-        self.interval = interval
-        self.running = False
-        self.thread = None
+log = logging.getLogger('kikicker.ble')
 
-        # BLE header for Legacy ADV
-        self.header = bytes.fromhex(
-            "020106"            # flags (Length:2, Type:01 "Flags", Data:06 "LE General Discoverable")
-            "09"                # Name Length
-            "09"                # Name Type 9 = ASCII
-            "6b696b69636b6572"  # Name in Hex ASCII "kikicker"
-        )
-        # max BLE payload: 31 - len(header)
-        self.max_payload = 31 - len(self.header)
-        print(self.max_payload)
+# ------------------------------------------------------------
+# HCI constants (Core spec Vol 4 Part E)
+# ------------------------------------------------------------
+# fall back to the Linux values if Python was built without Bluetooth
+AF_BLUETOOTH = getattr(socket, "AF_BLUETOOTH", 31)
+BTPROTO_HCI = getattr(socket, "BTPROTO_HCI", 1)
+SOL_HCI = 0
+HCI_FILTER = 2
 
-    # ------------------------------------------------------------
+HCI_COMMAND_PKT = 0x01
+HCI_EVENT_PKT = 0x04
+EVT_CMD_COMPLETE = 0x0E
+EVT_CMD_STATUS = 0x0F
 
-    def _build_packet(self):
-        # BLAData.consume_for_packet now returns a packed payload (bytes)
-        payload = BLAData.consume_for_packet(self.max_payload)
-        return self.header #+ payload
+OGF_LE = 0x08
+OCF_LE_SET_ADV_DATA = 0x0008
+OCF_LE_SET_ADV_ENABLE = 0x000A
+# extended / periodic advertising (Bluetooth 5)
+OCF_LE_SET_EXT_ADV_PARAMS = 0x0036
+OCF_LE_SET_EXT_ADV_DATA = 0x0037
+OCF_LE_SET_EXT_ADV_ENABLE = 0x0039
+OCF_LE_READ_MAX_ADV_DATA_LEN = 0x003A
+OCF_LE_SET_PERIODIC_ADV_PARAMS = 0x003E
+OCF_LE_SET_PERIODIC_ADV_DATA = 0x003F
+OCF_LE_SET_PERIODIC_ADV_ENABLE = 0x0040
 
-    # ------------------------------------------------------------
+STATUS_UNKNOWN_COMMAND = 0x01
+STATUS_DISALLOWED = 0x0C
 
-    def _send_packet(self, packet):
+ADV_DATA_LEN = 31
+# largest data a single LE Set Extended / Periodic Advertising Data carries
+EXT_ADV_DATA_LEN = 251
+PERIODIC_ADV_DATA_LEN = 252
+
+
+def opcode(ogf, ocf):
+    return (ogf << 10) | ocf
+
+
+class HCIError(Exception):
+    """
+    A command the controller rejected (status != 0) or never answered.
+    """
+
+
+# ------------------------------------------------------------
+# Backends: how advertising commands reach the controller
+# ------------------------------------------------------------
+
+class HCISocketBackend:
+    """
+    One raw HCI socket, opened at start and kept for the whole run.
+    Needs CAP_NET_RAW (or root). `sock` may be any connected socket
+    speaking HCI packets, e.g. FakeHCI().connect().
+    """
+    name = "hci"
+
+    def __init__(self, device=0, sock=None, timeout=0.05):
+        self.device = device
+        self.timeout = timeout
+        self.sock = sock
+
+    def open(self):
+        if self.sock is None:
+            sock = socket.socket(AF_BLUETOOTH, socket.SOCK_RAW, BTPROTO_HCI)
+            # only Command Complete / Command Status events
+            event_mask = (1 << EVT_CMD_COMPLETE) | (1 << EVT_CMD_STATUS)
+            sock.setsockopt(SOL_HCI, HCI_FILTER,
+                            struct.pack("<IIIH", 1 << HCI_EVENT_PKT, event_mask, 0, 0))
+            sock.bind((self.device,))
+            self.sock = sock
+        self.sock.settimeout(self.timeout)
+
+    def close(self):
+        if self.sock is not None:
+            self.sock.close()
+            self.sock = None
+
+    def send_command(self, ogf, ocf, params=b""):
         """
-        Send BLE raw advertising packet using hcitool.
-        Uses timeout so it NEVER blocks.
+        Sends one HCI command and waits for its Command Complete (or
+        Command Status). Returns (status, return parameters).
+        Raises socket.timeout if the controller doesn't answer within
+        `timeout`, however many other events it sends meanwhile.
         """
+        op = opcode(ogf, ocf)
+        deadline = time.monotonic() + self.timeout
+        self.sock.settimeout(self.timeout)
+        self.sock.send(struct.pack("<BHB", HCI_COMMAND_PKT, op, len(params)) + params)
+        while True:
+            left = deadline - time.monotonic()
+            if left <= 0:
+                raise socket.timeout(f"no answer to HCI command 0x{op:04x}")
+            self.sock.settimeout(left)
+            event = self.sock.recv(260)
+            if len(event) < 3 or event[0] != HCI_EVENT_PKT:
+                continue
+            code = event[1]
+            if code == EVT_CMD_COMPLETE and len(event) >= 7:
+                if struct.unpack_from("<H", event, 4)[0] == op:
+                    return event[6], bytes(event[7:])
+            elif code == EVT_CMD_STATUS and len(event) >= 7:
+                if struct.unpack_from("<H", event, 5)[0] == op:
+                    return event[3], b""
 
-        # 1. Convert the bytes object 'packet' to a hex string
-        hexdata = packet.hex()
-        # print(f"Raw hexdata: {hexdata}")
+    def le_command(self, ocf, params, what, allowed=(0,)):
+        """
+        send_command() for an LE command; raises HCIError unless the
+        status is in `allowed`. Returns the return parameters.
+        """
+        status, ret = self.send_command(OGF_LE, ocf, params)
+        if status not in allowed:
+            raise HCIError(f"{what}: status 0x{status:02x}")
+        return ret
 
-        # 2. Calculate the length of the payload in bytes (each byte is 2 hex chars)
-        payload_length_bytes = len(hexdata) // 2
+    def set_adv_data(self, data):
+        params = bytes([len(data)]) + data.ljust(ADV_DATA_LEN, b"\x00")
+        self.le_command(OCF_LE_SET_ADV_DATA, params, "LE Set Advertising Data")
 
-        # 3. Format the length as a two-character hex string (e.g., '1f' for 31 bytes)
-        length_hex_str = format(payload_length_bytes, '02x')
+    def set_adv_enable(self, enable):
+        # 0x0C (command disallowed): already in the requested state
+        self.le_command(OCF_LE_SET_ADV_ENABLE, bytes([int(enable)]),
+                        "LE Set Advertising Enable", allowed=(0, STATUS_DISALLOWED))
 
-        # 4. Slice the hex data string into a list of 2-character strings (['02', '01', '06', ...])
-        payload_list = [hexdata[i:i+2] for i in range(0, len(hexdata), 2)]
+    def read_max_adv_data_len(self):
+        """
+        Extended advertising data the controller accepts, or None if it
+        only knows legacy advertising.
+        """
+        status, ret = self.send_command(OGF_LE, OCF_LE_READ_MAX_ADV_DATA_LEN)
+        if status or len(ret) < 2:
+            return None
+        return struct.unpack_from("<H", ret)[0]
 
-        # 5. Construct the full command list, inserting the length byte in the correct position
-        cmd = [
-            "sudo", "hcitool", "-i", "hci0",
-            "cmd", "0x08", "0x0008",
-            length_hex_str
-        ] + payload_list
-        
-        # Command Print
-        # print(f"Executing command: {' '.join(cmd)}")
 
+class HcitoolBackend:
+    """
+    The original path: one `sudo hcitool cmd` process per command.
+    Kept for setups where the raw socket isn't permitted.
+    """
+    name = "hcitool"
+
+    def __init__(self, device=0, timeout=0.05):
+        self.device = device
+        self.timeout = timeout
+
+    def open(self):
+        pass
+
+    def close(self):
+        pass
+
+    def _hcitool(self, ocf, params):
+        cmd = [
+            "sudo", "hcitool", "-i", f"hci{self.device}",
+            "cmd", f"0x{OGF_LE:02x}", f"0x{ocf:04x}",
+        ] + [format(b, "02x") for b in params]
         try:
-            # Use subprocess.run to execute the command with a timeout
             subprocess.run(
                 cmd,
-                timeout=0.05,
-                stdout=subprocess.DEVNULL,  # Suppress normal output
-                stderr=subprocess.DEVNULL,  # Suppress error output
-                check=True # Raise exception if command fails
-            )
-            cmd2 = "sudo", "hcitool", "-i", "hci0", "cmd", "0x08", "0x000a", "01"
-            subprocess.run(
-                cmd2,
-                timeout=0.05,
-                stdout=subprocess.DEVNULL,  # Suppress normal output
-                stderr=subprocess.DEVNULL,  # Suppress error output
-                check=True # Raise exception if command fails
+                timeout=self.timeout,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
+                check=True
             )
-            
         except subprocess.TimeoutExpired:
-            # This is expected behavior as hcitool might block slightly
-            # print("hcitool command timed out (expected).")
+            # hcitool may block slightly after the command went out
             pass
         except subprocess.CalledProcessError as e:
-            # Handle cases where hcitool fails, e.g., 'no device found'
-            print(f"hcitool command failed: {e}")
+            raise HCIError(f"hcitool command failed: {e}")
         except FileNotFoundError:
-            print("Error: 'hcitool' command not found. Ensure BlueZ is installed.")
+            raise HCIError("'hcitool' command not found. Ensure BlueZ is installed.")
+
+    def set_adv_data(self, data):
+        self._hcitool(OCF_LE_SET_ADV_DATA, bytes([len(data)]) + data)
+
+    def set_adv_enable(self, enable):
+        self._hcitool(OCF_LE_SET_ADV_ENABLE, bytes([int(enable)]))
+
+    def read_max_adv_data_len(self):
+        # hcitool's output isn't parsed, so extended mode can't be negotiated
+        return None
+
+
+class FakeHCI:
+    """
+    Local stand-in for a controller: answers HCI commands over a
+    socketpair, so HCISocketBackend runs its real framing code without
+    a radio. Keeps the last advertising data and every command it got.
+
+    With `extended` it also implements the Bluetooth 5 extended and
+    periodic advertising commands (one advertising set) and, like a
+    real controller, then refuses legacy commands once extended ones
+    were used.
+    """
+
+    def __init__(self, latency=0.0, extended=False, max_adv_data=1650):
+        self.latency = latency
+        self.extended = extended
+        self.max_adv_data = max_adv_data
+        self.commands = []
+        self.adv_data = b""
+        self.enabled = False
+        self.ext_adv_data = b""
+        self.ext_enabled = False
+        self.periodic_data = b""
+        self.periodic_enabled = False
+        self._mode = None       # "legacy" / "extended" once a command decided it
+        self._fail = deque()
+        self._sock = None
+        self._thread = None
+
+    def fail_next(self, count=1, status=0x0C):
+        """
+        The next `count` commands answer with `status` instead of success.
+        """
+        self._fail.extend([status] * count)
+
+    def connect(self):
+        ours, theirs = socket.socketpair(socket.AF_UNIX, socket.SOCK_SEQPACKET)
+        self._sock = ours
+        self._thread = threading.Thread(target=self._serve, daemon=True)
+        self._thread.start()
+        return theirs
+
+    def backend(self, **kwargs):
+        return HCISocketBackend(sock=self.connect(), **kwargs)
+
+    def handle(self, op, params):
+        """
+        Returns (status, return parameters) for one command.
+        """
+        ocf = op & 0x3FF
+        legacy = (OCF_LE_SET_ADV_DATA, OCF_LE_SET_ADV_ENABLE)
+        ext = (OCF_LE_SET_EXT_ADV_PARAMS, OCF_LE_SET_EXT_ADV_DATA, OCF_LE_SET_EXT_ADV_ENABLE,
+               OCF_LE_SET_PERIODIC_ADV_PARAMS, OCF_LE_SET_PERIODIC_ADV_DATA,
+               OCF_LE_SET_PERIODIC_ADV_ENABLE)
+        if op >> 10 == OGF_LE and ocf in ext + (OCF_LE_READ_MAX_ADV_DATA_LEN,):
+            if not self.extended:
+                return STATUS_UNKNOWN_COMMAND, b""
+        if op >> 10 == OGF_LE and (ocf in legacy or ocf in ext):
+            mode = "legacy" if ocf in legacy else "extended"
+            if self._mode is None:
+                self._mode = mode
+            elif self._mode != mode:
+                return STATUS_DISALLOWED, b""
+
+        if op == opcode(OGF_LE, OCF_LE_SET_ADV_DATA):
+            self.adv_data = bytes(params[1:1 + params[0]])
+        elif op == opcode(OGF_LE, OCF_LE_SET_ADV_ENABLE):
+            self.enabled = bool(params[0])
+        elif op == opcode(OGF_LE, OCF_LE_READ_MAX_ADV_DATA_LEN):
+            return 0, struct.pack("<H", self.max_adv_data)
+        elif op == opcode(OGF_LE, OCF_LE_SET_EXT_ADV_PARAMS):
+            return 0, b"\x00"      # selected TX power
+        elif op == opcode(OGF_LE, OCF_LE_SET_EXT_ADV_DATA):
+            data = bytes(params[4:4 + params[3]])
+            if len(data) > min(self.max_adv_data, EXT_ADV_DATA_LEN):
+                return 0x12, b""    # invalid parameters
+            self.ext_adv_data = data
+        elif op == opcode(OGF_LE, OCF_LE_SET_EXT_ADV_ENABLE):
+            self.ext_enabled = bool(params[0])
+        elif op == opcode(OGF_LE, OCF_LE_SET_PERIODIC_ADV_DATA):
+            data = bytes(params[3:3 + params[2]])
+            if len(data) > min(self.max_adv_data, PERIODIC_ADV_DATA_LEN):
+                return 0x12, b""
+            self.periodic_data = data
+        elif op == opcode(OGF_LE, OCF_LE_SET_PERIODIC_ADV_ENABLE):
+            self.periodic_enabled = bool(params[0])
+        return 0, b""
+
+    def _serve(self):
+        while True:
+            try:
+                packet = self._sock.recv(260)
+            except OSError:
+                break
+            if not packet:
+                break
+            if packet[0] != HCI_COMMAND_PKT or len(packet) < 4:
+                continue
+            op, plen = struct.unpack_from("<HB", packet, 1)
+            params = packet[4:4 + plen]
+            self.commands.append((op, params))
+            if self.latency:
+                time.sleep(self.latency)
+            if self._fail:
+                status, ret = self._fail.popleft(), b""
+            else:
+                status, ret = self.handle(op, params)
+            body = struct.pack("<BHB", 1, op, status) + ret
+            try:
+                self._sock.send(bytes([HCI_EVENT_PKT, EVT_CMD_COMPLETE, len(body)]) + body)
+            except OSError:
+                break
+        self._sock.close()
+
+
+BACKENDS = ("hci", "hcitool", "fake", "fake-ext")
+
+
+def make_backend(name, device=0):
+    if name == "hci":
+        return HCISocketBackend(device)
+    if name == "hcitool":
+        return HcitoolBackend(device)
+    if name == "fake":
+        return FakeHCI().backend()
+    if name == "fake-ext":
+        return FakeHCI(extended=True).backend()
+    raise ValueError(f"unknown BLE backend {name!r} (expected one of {BACKENDS})")
+
+
+# ------------------------------------------------------------
+# Advertising modes: what the payload is written with
+# ------------------------------------------------------------
+
+def _interval_units(seconds, unit, minimum):
+    return max(minimum, int(round(seconds / unit)))
+
+
+class LegacyMode:
+    """
+    31-byte legacy advertising (LE Set Advertising Data / Enable).
+    """
+    name = "legacy"
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.max_data = ADV_DATA_LEN
+
+    def start(self, static_data):
+        self.backend.set_adv_enable(True)
+
+    def write(self, data):
+        self.backend.set_adv_data(data)
+
+    def stop(self):
+        self.backend.set_adv_enable(False)
+
+
+class ExtendedMode:
+    """
+    One non-connectable, non-scannable extended advertising set; the
+    payload is its advertising data (up to 251 bytes per command).
+    """
+    name = "extended"
+    handle = 0
+
+    def __init__(self, backend, max_data, interval=0.1):
+        self.backend = backend
+        self.max_data = min(max_data, EXT_ADV_DATA_LEN)
+        self.interval = interval
+
+    def _set_params(self):
+        n = _interval_units(self.interval, 0.000625, 0x20).to_bytes(3, "little")
+        params = (
+            struct.pack("<BH", self.handle, 0x0000)     # extended, non-connectable
+            + n + n                                     # primary interval min / max
+            + bytes([0x07, 0x00, 0x00]) + bytes(6)      # all channels, public addr, no peer
+            + bytes([0x00, 0x7F, 0x01, 0x00, 0x01, 0x00, 0x00])
+            # filter, TX power: no preference, 1M primary PHY, skip 0,
+            # 1M secondary PHY, SID 0, no scan request notifications
+        )
+        self.backend.le_command(OCF_LE_SET_EXT_ADV_PARAMS, params,
+                                "LE Set Extended Advertising Parameters")
+
+    def _set_data(self, data):
+        # operation 0x03: complete data, 0x01: controller shouldn't fragment
+        self.backend.le_command(OCF_LE_SET_EXT_ADV_DATA,
+                                bytes([self.handle, 0x03, 0x01, len(data)]) + data,
+                                "LE Set Extended Advertising Data")
+
+    def _set_enable(self, enable):
+        self.backend.le_command(OCF_LE_SET_EXT_ADV_ENABLE,
+                                bytes([int(enable), 1, self.handle, 0, 0, 0]),
+                                "LE Set Extended Advertising Enable",
+                                allowed=(0, STATUS_DISALLOWED))
 
+    def start(self, static_data):
+        self._set_params()
+        self._set_enable(True)
+
+    def write(self, data):
+        self._set_data(data)
+
+    def stop(self):
+        self._set_enable(False)
+
+
+class PeriodicMode(ExtendedMode):
+    """
+    Periodic advertising on top of an extended set: the set only
+    carries the static data (flags, name) for scanners to find and sync
+    to, the payload goes into the periodic advertising data.
+    """
+    name = "periodic"
+
+    def __init__(self, backend, max_data, interval=0.1, periodic_interval=0.05):
+        super().__init__(backend, max_data, interval)
+        self.max_data = min(max_data, PERIODIC_ADV_DATA_LEN)
+        self.periodic_interval = periodic_interval
+
+    def start(self, static_data):
+        self._set_params()
+        self._set_data(static_data)
+        n = _interval_units(self.periodic_interval, 0.00125, 0x06)
+        self.backend.le_command(OCF_LE_SET_PERIODIC_ADV_PARAMS,
+                                struct.pack("<BHHH", self.handle, n, n, 0),
+                                "LE Set Periodic Advertising Parameters")
+        self.backend.le_command(OCF_LE_SET_PERIODIC_ADV_ENABLE, bytes([1, self.handle]),
+                                "LE Set Periodic Advertising Enable")
+        self._set_enable(True)
+
+    def write(self, data):
+        self.backend.le_command(OCF_LE_SET_PERIODIC_ADV_DATA,
+                                bytes([self.handle, 0x03, len(data)]) + data,
+                                "LE Set Periodic Advertising Data")
+
+    def stop(self):
+        self.backend.le_command(OCF_LE_SET_PERIODIC_ADV_ENABLE, bytes([0, self.handle]),
+                                "LE Set Periodic Advertising Enable",
+                                allowed=(0, STATUS_DISALLOWED))
+        self._set_enable(False)
+
+
+MODES = ("legacy", "auto", "extended", "periodic")
+
+
+def negotiate_mode(backend, requested="auto"):
+    """
+    Picks the advertising mode: extended/periodic if asked for (or
+    "auto") and the controller reports more than 31 bytes of advertising
+    data via LE Read Maximum Advertising Data Length, legacy otherwise.
+    """
+    if requested == "legacy":
+        return LegacyMode(backend)
+    try:
+        max_len = backend.read_max_adv_data_len()
+    except (HCIError, OSError):
+        max_len = None
+    if max_len is None or max_len <= ADV_DATA_LEN:
+        if requested != "auto":
+            log.warning("BLE controller has no extended advertising, %s -> legacy", requested)
+        return LegacyMode(backend)
+    if requested == "periodic":
+        return PeriodicMode(backend, max_len)
+    return ExtendedMode(backend, max_len)
+
+
+# ------------------------------------------------------------
+# Scheduler: when to rebuild the packet
+# ------------------------------------------------------------
+
+class PayloadScheduler:
+    """
+    Wakes the advertiser on events instead of a fixed poll.
+
+    Producers call notify() for a bounce, goal, ...; the advertiser thread
+    blocks in wait() until
+      - an event is pending and `min_interval` has passed since the last
+        update (events inside that window are coalesced into one update),
+      - an urgent event is pending (goal, bounce buffer full), or
+      - `max_staleness` has passed without any update.
+    sent() records the event-to-air latency per event kind.
+    """
+
+    def __init__(self, min_interval=0.02, max_staleness=1.0):
+        self.min_interval = min_interval
+        self.max_staleness = max_staleness
+        self._cond = threading.Condition()
+        self._events = []   # (kind, perf_counter time) not yet on air
+        self._urgent = False
+        self._closed = False
+        self._last = time.perf_counter()
+
+        # counters
+        self.wakeups = 0
+        self.coalesced = 0
+        self.refreshes = 0
+        self.latencies = {}   # kind -> deque of seconds
+
+    def notify(self, kind="bounce", urgent=False):
+        t = time.perf_counter()
+        with self._cond:
+            self._events.append((kind, t))
+            if urgent:
+                self._urgent = True
+            self._cond.notify()
+
+    def wait(self):
+        """
+        Blocks until the next update is due. Returns the events it covers
+        ([] for a staleness refresh), or None once closed.
+        """
+        with self._cond:
+            while not self._closed:
+                now = time.perf_counter()
+                if self._urgent:
+                    due = now
+                elif self._events:
+                    due = self._last + self.min_interval
+                else:
+                    due = self._last + self.max_staleness
+                if now >= due:
+                    events = self._events
+                    self._events = []
+                    self._urgent = False
+                    self._last = now
+                    self.wakeups += 1
+                    if events:
+                        self.coalesced += len(events) - 1
+                    else:
+                        self.refreshes += 1
+                    return events
+                self._cond.wait(due - now)
+            return None
+
+    def sent(self, events):
+        """
+        The update covering `events` is on air.
+        """
+        now = time.perf_counter()
+        for kind, t in events:
+            if kind not in self.latencies:
+                self.latencies[kind] = deque(maxlen=1024)
+            self.latencies[kind].append(now - t)
+
+    def requeue(self, events):
+        """
+        The update failed: retry `events` after the next interval.
+        """
+        with self._cond:
+            self._events[:0] = events
+            self._cond.notify()
+
+    def open(self):
+        with self._cond:
+            self._closed = False
+            self._last = time.perf_counter()
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+
+    def stats(self):
+        out = {
+            "wakeups": self.wakeups,
+            "coalesced": self.coalesced,
+            "refreshes": self.refreshes,
+        }
+        # the advertiser thread may add a kind meanwhile: iterate a copy
+        # (list()/sorted() copy in one C call, under the GIL)
+        for kind, lat in list(self.latencies.items()):
+            lat = sorted(lat)
+            out[f"{kind}_to_air_p50_ms"] = lat[len(lat) // 2] * 1e3
+            out[f"{kind}_to_air_max_ms"] = lat[-1] * 1e3
+        return out
+
+
+# ------------------------------------------------------------
+# Advertiser
+# ------------------------------------------------------------
+
+class BLAAdvertiser:
+    def __init__(self, interval=1, backend="hci", device=0, min_interval=0.02,
+                 buffer=None, payload_version=2, name=None, mode="legacy"):
+        """
+        interval:        longest time the packet on air may go without a rebuild
+        min_interval:    events closer together than this share one update
+        buffer:          BLAEventBuffer to advertise (default: BLAData's)
+        payload_version: legacy mode: 2 (delta-coded, manufacturer data, sequence
+                         numbers) or 1 (raw after the name, no sequence numbers,
+                         for old receivers); extended/periodic always use 3
+        name:            v2/v3: local name to include, shortened, or None
+        mode:            legacy | auto | extended | periodic, negotiated in start()
+        """
+        self.legacy_version = payload_version
+        self.name = name
+        self.requested_mode = mode
+        self.buffer = buffer if buffer is not None else BLAData.default
+        self.interval = interval
+        self.running = False
+        self.thread = None
+        if isinstance(backend, str):
+            backend = make_backend(backend, device)
+        self.backend = backend
+        self.scheduler = PayloadScheduler(min_interval, max_staleness=interval)
+
+        # last data the controller accepted; only changes are written
+        self._current = None
+        # packet whose write failed; resent before anything new is built
+        self._retry = None
+        # v2/v3 sequencing: last payload, its sequence number and first bounce
+        self._payload = None
+        self._seq = 0
+        self._first = 0
+
+        # counters
+        self.updates = 0
+        self.unchanged = 0
+        self.failures = 0
+        self.last_error = None
+        self.latencies = deque(maxlen=1024)   # seconds per successful update
+        self.pack_times = Histogram()         # seconds per payload build
+
+        # legacy until start() negotiated something else
+        self._configure(LegacyMode(backend))
+
+    def _configure(self, mode):
+        self.mode = mode
+        if mode.name == "legacy":
+            self.payload_version = self.legacy_version
+        else:
+            self.payload_version = 3
+
+        if self.payload_version == 1:
+            # BLE header for Legacy ADV
+            self.header = bytes.fromhex(
+                "020106"            # flags (Length:2, Type:01 "Flags", Data:06 "LE General Discoverable")
+                "09"                # Name Length
+                "09"                # Name Type 9 = ASCII
+                "6b696b69636b6572"  # Name in Hex ASCII "kikicker"
+            )
+        else:
+            # flags + optional name; the payload goes into a manufacturer-data AD
+            self.header = adv_header(self.payload_version, self.name)
+        # periodic data carries only the payload, the name stays in the set's data
+        self._prefix = b"" if mode.name == "periodic" else self.header
+        # max BLE payload: 31 - len(header) (- manufacturer-data framing)
+        self.max_payload = payload_room(self._prefix, self.payload_version, mode.max_data,
+                                        sequenced=True)
+        # bounces that always fit into one packet
+        self.capacity = capacity(self.max_payload, min(self.payload_version, 2))
+
+    @property
+    def extended(self):
+        """
+        True once start() negotiated extended or periodic advertising.
+        """
+        return self.mode.name != "legacy"
+
+    # ------------------------------------------------------------
+
+    def _build_packet(self):
+        t0 = time.perf_counter()
+        payload = self.buffer.consume_for_packet(self.max_payload, self.payload_version)
+        self.pack_times.record(time.perf_counter() - t0)
+        if payload != self._payload or self.buffer.first_bounce != self._first:
+            # new content, new sequence number; a repeat keeps its bytes
+            self._payload = payload
+            self._seq = (self._seq + 1) & 0xFF
+            self._first = self.buffer.first_bounce
+        return frame_payload(self._prefix, payload, self.payload_version,
+                             seq=self._seq, first=self._first)
+
+    def notify(self, kind="bounce"):
+        """
+        Called by the vision loop after it changed the buffer.
+        Goals and a full bounce buffer skip the coalescing window.
+        """
+        urgent = kind == "goal" or self.buffer.pending_bounces() >= self.capacity
+        self.scheduler.notify(kind, urgent)
+
+    # ------------------------------------------------------------
+
+    def _send_packet(self, packet):
+        """
+        Writes the advertising data if it differs from what is on air.
+        Returns True if the controller now advertises `packet`.
+        """
+        if packet == self._current:
+            self.unchanged += 1
+            return True
+
+        t0 = time.perf_counter()
+        try:
+            self.mode.write(packet)
+        except (HCIError, OSError) as e:
+            # report the first failure of a streak, count all of them
+            if self.last_error is None:
+                log.warning("BLE advertising update failed: %s", e)
+            self.failures += 1
+            self.last_error = e
+            return False
+
+        self.latencies.append(time.perf_counter() - t0)
+        self.updates += 1
+        self.last_error = None
+        self._current = packet
+        return True
+
+    def stats(self):
+        lat = sorted(self.latencies)
+        n = len(lat)
+        return {
+            "backend": self.backend.name,
+            "mode": self.mode.name,
+            "updates": self.updates,
+            "unchanged": self.unchanged,
+            "failures": self.failures,
+            "latency_p50_ms": lat[n // 2] * 1e3 if n else None,
+            "latency_p99_ms": lat[min(n - 1, n * 99 // 100)] * 1e3 if n else None,
+            "latency_max_ms": lat[-1] * 1e3 if n else None,
+            "dropped_bounces": self.buffer.dropped,
+            **self.scheduler.stats(),
+        }
 
     # ------------------------------------------------------------
 
     def _loop(self):
         while self.running:
-            packet = self._build_packet()
+            events = self.scheduler.wait()
+            if events is None:
+                break
 
-            self._send_packet(packet)
-            time.sleep(self.interval)
+            packet = self._retry if self._retry is not None else self._build_packet()
+            if self._send_packet(packet):
+                self._retry = None
+                self.scheduler.sent(events)
+                # bounces that didn't fit go out in the next window
+                if self.buffer.pending_bounces():
+                    self.scheduler.notify("backlog")
+            else:
+                self._retry = packet
+                self.scheduler.requeue(events)
 
 
     # ------------------------------------------------------------
@@ -103,14 +746,29 @@ class BLAAdvertiser:
     def start(self):
         if self.running:
             return
+        self.backend.open()
+        self._current = None
+        self._configure(negotiate_mode(self.backend, self.requested_mode))
+        try:
+            self.mode.start(self.header)
+        except (HCIError, OSError) as e:
+            log.error("BLE advertising enable failed: %s", e)
+            self.failures += 1
         self.running = True
+        self.scheduler.open()
         self.thread = threading.Thread(target=self._loop, daemon=True)
         self.thread.start()
 
     def stop(self):
         self.running = False
+        self.scheduler.close()
         if self.thread:
             self.thread.join(timeout=1.0)
+        try:
+            self.mode.stop()
+        except (HCIError, OSError):
+            pass
+        self.backend.close()
 
 
 # testing
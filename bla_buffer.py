@@ -1,133 +1,256 @@
 # bla_buffer.py
-import threading
-from collections import deque
+from bla_codec import Bounce, ENCODERS
 
 
-class Bounce:
-    __slots__ = ("angle", "speed", "frame", "quad")
+class SPSCRing:
+    """
+    Bounded single-producer/single-consumer ring, no lock on either side.
 
-    def __init__(self, angle, speed, frame, quad):
-        self.angle = angle & 0xFF
-        self.speed = speed & 0xFF
-        self.frame = frame & 0x7F
-        self.quad = quad & 0x0F
+    The producer only ever moves `_head`, the consumer only `_tail`;
+    when the producer laps the consumer the oldest items are lost,
+    which the consumer notices and counts in `dropped`.
+    Relies on single attribute reads/writes being atomic (CPython GIL).
+    """
 
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self._ring = [None] * capacity
+        self._head = 0      # producer: total items ever added
+        self._tail = 0      # consumer: total items consumed or dropped
+        self.dropped = 0
 
-class BLAData:
+    def add(self, item):
+        head = self._head
+        self._ring[head % self.capacity] = item
+        # publish only after the slot is written
+        self._head = head + 1
+
+    @property
+    def tail(self):
+        """
+        Stream index (items ever added before it) of the oldest item
+        the last peek() returned. Consumer side only.
+        """
+        return self._tail
+
+    def pending(self):
+        return min(self._head - self._tail, self.capacity)
+
+    def peek(self, limit):
+        """
+        Up to `limit` of the oldest items, left in the ring until advance().
+        """
+        head = self._head
+        tail = self._tail
+        size = self.capacity
+        if head - tail > size:
+            self.dropped += head - tail - size
+            tail = head - size
+
+        end = min(head, tail + limit)
+        items = [self._ring[i % size] for i in range(tail, end)]
+
+        # slots the producer may have overwritten while we read them:
+        # it writes slot j + size (== j) while its head is still j + size
+        lapped = self._head - size - tail + 1
+        if lapped > 0:
+            lapped = min(lapped, len(items))
+            self.dropped += lapped
+            del items[:lapped]
+            tail += lapped
+
+        self._tail = tail
+        return items
+
+    def advance(self, count):
+        """
+        Removes `count` items returned by the last peek().
+        """
+        self._tail += count
+
+    def take(self, limit):
+        items = self.peek(limit)
+        self.advance(len(items))
+        return items
+
+    def reset(self):
+        """
+        Only call while neither side is running.
+        """
+        self._ring = [None] * self.capacity
+        self._head = self._tail = 0
+        self.dropped = 0
+
+
+class BLAEventBuffer:
     """
-    Global buffer accessible from main.
-    Thread-safe.
+    Events from the vision thread (producer) for the advertiser thread
+    (consumer), without a lock on either side.
+
+    Bounces (and, for extended advertising, position samples) go
+    through bounded SPSC rings that drop the oldest entries when full.
+
+    Goal and initial coordinate are one tuple that the producer replaces
+    as a whole, so the consumer always reads a consistent snapshot. How
+    long a goal stays in the payload (`goal_cycles` packets) is tracked
+    by the consumer alone.
     """
-    lock = threading.Lock()
 
-    # persistent goal info
-    _goal_player = 0
-    _goal_counter = 0   # how many cycles left to keep it
+    def __init__(self, capacity=64, goal_cycles=5, position_capacity=256):
+        self.capacity = capacity
+        self.goal_cycles = goal_cycles
+        self._bounces = SPSCRing(capacity)
+        self._positions = SPSCRing(position_capacity)
 
-    # current initial coordinate
-    _initial_x = 0
-    _initial_y = 0
+        # producer side
+        # (goal count, last goal player, initial x, initial y)
+        self._state = (0, 0, 0, 0)
 
-    # queue of pending bounces
-    _bounces = deque()
+        # consumer side
+        self._goal_seen = 0
+        self._goal_player = 0
+        self._goal_left = 0
+        self._encoders = {}
+        self.first_bounce = 0
 
-    @staticmethod
-    def set_initial_coord(x, y):
-        with BLAData.lock:
-            BLAData._initial_x = x & 0x7F
-            BLAData._initial_y = y & 0x3F
+    @property
+    def dropped(self):
+        return self._bounces.dropped
 
-    @staticmethod
-    def push_goal(player_id):
+    @property
+    def positions_dropped(self):
+        return self._positions.dropped
+
+    # ------------------------------------------------------------
+    # producer
+    # ------------------------------------------------------------
+
+    def add_bounce(self, bounce):
+        self._bounces.add(bounce)
+
+    def add_position(self, frame, x, y):
+        """
+        One ball position sample (quantized 7/6-bit field coordinates).
+        Only extended-advertising payloads carry them.
+        """
+        self._positions.add((frame & 0x7F, x & 0x7F, y & 0x3F))
+
+    def set_initial_coord(self, x, y):
+        goals, player, _, _ = self._state
+        self._state = (goals, player, x & 0x7F, y & 0x3F)
+
+    def push_goal(self, player_id):
         """
         1 = left player scored
         2 = right player scored
         """
-        with BLAData.lock:
-            BLAData._goal_player = player_id & 0x03
-            BLAData._goal_counter = 5  # keep for 5 advertising cycles
+        goals, _, x, y = self._state
+        self._state = (goals + 1, player_id & 0x03, x, y)
+
+    # ------------------------------------------------------------
+    # consumer
+    # ------------------------------------------------------------
+
+    def pending_bounces(self):
+        return self._bounces.pending()
+
+    def pending_positions(self):
+        return self._positions.pending()
+
+    def take_bounces(self, limit):
+        """
+        Removes and returns up to `limit` of the oldest bounces.
+        """
+        return self._bounces.take(limit)
+
+    def goal_bits(self):
+        """
+        Goal field for the next packet; counts down the goal's cycles.
+        """
+        goals, player, _, _ = self._state
+        if goals != self._goal_seen:
+            self._goal_seen = goals
+            self._goal_player = player
+            self._goal_left = self.goal_cycles
+        if self._goal_left == 0:
+            return 0
+        self._goal_left -= 1
+        return self._goal_player
+
+    def consume_for_packet(self, max_payload_bytes, version=1):
+        """
+        Payload `version` for the next packet, packed by the matching
+        bla_codec encoder (ENCODERS): BLAEncoder (v1, fixed 27-bit
+        bounces), BLAEncoderV2 (delta-coded bounces) or BLAEncoderV3
+        (v2 plus position samples, extended advertising only); the bit
+        layouts are documented there.
+
+        Consumes as many bounces (and samples) as fit into
+        `max_payload_bytes` and returns the packed payload bytes;
+        `first_bounce` is then the stream index of the first bounce in it.
+        """
+        key = (version, max_payload_bytes)
+        encoder = self._encoders.get(key)
+        if encoder is None:
+            encoder = self._encoders[key] = ENCODERS[version](max_payload_bytes)
+
+        goal = self.goal_bits()
+        _, _, init_x, init_y = self._state
+        bounces = self._bounces.peek(encoder.max_bounces)
+        # stream index of bounces[0], for receivers' gap detection
+        self.first_bounce = self._bounces.tail
+        if version >= 3:
+            positions = self._positions.peek(encoder.max_positions)
+            payload = bytes(encoder.encode(goal, init_x, init_y, bounces, positions))
+            self._positions.advance(encoder.position_count)
+        else:
+            payload = bytes(encoder.encode(goal, init_x, init_y, bounces))
+        self._bounces.advance(encoder.count)
+        return payload
+
+    def reset(self):
+        """
+        Forgets everything. Only call while neither side is running.
+        """
+        self._bounces.reset()
+        self._positions.reset()
+        self._state = (0, 0, 0, 0)
+        self._goal_seen = self._goal_player = self._goal_left = 0
+        self.first_bounce = 0
+
+
+class BLAData:
+    """
+    Process-wide default buffer accessible from main.
+    Static facade over BLAData.default (a BLAEventBuffer); give each
+    table / advertiser its own BLAEventBuffer to run several at once.
+    """
+    default = BLAEventBuffer()
+
+    @staticmethod
+    def set_initial_coord(x, y):
+        BLAData.default.set_initial_coord(x, y)
+
+    @staticmethod
+    def push_goal(player_id):
+        BLAData.default.push_goal(player_id)
 
     @staticmethod
     def add_bounce(bounce):
-        with BLAData.lock:
-            BLAData._bounces.append(bounce)
+        BLAData.default.add_bounce(bounce)
+
+    @staticmethod
+    def add_position(frame, x, y):
+        BLAData.default.add_position(frame, x, y)
+
+    @staticmethod
+    def pending_bounces():
+        return BLAData.default.pending_bounces()
+
+    @staticmethod
+    def consume_for_packet(max_payload_bytes, version=1):
+        return BLAData.default.consume_for_packet(max_payload_bytes, version)
 
     @staticmethod
-    def consume_for_packet(max_payload_bytes):
-        """
-        Build a bit-packed payload from the global buffer according to the
-        BLA specification:
-
-        - 2 bits: goal (0=no goal, 1=left, 2=right)
-        - 7 bits: initial X (0..127)
-        - 6 bits: initial Y (0..63)
-        - For each bounce (until payload full):
-            - 8 bits angle
-            - 8 bits speed
-            - 7 bits frame
-            - 4 bits quadrant
-
-        The function consumes as many bounces from the deque as fit into
-        `max_payload_bytes` and returns the packed payload bytes.
-        """
-        with BLAData.lock:
-            # goal bits decay
-            goal_bits = BLAData._goal_player
-            if BLAData._goal_counter > 0:
-                BLAData._goal_counter -= 1
-                if BLAData._goal_counter == 0:
-                    BLAData._goal_player = 0
-
-            init_x = BLAData._initial_x & 0x7F
-            init_y = BLAData._initial_y & 0x3F
-
-            # Bit-accumulator (MSB-first)
-            acc = 0
-            bits = 0
-
-            def append_bits(value: int, nbits: int):
-                nonlocal acc, bits
-                acc = (acc << nbits) | (value & ((1 << nbits) - 1))
-                bits += nbits
-
-            # Append header fields
-            append_bits(goal_bits & 0x03, 2)
-            append_bits(init_x, 7)
-            append_bits(init_y, 6)
-
-            # Helper to compute current byte length if we append extra bits
-            def byte_length_if(extra_bits: int) -> int:
-                total = bits + extra_bits
-                pad = (8 - (total % 8)) % 8
-                return (total + pad) // 8
-
-            # Collect how many bounces we will consume
-            to_consume = 0
-            # Iterate over bounces without popping; check if each fits
-            for b in list(BLAData._bounces):
-                extra = 8 + 8 + 7 + 4  # 27 bits per bounce
-                if byte_length_if(extra) <= max_payload_bytes:
-                    # accept this bounce
-                    append_bits(b.angle & 0xFF, 8)
-                    append_bits(b.speed & 0xFF, 8)
-                    append_bits(b.frame & 0x7F, 7)
-                    append_bits(b.quad & 0x0F, 4)
-                    to_consume += 1
-                else:
-                    break
-
-            # Actually pop the consumed bounces from the deque
-            for _ in range(to_consume):
-                BLAData._bounces.popleft()
-
-            # Pad to full bytes (MSB-first)
-            pad = (8 - (bits % 8)) % 8
-            if pad:
-                acc = acc << pad
-                bits += pad
-
-            total_bytes = bits // 8
-            if total_bytes == 0:
-                return bytes()
-            payload = acc.to_bytes(total_bytes, byteorder='big')
-            return payload
+    def reset():
+        BLAData.default.reset()
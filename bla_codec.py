@@ -0,0 +1,496 @@
+# bla_codec.py
+"""
+BLA payload format (v1). This is what receivers decode.
+
+All fields are unsigned, packed MSB-first, the last byte zero-padded:
+
+    bits  field
+    2     goal        0 = none, 1 = left player scored, 2 = right player scored
+    7     initial x   0..127
+    6     initial y   0..63
+    then per bounce (27 bits each):
+    8     angle       direction the ball leaves in, 256 steps per turn
+    8     speed       0.05 m/s steps (see spped_compute)
+    7     frame       frame number & 0x7F
+    4     quadrant    0..15
+
+A payload with n bounces is ceil((15 + 27 n) / 8) bytes; since the
+padding is below 8 bits, n = (8 * len - 15) // 27 when decoding.
+
+v1 is appended raw after the complete local name "kikicker".
+
+BLA payload format v2: carried in a manufacturer-specific AD structure
+(type 0xFF, company 0xFFFF) whose first byte is the version (2), so it
+can't be confused with v1 and leaves room for a short or no name.
+If bit 7 of the version byte is set, two more bytes follow it: the
+packet sequence number and the stream index of the packet's first
+bounce (both mod 256), for gap detection on the receiver.
+Packed MSB-first, zero-padded:
+
+    bits  field
+    2     goal
+    7     initial x
+    6     initial y
+    4     bounce count n (0..15)
+    27    first bounce, same fields as v1
+    then per further bounce, relative to the one before:
+    eg2   frame delta      (frame - prev - 3) mod 128
+    1     quadrant         0: same quadrant as the bounce before (a run)
+    / 1+4                  1 + the quadrant
+    8     angle            as in v1
+    8     speed            as in v1
+
+egK is the order-K Exp-Golomb code of v >= 0: with w = v + 2**K and
+m = w.bit_length(), m - K - 1 zero bits followed by w in m bits.
+Bounces are at least V2_MIN_GAP frames apart (BounceDetector's
+min_frames_boundary) and rarely more than a few dozen, so the frame
+delta mostly takes 3 to 7 bits instead of 7. Speed and angle are sent whole: the
+ball leaves a bounce in a new direction at a new speed, and a delta or
+a predicted value is no shorter on average than the 8 bits themselves.
+
+BLA payload format v3, for extended/periodic advertising (same
+manufacturer-data framing, version byte 3), adds ball position samples:
+
+    bytes
+    1     L, length of the bounce section
+    L     bounce section, a v2 body
+    1     m, number of position samples
+    then bits, MSB-first, zero-padded:
+    7+7+6 first sample: frame, x (0..127), y (0..63)
+    eg0   per further sample: (frame - prev - 1) mod 128
+    7+6   x, y
+"""
+
+HEADER_BITS = 2 + 7 + 6
+BOUNCE_BITS = 8 + 8 + 7 + 4
+
+V2_HEADER_BITS = HEADER_BITS + 4
+V2_MAX_BOUNCES = 15
+# frame deltas are coded from here up (shorter deltas still fit, in 13 bits)
+V2_MIN_GAP = 3
+# longest delta code: frame eg2(127) 13 + quadrant 5 + angle 8 + speed 8
+V2_MAX_DELTA_BITS = 34
+
+NAME = b"kikicker"
+AD_FLAGS = bytes.fromhex("020106")      # LE General Discoverable, BR/EDR not supported
+AD_COMPLETE_NAME = 0x09
+AD_SHORT_NAME = 0x08
+AD_MANUFACTURER = 0xFF
+COMPANY_ID = 0xFFFF                     # reserved for testing, no SIG member ID
+
+
+class Bounce:
+    __slots__ = ("angle", "speed", "frame", "quad")
+
+    def __init__(self, angle, speed, frame, quad):
+        self.angle = angle & 0xFF
+        self.speed = speed & 0xFF
+        self.frame = frame & 0x7F
+        self.quad = quad & 0x0F
+
+    def __eq__(self, other):
+        return (isinstance(other, Bounce) and
+                (self.angle, self.speed, self.frame, self.quad) ==
+                (other.angle, other.speed, other.frame, other.quad))
+
+    def __repr__(self):
+        return f"Bounce(angle={self.angle}, speed={self.speed}, frame={self.frame}, quad={self.quad})"
+
+
+def capacity(max_payload, version=1):
+    """
+    Number of bounces that always fit into `max_payload` bytes
+    (for v2 assuming every delta takes its longest code).
+    """
+    if version == 1:
+        return max(0, (max_payload * 8 - HEADER_BITS) // BOUNCE_BITS)
+    room = max_payload * 8 - V2_HEADER_BITS - BOUNCE_BITS
+    if room < 0:
+        return 0
+    return min(V2_MAX_BOUNCES, 1 + room // V2_MAX_DELTA_BITS)
+
+
+def encoded_length(bounce_count):
+    return (HEADER_BITS + BOUNCE_BITS * bounce_count + 7) // 8
+
+
+class BLAEncoder:
+    """
+    Packs payloads for one `max_payload` into a preallocated buffer.
+    """
+
+    def __init__(self, max_payload):
+        self.max_payload = max_payload
+        self.capacity = capacity(max_payload)
+        self.max_bounces = self.capacity
+        self.count = 0      # bounces encoded by the last call
+        self._buf = bytearray(max_payload)
+        self._view = memoryview(self._buf)
+
+    def encode(self, goal, init_x, init_y, bounces):
+        """
+        Encodes the header and the first `capacity` bounces. Returns a
+        memoryview into the internal buffer, valid until the next call.
+        """
+        acc = ((goal & 0x03) << 13) | ((init_x & 0x7F) << 6) | (init_y & 0x3F)
+        n = 0
+        for b in bounces:
+            if n == self.capacity:
+                break
+            acc = ((acc << 27) | ((b.angle & 0xFF) << 19) | ((b.speed & 0xFF) << 11) |
+                   ((b.frame & 0x7F) << 4) | (b.quad & 0x0F))
+            n += 1
+        self.count = n
+
+        bits = HEADER_BITS + BOUNCE_BITS * n
+        length = (bits + 7) >> 3
+        self._buf[:length] = (acc << (length * 8 - bits)).to_bytes(length, "big")
+        return self._view[:length]
+
+
+def encode(goal, init_x, init_y, bounces, max_payload):
+    """
+    One-off encode; returns bytes. Bounces beyond the capacity are ignored.
+    """
+    return bytes(BLAEncoder(max_payload).encode(goal, init_x, init_y, bounces))
+
+
+def decode(data):
+    """
+    Returns (goal, init_x, init_y, [Bounce, ...]).
+    Raises ValueError if `data` is too short for the header.
+    """
+    total = len(data) * 8
+    if total < HEADER_BITS:
+        raise ValueError(f"BLA payload too short: {len(data)} bytes")
+    n = (total - HEADER_BITS) // BOUNCE_BITS
+    acc = int.from_bytes(data, "big") >> (total - HEADER_BITS - BOUNCE_BITS * n)
+
+    bounces = [None] * n
+    for i in range(n - 1, -1, -1):
+        bounces[i] = Bounce((acc >> 19) & 0xFF, (acc >> 11) & 0xFF,
+                            (acc >> 4) & 0x7F, acc & 0x0F)
+        acc >>= BOUNCE_BITS
+    return (acc >> 13) & 0x03, (acc >> 6) & 0x7F, acc & 0x3F, bounces
+
+
+# ------------------------------------------------------------
+# v2
+# ------------------------------------------------------------
+
+def _eg(value, k):
+    # (code, length) of the order-k Exp-Golomb code
+    w = value + (1 << k)
+    m = w.bit_length()
+    return w, 2 * m - k - 1
+
+
+def _delta_fields(b, prev):
+    """
+    (code, length) of bounce b relative to prev, as one bit string.
+    """
+    code, bits = _eg((b.frame - prev.frame - V2_MIN_GAP) & 0x7F, 2)
+    if b.quad == prev.quad:
+        code <<= 1
+        bits += 1
+    else:
+        code = (code << 5) | 0x10 | b.quad
+        bits += 5
+    return (code << 16) | (b.angle << 8) | b.speed, bits + 16
+
+
+class BLAEncoderV2:
+    """
+    v2 packer for a `max_payload`-byte body; fits as many bounces as
+    their variable-width codes allow (at most V2_MAX_BOUNCES).
+    """
+
+    def __init__(self, max_payload):
+        self.max_payload = max_payload
+        self.max_bounces = V2_MAX_BOUNCES
+        self.count = 0
+        self._buf = bytearray(max_payload)
+        self._view = memoryview(self._buf)
+
+    def encode(self, goal, init_x, init_y, bounces):
+        """
+        Returns a memoryview into the internal buffer (valid until the
+        next call); self.count is the number of bounces that fit.
+        """
+        budget = self.max_payload * 8
+        body = 0
+        bits = 0
+        n = 0
+        prev = None
+        for b in bounces:
+            if n == V2_MAX_BOUNCES:
+                break
+            if prev is None:
+                code = (((b.angle & 0xFF) << 19) | ((b.speed & 0xFF) << 11) |
+                        ((b.frame & 0x7F) << 4) | (b.quad & 0x0F))
+                length = BOUNCE_BITS
+            else:
+                code, length = _delta_fields(b, prev)
+            if V2_HEADER_BITS + bits + length > budget:
+                break
+            body = (body << length) | code
+            bits += length
+            prev = b
+            n += 1
+        self.count = n
+
+        acc = ((goal & 0x03) << 17) | ((init_x & 0x7F) << 10) | ((init_y & 0x3F) << 4) | n
+        acc = (acc << bits) | body
+        bits += V2_HEADER_BITS
+        length = (bits + 7) >> 3
+        self._buf[:length] = (acc << (length * 8 - bits)).to_bytes(length, "big")
+        return self._view[:length]
+
+
+class _BitReader:
+    __slots__ = ("value", "left")
+
+    def __init__(self, data):
+        self.value = int.from_bytes(data, "big")
+        self.left = len(data) * 8
+
+    def read(self, n):
+        if n > self.left:
+            raise ValueError("BLA v2 payload truncated")
+        self.left -= n
+        return (self.value >> self.left) & ((1 << n) - 1)
+
+    def read_eg(self, k):
+        zeros = 0
+        while not self.read(1):
+            zeros += 1
+        # the 1 just read is the top bit of w
+        w = (1 << (zeros + k)) | self.read(zeros + k)
+        return w - (1 << k)
+
+
+def decode_v2(data):
+    """
+    Returns (goal, init_x, init_y, [Bounce, ...]) for a v2 body.
+    Raises ValueError if it is truncated.
+    """
+    r = _BitReader(data)
+    goal = r.read(2)
+    init_x = r.read(7)
+    init_y = r.read(6)
+    n = r.read(4)
+    bounces = []
+    if n:
+        prev = Bounce(r.read(8), r.read(8), r.read(7), r.read(4))
+        bounces.append(prev)
+        for _ in range(n - 1):
+            frame = prev.frame + V2_MIN_GAP + r.read_eg(2)
+            quad = r.read(4) if r.read(1) else prev.quad
+            angle = r.read(8)
+            prev = Bounce(angle, r.read(8), frame, quad)
+            bounces.append(prev)
+    return goal, init_x, init_y, bounces
+
+
+# ------------------------------------------------------------
+# v3
+# ------------------------------------------------------------
+
+POSITION_BITS = 7 + 7 + 6
+
+
+class BLAEncoderV3:
+    """
+    v3 packer: a v2 bounce section followed by position samples
+    (frame, x, y) filling the rest of `max_payload` bytes.
+    """
+
+    def __init__(self, max_payload):
+        self.max_payload = max_payload
+        self.max_bounces = V2_MAX_BOUNCES
+        self.max_positions = 255
+        self.count = 0
+        self.position_count = 0
+        # bounce section: at most 255 bytes, leaving room for the counts
+        self._bounce_encoder = BLAEncoderV2(min(255, max_payload - 2))
+        self._buf = bytearray(max_payload)
+        self._view = memoryview(self._buf)
+
+    def encode(self, goal, init_x, init_y, bounces, positions=()):
+        """
+        Returns a memoryview into the internal buffer (valid until the
+        next call); self.count / self.position_count say what fit.
+        """
+        section = self._bounce_encoder.encode(goal, init_x, init_y, bounces)
+        self.count = self._bounce_encoder.count
+        n = len(section)
+        buf = self._buf
+        buf[0] = n
+        buf[1:1 + n] = section
+        pos = 1 + n
+
+        budget = (self.max_payload - pos - 1) * 8
+        acc = 0
+        bits = 0
+        m = 0
+        prev = None
+        for frame, x, y in positions:
+            if m == self.max_positions:
+                break
+            if prev is None:
+                code, length = (frame & 0x7F) << 13, POSITION_BITS
+            else:
+                code, length = _eg((frame - prev - 1) & 0x7F, 0)
+                code <<= 13
+                length += 13
+            if bits + length > budget:
+                break
+            acc = (acc << length) | code | ((x & 0x7F) << 6) | (y & 0x3F)
+            bits += length
+            prev = frame
+            m += 1
+        self.position_count = m
+
+        buf[pos] = m
+        pos += 1
+        length = (bits + 7) >> 3
+        if length:
+            buf[pos:pos + length] = (acc << (length * 8 - bits)).to_bytes(length, "big")
+        return self._view[:pos + length]
+
+
+def decode_v3(data):
+    """
+    Returns (goal, init_x, init_y, [Bounce, ...], [(frame, x, y), ...]).
+    Raises ValueError if it is truncated.
+    """
+    if not data or len(data) < data[0] + 2:
+        raise ValueError("BLA v3 payload truncated")
+    n = data[0]
+    goal, init_x, init_y, bounces = decode_v2(data[1:1 + n])
+    m = data[1 + n]
+    r = _BitReader(data[2 + n:])
+    positions = []
+    frame = None
+    for _ in range(m):
+        if frame is None:
+            frame = r.read(7)
+        else:
+            frame = (frame + 1 + r.read_eg(0)) & 0x7F
+        positions.append((frame, r.read(7), r.read(6)))
+    return goal, init_x, init_y, bounces, positions
+
+
+ENCODERS = {1: BLAEncoder, 2: BLAEncoderV2, 3: BLAEncoderV3}
+DECODERS = {1: decode, 2: decode_v2, 3: decode_v3}
+
+
+# ------------------------------------------------------------
+# Advertising data framing
+# ------------------------------------------------------------
+
+def adv_header(version=1, name=NAME):
+    """
+    AD structures in front of the payload. v1 needs the complete name;
+    for v2 `name` may be None (no name) or shorter than NAME, in which
+    case it is sent as a shortened local name.
+    """
+    header = AD_FLAGS
+    if version == 1:
+        return header + bytes([len(NAME) + 1, AD_COMPLETE_NAME]) + NAME
+    if name:
+        kind = AD_COMPLETE_NAME if name == NAME else AD_SHORT_NAME
+        header += bytes([len(name) + 1, kind]) + name
+    return header
+
+
+# length, type, company ID, version
+V2_FRAMING = 5
+# version byte flag: packet sequence number and first bounce index follow
+SEQUENCED = 0x80
+SEQ_FRAMING = 2
+
+
+def payload_room(header, version=1, adv_len=31, sequenced=False):
+    """
+    Payload bytes left in `adv_len` bytes of advertising data.
+    """
+    if version == 1:
+        return adv_len - len(header)
+    return adv_len - len(header) - V2_FRAMING - (SEQ_FRAMING if sequenced else 0)
+
+
+def frame_payload(header, payload, version=1, seq=None, first=0):
+    """
+    Complete advertising data for `payload`. For v2/v3, `seq` (packet
+    counter) and `first` (stream index of the payload's first bounce),
+    both mod 256, let receivers find lost packets and bounces.
+    """
+    if version == 1:
+        return header + payload
+    if seq is None:
+        framing = bytes([version])
+    else:
+        framing = bytes([version | SEQUENCED, seq & 0xFF, first & 0xFF])
+    return (header +
+            bytes([len(payload) + len(framing) + 3, AD_MANUFACTURER,
+                   COMPANY_ID & 0xFF, COMPANY_ID >> 8]) +
+            framing + payload)
+
+
+def parse_manufacturer_data(value):
+    """
+    (version, seq, first, payload) from the BLA manufacturer data after
+    the company ID, or None. seq/first are None for unsequenced packets.
+    """
+    if not value:
+        return None
+    version = value[0] & ~SEQUENCED
+    if version not in DECODERS or version == 1:
+        return None
+    if value[0] & SEQUENCED:
+        if len(value) < 1 + SEQ_FRAMING:
+            return None
+        return version, value[1], value[2], bytes(value[3:])
+    return version, None, None, bytes(value[1:])
+
+
+def parse_adv_data(data):
+    """
+    Finds the BLA payload in advertising data.
+    Returns (version, seq, first, payload) or None if it isn't a
+    kikicker packet; seq/first are None where the packet has none (v1).
+    """
+    i = 0
+    while i + 1 < len(data):
+        length = data[i]
+        if length == 0:
+            break
+        kind = data[i + 1]
+        value = data[i + 2:i + 1 + length]
+        if kind == AD_COMPLETE_NAME and value == NAME:
+            rest = data[i + 1 + length:]
+            if rest and len(rest) == rest[0] + 1:
+                # exactly one more AD structure: a v2/v3 packet with the name
+                parsed = parse_adv_data(rest)
+                if parsed is not None:
+                    return parsed
+            # v1: everything after the name
+            return 1, None, None, bytes(rest)
+        if (kind == AD_MANUFACTURER and len(value) >= 3 and
+                value[0] | (value[1] << 8) == COMPANY_ID):
+            parsed = parse_manufacturer_data(value[2:])
+            if parsed is not None:
+                return parsed
+        i += 1 + length
+    return None
+
+
+def split_adv_data(data):
+    """
+    Returns (version, payload) or None if it isn't a kikicker packet.
+    """
+    parsed = parse_adv_data(data)
+    if parsed is None:
+        return None
+    return parsed[0], parsed[3]
@@ -0,0 +1,280 @@
+# bla_receiver.py
+"""
+Receiver side of the BLA advertisements.
+
+    r = BLAReceiver(simulate=True)
+    r.start()
+    r.inject_packet(bytes.fromhex('464454f01c80'))
+    r.stop()
+
+Packets (full advertising data, or a bare v1 payload) are decoded with
+bla_codec, repeats of the same advertisement are dropped, and the
+bounces are put back into one ordered event log. v2/v3 packets carry
+a sequence number and the stream index of their first bounce, so lost
+packets and lost bounces are counted and logged as gaps; v1 has
+neither and is only de-duplicated by content.
+
+Without `simulate`, bleak scans for the manufacturer data of v2/v3
+packets, which is what the advertiser sends by default (the raw v1
+bytes after the name aren't a valid AD structure, so scanners don't
+hand them out; v1 is only for old receivers that read raw data).
+"""
+import asyncio
+import threading
+import time
+
+from bla_codec import (COMPANY_ID, DECODERS, parse_adv_data,
+                       parse_manufacturer_data)
+
+
+class BLAEvent:
+    """
+    One entry of the event log.
+
+    kind:  "bounce" (data: Bounce), "goal" (data: player 1/2),
+           "position" (data: (frame, x, y)), "gap" (data: lost bounces)
+    index: stream index of a bounce (or of the first lost one for a gap)
+    """
+    __slots__ = ("kind", "index", "data", "time")
+
+    def __init__(self, kind, index, data, t):
+        self.kind = kind
+        self.index = index
+        self.data = data
+        self.time = t
+
+    def __repr__(self):
+        return f"BLAEvent({self.kind}, index={self.index}, data={self.data!r})"
+
+
+class BLAReceiver:
+    def __init__(self, simulate=False, on_event=None, cache_size=256):
+        """
+        simulate:  no scanner, packets only come from inject_packet()
+        on_event:  called with every new BLAEvent (from the scanner thread)
+        """
+        self.simulate = simulate
+        self.on_event = on_event
+        self.cache_size = cache_size
+        self.running = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._loop = None
+        self._stop = None
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.events.clear()
+            self._decoded = {}          # payload bytes -> decoded tuple
+            self._last_raw = None
+            self._last_seq = None
+            self._next_bounce = None    # absolute index of the next expected bounce
+            self._bounce_count = 0      # v1: bounces seen so far
+            self._goal = 0
+            self.packets = 0
+            self.duplicates = 0
+            self.invalid = 0
+            self.lost_packets = 0
+            self.lost_bounces = 0
+            self.bounces = 0
+            self._started = None
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._started = time.perf_counter()
+        if self.simulate:
+            return
+        # imported here so simulate mode runs without bleak
+        from bleak import BleakScanner
+        self._thread = threading.Thread(target=self._scan, args=(BleakScanner,), daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        if self._loop is not None and self._stop is not None:
+            self._loop.call_soon_threadsafe(self._stop.set)
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _scan(self, scanner_cls):
+        def detected(device, adv):
+            value = adv.manufacturer_data.get(COMPANY_ID)
+            if value is not None:
+                self.inject_manufacturer_data(value)
+
+        async def run():
+            self._stop = asyncio.Event()
+            async with scanner_cls(detection_callback=detected):
+                await self._stop.wait()
+
+        self._loop = asyncio.new_event_loop()
+        try:
+            self._loop.run_until_complete(run())
+        finally:
+            self._loop.close()
+            self._loop = None
+
+    # ------------------------------------------------------------
+
+    def inject_packet(self, data, t=None):
+        """
+        Feeds one received advertisement: full advertising data, or a
+        bare v1 payload. Returns the new events.
+        """
+        parsed = parse_adv_data(data)
+        if parsed is None:
+            # no kikicker AD structure: a bare v1 payload
+            parsed = (1, None, None, bytes(data))
+        return self._receive(parsed, bytes(data), t)
+
+    def inject_manufacturer_data(self, value, t=None):
+        """
+        Feeds the BLA manufacturer data (after the company ID), as
+        scanners report it.
+        """
+        parsed = parse_manufacturer_data(value)
+        if parsed is None:
+            self.invalid += 1
+            return []
+        return self._receive(parsed, bytes(value), t)
+
+    def _decode(self, version, payload):
+        # the same advertisement arrives many times: decode each once
+        key = (version, payload)
+        decoded = self._decoded.get(key)
+        if decoded is None:
+            decoded = DECODERS[version](payload)
+            if len(self._decoded) >= self.cache_size:
+                self._decoded.clear()
+            self._decoded[key] = decoded
+        return decoded
+
+    def _receive(self, parsed, raw, t):
+        if t is None:
+            t = time.perf_counter()
+        version, seq, first, payload = parsed
+        with self._lock:
+            self.packets += 1
+            if raw == self._last_raw:
+                self.duplicates += 1
+                return []
+
+            if seq is not None and self._last_seq is not None:
+                step = (seq - self._last_seq) & 0xFF
+                if step == 0 or step >= 128:
+                    # a repeat or a stale packet
+                    self.duplicates += 1
+                    return []
+                self.lost_packets += step - 1
+
+            try:
+                decoded = self._decode(version, payload)
+            except (ValueError, IndexError):
+                self.invalid += 1
+                return []
+            self._last_raw = raw
+            if seq is not None:
+                self._last_seq = seq
+
+            new = []
+            goal = decoded[0]
+            if goal and not self._goal:
+                new.append(BLAEvent("goal", None, goal, t))
+            self._goal = goal
+
+            bounces = decoded[3]
+            if first is None:
+                index = self._bounce_count
+                for b in bounces:
+                    new.append(BLAEvent("bounce", index, b, t))
+                    index += 1
+                self._bounce_count = index
+            else:
+                new += self._reassemble(first, bounces, t)
+
+            if version >= 3:
+                new += [BLAEvent("position", None, p, t) for p in decoded[4]]
+
+            self.bounces += sum(1 for e in new if e.kind == "bounce")
+            self.events += new
+
+        if self.on_event is not None:
+            for e in new:
+                self.on_event(e)
+        return new
+
+    def _reassemble(self, first, bounces, t):
+        """
+        Places a packet's bounces in the stream by their index (first is
+        the index of bounces[0] mod 256); skips ones already seen and
+        logs a gap for missing ones. A packet without bounces still
+        tells where the stream is (first is the next index then).
+        """
+        new = []
+        if self._next_bounce is None:
+            self._next_bounce = first
+        if not bounces:
+            ahead = (first - self._next_bounce) & 0xFF
+            if 0 < ahead < 128:
+                self.lost_bounces += ahead
+                new.append(BLAEvent("gap", self._next_bounce, ahead, t))
+                self._next_bounce += ahead
+            return new
+        for k, b in enumerate(bounces):
+            ahead = (first + k - self._next_bounce) & 0xFF
+            if ahead >= 128:
+                continue        # already have it
+            index = self._next_bounce + ahead
+            if ahead:
+                self.lost_bounces += ahead
+                new.append(BLAEvent("gap", self._next_bounce, ahead, t))
+            new.append(BLAEvent("bounce", index, b, t))
+            self._next_bounce = index + 1
+        return new
+
+    # ------------------------------------------------------------
+
+    def bounce_log(self):
+        """
+        The bounces in stream order.
+        """
+        with self._lock:
+            return [e for e in self.events if e.kind == "bounce"]
+
+    def stats(self):
+        elapsed = time.perf_counter() - self._started if self._started else 0.0
+        unique = self.packets - self.duplicates - self.invalid
+        expected = unique + self.lost_packets
+        expected_bounces = self.bounces + self.lost_bounces
+        return {
+            "packets": self.packets,
+            "unique": unique,
+            "duplicates": self.duplicates,
+            "invalid": self.invalid,
+            "packets_per_s": self.packets / elapsed if elapsed > 0 else 0.0,
+            "lost_packets": self.lost_packets,
+            "packet_loss": self.lost_packets / expected if expected else 0.0,
+            "bounces": self.bounces,
+            "lost_bounces": self.lost_bounces,
+            "bounce_loss": self.lost_bounces / expected_bounces if expected_bounces else 0.0,
+        }
+
+
+if __name__ == "__main__":
+    receiver = BLAReceiver(on_event=print)
+    receiver.start()
+    try:
+        while True:
+            time.sleep(5)
+            print(receiver.stats())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        receiver.stop()
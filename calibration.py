@@ -0,0 +1,358 @@
+# calibration.py
+"""
+Lens and perspective calibration: image pixels -> field pixels.
+
+A calibration is a homography from the four field corners (see
+kicker_vision.find_playfield_corners) onto an upright field_width x
+field_height rectangle, optionally preceded by lens undistortion from
+a checkerboard (calibrate_lens). It is saved as a small .npz:
+
+    python calibration.py [--source picamera] [--checkerboard DIR] [--out PATH]
+
+At runtime nothing is remapped per frame. The mapping is evaluated once
+for every pixel of the ROI (plus a margin) into two float32 tables, so
+converting a ball centroid is a table lookup; remap_roi() warps only
+the field rectangle, with precomputed fixed-point cv2.remap maps, when
+a rectified image is wanted. The tables are cached on disk (keyed by
+the calibration) and in the process, so loading is cheap after the
+first start.
+"""
+import argparse
+import hashlib
+import logging
+import os
+
+import cv2
+import numpy as np
+
+from color_lut import CACHE_DIR
+
+log = logging.getLogger('kikicker.calibration')
+
+DEFAULT_CALIBRATION = os.path.join(CACHE_DIR, "calibration.npz")
+
+# pixels of margin around the field corners covered by the lookup tables
+TABLE_MARGIN = 16
+
+
+def calibrate_lens(images, pattern=(9, 6)):
+    """
+    Camera matrix and distortion coefficients from RGB views of a
+    checkerboard with `pattern` inner corners. Returns (K, dist, rms)
+    or None if the board was found in fewer than three images.
+    """
+    grid = np.zeros((pattern[0] * pattern[1], 3), np.float32)
+    grid[:, :2] = np.mgrid[0:pattern[0], 0:pattern[1]].T.reshape(-1, 2)
+    object_points, image_points = [], []
+    size = None
+    criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 30, 1e-3)
+    for image in images:
+        gray = cv2.cvtColor(image, cv2.COLOR_RGB2GRAY)
+        size = gray.shape[::-1]
+        found, corners = cv2.findChessboardCorners(gray, pattern)
+        if not found:
+            continue
+        corners = cv2.cornerSubPix(gray, corners, (5, 5), (-1, -1), criteria)
+        object_points.append(grid)
+        image_points.append(corners)
+    if len(image_points) < 3:
+        return None
+    rms, K, dist, _, _ = cv2.calibrateCamera(object_points, image_points, size, None, None)
+    return K, dist.ravel(), rms
+
+
+class Calibration:
+    def __init__(self, homography, field_size, frame_size, corners,
+                 camera_matrix=None, dist_coeffs=None):
+        """
+        homography:   3x3, undistorted image pixels -> field pixels
+        field_size:   (field_width, field_height) of the output rectangle
+        frame_size:   (width, height) of the camera frames
+        corners:      field corners in the (distorted) image, TL TR BR BL
+        camera_matrix, dist_coeffs: lens model, None = no undistortion
+        """
+        self.homography = np.asarray(homography, np.float64)
+        self.field_size = tuple(int(v) for v in field_size)
+        self.frame_size = tuple(int(v) for v in frame_size)
+        self.corners = np.asarray(corners, np.float32).reshape(4, 2)
+        self.camera_matrix = None if camera_matrix is None else np.asarray(camera_matrix, np.float64)
+        self.dist_coeffs = None if dist_coeffs is None else np.asarray(dist_coeffs, np.float64)
+
+        # image area the tables cover: the corners' bounding box + margin
+        w, h = self.frame_size
+        x, y, bw, bh = cv2.boundingRect(self.corners)
+        self.roi = (x, y, bw, bh)
+        self._x0 = max(0, x - TABLE_MARGIN)
+        self._y0 = max(0, y - TABLE_MARGIN)
+        self._x1 = min(w, x + bw + TABLE_MARGIN)
+        self._y1 = min(h, y + bh + TABLE_MARGIN)
+        self._map_x = None
+        self._map_y = None
+        self._inverse = None
+
+    @classmethod
+    def from_corners(cls, corners, frame_size, field_size=None,
+                     camera_matrix=None, dist_coeffs=None):
+        """
+        field_size defaults to the corners' bounding box, so field
+        coordinates keep roughly the scale of the uncalibrated ROI.
+        """
+        corners = np.asarray(corners, np.float32).reshape(4, 2)
+        if field_size is None:
+            _, _, bw, bh = cv2.boundingRect(corners)
+            field_size = (bw, bh)
+        fw, fh = field_size
+        src = corners
+        if camera_matrix is not None:
+            src = cv2.undistortPoints(corners.reshape(-1, 1, 2), camera_matrix, dist_coeffs,
+                                      P=camera_matrix).reshape(4, 2)
+        dst = np.array([[0, 0], [fw, 0], [fw, fh], [0, fh]], np.float32)
+        H = cv2.getPerspectiveTransform(src.astype(np.float32), dst)
+        return cls(H, field_size, frame_size, corners, camera_matrix, dist_coeffs)
+
+    # ------------------------------------------------------------
+    # persistence
+    # ------------------------------------------------------------
+
+    def save(self, path=DEFAULT_CALIBRATION):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        extra = {}
+        if self.camera_matrix is not None:
+            extra = {"camera_matrix": self.camera_matrix, "dist_coeffs": self.dist_coeffs}
+        np.savez(path, homography=self.homography, field_size=self.field_size,
+                 frame_size=self.frame_size, corners=self.corners, **extra)
+
+    @classmethod
+    def from_file(cls, path):
+        with np.load(path) as data:
+            return cls(data["homography"], data["field_size"], data["frame_size"],
+                       data["corners"],
+                       data["camera_matrix"] if "camera_matrix" in data else None,
+                       data["dist_coeffs"] if "dist_coeffs" in data else None)
+
+    def cache_key(self):
+        parts = [self.homography, np.array(self.field_size), np.array(self.frame_size),
+                 self.corners]
+        if self.camera_matrix is not None:
+            parts += [self.camera_matrix, self.dist_coeffs]
+        h = hashlib.sha1()
+        for p in parts:
+            h.update(np.ascontiguousarray(p, np.float64).tobytes())
+        return h.hexdigest()[:16]
+
+    # ------------------------------------------------------------
+    # exact mapping (used to build the tables)
+    # ------------------------------------------------------------
+
+    def map_points(self, points):
+        """
+        Image pixels -> field pixels for an (N, 2) array, computed
+        exactly (undistortion + homography). Slow per call; the live
+        path uses to_field().
+        """
+        pts = np.asarray(points, np.float64).reshape(-1, 1, 2)
+        if self.camera_matrix is not None:
+            pts = cv2.undistortPoints(pts, self.camera_matrix, self.dist_coeffs,
+                                      P=self.camera_matrix)
+        return cv2.perspectiveTransform(pts, self.homography).reshape(-1, 2)
+
+    def build_tables(self):
+        """
+        Field coordinates of every image pixel in the table area.
+        """
+        xs = np.arange(self._x0, self._x1, dtype=np.float64)
+        ys = np.arange(self._y0, self._y1, dtype=np.float64)
+        gx, gy = np.meshgrid(xs, ys)
+        field = self.map_points(np.stack([gx.ravel(), gy.ravel()], axis=1))
+        shape = (len(ys), len(xs))
+        self.set_tables(field[:, 0].reshape(shape).astype(np.float32),
+                        field[:, 1].reshape(shape).astype(np.float32))
+
+    def set_tables(self, map_x, map_y):
+        # plain lists of rows: indexing them yields Python floats, which
+        # is what the per-centroid path wants
+        self._map_x = map_x
+        self._map_y = map_y
+        self._rows_x = map_x.tolist()
+        self._rows_y = map_y.tolist()
+
+    # ------------------------------------------------------------
+    # runtime
+    # ------------------------------------------------------------
+
+    def to_field(self, x, y):
+        """
+        Field pixels (floats) of the image position (x, y), by table
+        lookup with bilinear interpolation between pixel centres.
+        Positions outside the table area use the exact mapping.
+        """
+        fx = x - self._x0
+        fy = y - self._y0
+        ix = int(fx)
+        iy = int(fy)
+        rows_x = self._rows_x
+        if not (0 <= fx and 0 <= fy and iy + 1 < len(rows_x) and ix + 1 < len(rows_x[0])):
+            return tuple(self.map_points([(x, y)])[0])
+        ax = fx - ix
+        ay = fy - iy
+        if not ax and not ay:
+            # integer centroids: a single lookup
+            return rows_x[iy][ix], self._rows_y[iy][ix]
+        rows_y = self._rows_y
+        top_x, bot_x = rows_x[iy], rows_x[iy + 1]
+        top_y, bot_y = rows_y[iy], rows_y[iy + 1]
+        w00 = (1 - ax) * (1 - ay)
+        w01 = ax * (1 - ay)
+        w10 = (1 - ax) * ay
+        w11 = ax * ay
+        return (top_x[ix] * w00 + top_x[ix + 1] * w01 + bot_x[ix] * w10 + bot_x[ix + 1] * w11,
+                top_y[ix] * w00 + top_y[ix + 1] * w01 + bot_y[ix] * w10 + bot_y[ix + 1] * w11)
+
+    def to_image(self, x, y):
+        """
+        Image position of field pixel (x, y), computed exactly; for
+        overlays, not the per-frame path.
+        """
+        p = cv2.perspectiveTransform(np.array([[[x, y]]], np.float64),
+                                     np.linalg.inv(self.homography)).reshape(1, 2)
+        if self.camera_matrix is not None:
+            p = _distort(p, self.camera_matrix, self.dist_coeffs)
+        return float(p[0, 0]), float(p[0, 1])
+
+    def to_field_many(self, xs, ys):
+        """
+        Vectorized to_field() for arrays of image positions inside the
+        table area (cv2.remap does the bilinear lookup).
+        """
+        pts_x = (np.asarray(xs, np.float32) - self._x0).reshape(1, -1)
+        pts_y = (np.asarray(ys, np.float32) - self._y0).reshape(1, -1)
+        fx = cv2.remap(self._map_x, pts_x, pts_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        fy = cv2.remap(self._map_y, pts_x, pts_y, cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+        return fx.ravel(), fy.ravel()
+
+    def remap_roi(self, frame):
+        """
+        The field rectangle (field_height, field_width, 3) cut out of a
+        frame, undistorted and rectified.
+        """
+        if self._inverse is None:
+            fw, fh = self.field_size
+            gx, gy = np.meshgrid(np.arange(fw, dtype=np.float64) + 0.5,
+                                 np.arange(fh, dtype=np.float64) + 0.5)
+            field = np.stack([gx.ravel(), gy.ravel()], axis=1).reshape(-1, 1, 2)
+            img = cv2.perspectiveTransform(field, np.linalg.inv(self.homography))
+            if self.camera_matrix is not None:
+                img = _distort(img.reshape(-1, 2), self.camera_matrix, self.dist_coeffs)
+            img = img.reshape(fh, fw, 2).astype(np.float32)
+            # fixed-point maps: the fastest form for cv2.remap
+            self._inverse = cv2.convertMaps(img[..., 0], img[..., 1], cv2.CV_16SC2)
+        m1, m2 = self._inverse
+        return cv2.remap(frame, m1, m2, cv2.INTER_LINEAR)
+
+
+def _distort(points, K, dist):
+    """
+    Undistorted pixel positions -> distorted (as seen by the camera).
+    """
+    norm = cv2.undistortPoints(points.reshape(-1, 1, 2), K, None)   # pixels -> normalised
+    obj = cv2.convertPointsToHomogeneous(norm).reshape(-1, 3)
+    img, _ = cv2.projectPoints(obj, np.zeros(3), np.zeros(3), K, dist)
+    return img.reshape(-1, 2)
+
+
+# ------------------------------------------------------------
+# cached load
+# ------------------------------------------------------------
+
+_loaded = {}
+
+
+def load_calibration(path=DEFAULT_CALIBRATION, cache_dir=CACHE_DIR):
+    """
+    Loads a saved calibration with its lookup tables, or None if there
+    is none. The tables come from the disk cache when present, and the
+    result is reused by later calls in the same process.
+    """
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    key = (os.path.abspath(path), mtime)
+    calib = _loaded.get(key)
+    if calib is not None:
+        return calib
+
+    calib = Calibration.from_file(path)
+    tables = os.path.join(cache_dir, f"calibration_maps_{calib.cache_key()}.npy")
+    if os.path.exists(tables):
+        maps = np.load(tables)
+        calib.set_tables(maps[0], maps[1])
+    else:
+        calib.build_tables()
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(tables, np.stack([calib._map_x, calib._map_y]))
+        except OSError as e:
+            log.warning("Could not cache calibration tables: %s", e)
+    _loaded[key] = calib
+    return calib
+
+
+# ------------------------------------------------------------
+# calibration step
+# ------------------------------------------------------------
+
+def main(argv=None):
+    from frame_source import open_source, SOURCES
+    from kicker_vision import find_playfield_corners
+
+    parser = argparse.ArgumentParser(description='Field calibration')
+    parser.add_argument('--source', default='picamera', help=' | '.join(SOURCES))
+    parser.add_argument('--checkerboard', metavar='DIR',
+                        help='directory of checkerboard images for the lens model')
+    parser.add_argument('--pattern', default='9x6', help='inner corners of the checkerboard')
+    parser.add_argument('--field-size', metavar='WxH',
+                        help='output field size in pixels (default: corner bounding box)')
+    parser.add_argument('--out', default=DEFAULT_CALIBRATION)
+    args = parser.parse_args(argv)
+
+    K = dist = None
+    if args.checkerboard:
+        pattern = tuple(int(v) for v in args.pattern.split('x'))
+        images = []
+        for name in sorted(os.listdir(args.checkerboard)):
+            image = cv2.imread(os.path.join(args.checkerboard, name))
+            if image is not None:
+                images.append(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))
+        lens = calibrate_lens(images, pattern)
+        if lens is None:
+            print("Checkerboard not found in enough images")
+            return 1
+        K, dist, rms = lens
+        print(f"Lens model from {len(images)} images, rms {rms:.3f} px")
+
+    camera = open_source(args.source)
+    camera.start()
+    try:
+        frame = camera.capture_array()
+    finally:
+        camera.stop()
+
+    corners = find_playfield_corners(frame)
+    if corners is None:
+        print("Field not found")
+        return 1
+    field_size = None
+    if args.field_size:
+        field_size = tuple(int(v) for v in args.field_size.split('x'))
+    calib = Calibration.from_corners(corners, (frame.shape[1], frame.shape[0]),
+                                     field_size, K, dist)
+    calib.save(args.out)
+    print(f"Corners {corners.round(1).tolist()} -> field {calib.field_size}, saved to {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
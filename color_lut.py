@@ -0,0 +1,117 @@
+# color_lut.py
+import hashlib
+import logging
+import os
+
+import cv2
+import numpy as np
+
+log = logging.getLogger('kikicker.color')
+
+# class flags (a colour can be both, the HSV ranges overlap)
+BALL = 1
+FIELD = 2
+
+CACHE_DIR = os.environ.get("KIKICKER_CACHE", os.path.expanduser("~/.cache/kikicker"))
+
+
+def _cache_key(bounds, bits):
+    text = repr(bits) + repr(sorted(
+        (cls, [int(v) for v in lower], [int(v) for v in upper])
+        for cls, (lower, upper) in bounds.items()
+    ))
+    return hashlib.sha1(text.encode()).hexdigest()[:16]
+
+
+class ColorLUT:
+    """
+    Quantized RGB -> class lookup table built from HSV threshold ranges.
+
+    `bounds` maps a class flag to its (lower_hsv, upper_hsv) pair, exactly
+    as they would be passed to cv2.inRange. With bits=8 every RGB colour
+    has its own entry (16 MB table) and the masks are identical to the
+    HSV path; fewer bits give a smaller table that classifies each colour
+    bin by its centre.
+    """
+
+    def __init__(self, table, bits):
+        self.table = table
+        self.bits = bits
+        self._shift = 8 - bits
+        self._qmask = (1 << bits) - 1
+        # one 0/255 table per class, so a mask is a single lookup
+        self._mask_tables = {
+            cls: np.where(table & cls, 255, 0).astype(np.uint8)
+            for cls in (BALL, FIELD)
+        }
+
+    # ------------------------------------------------------------
+
+    @classmethod
+    def build(cls, bounds, bits=8):
+        if not 1 <= bits <= 8:
+            raise ValueError("bits must be in 1..8")
+        shift = 8 - bits
+        n = 1 << (3 * bits)
+        q = (1 << bits) - 1
+
+        # index layout: r | g << bits | b << 2*bits
+        idx = np.arange(n, dtype=np.uint32)
+        centre = (1 << shift) >> 1
+        rgb = np.empty((n, 1, 3), np.uint8)
+        rgb[:, 0, 0] = ((idx & q) << shift) + centre
+        rgb[:, 0, 1] = (((idx >> bits) & q) << shift) + centre
+        rgb[:, 0, 2] = (((idx >> (2 * bits)) & q) << shift) + centre
+
+        hsv = cv2.cvtColor(rgb, cv2.COLOR_RGB2HSV)
+        table = np.zeros(n, np.uint8)
+        for flag, (lower, upper) in bounds.items():
+            inside = cv2.inRange(hsv, lower, upper)[:, 0] != 0
+            table[inside] |= flag
+        return cls(table, bits)
+
+    @classmethod
+    def load_or_build(cls, bounds, bits=8, cache_dir=CACHE_DIR):
+        """
+        Loads the table for these thresholds from the cache directory,
+        building (and saving) it on first use.
+        """
+        path = os.path.join(cache_dir, f"color_lut_{bits}_{_cache_key(bounds, bits)}.npy")
+        if os.path.exists(path):
+            return cls(np.load(path), bits)
+
+        lut = cls.build(bounds, bits)
+        try:
+            os.makedirs(cache_dir, exist_ok=True)
+            np.save(path, lut.table)
+        except OSError as e:
+            log.warning("Could not cache colour LUT: %s", e)
+        return lut
+
+    # ------------------------------------------------------------
+
+    def _index(self, image):
+        # RGB -> RGBA so each pixel can be read as one little-endian uint32
+        # (r | g << 8 | b << 16 | a << 24)
+        rgba = cv2.cvtColor(image, cv2.COLOR_RGB2RGBA)
+        v = rgba.view(np.uint32)[..., 0]
+        if self.bits == 8:
+            return v & 0xFFFFFF
+
+        s, q, b = self._shift, self._qmask, self.bits
+        idx = (v >> s) & q
+        idx |= ((v >> (8 + s)) & q) << b
+        idx |= ((v >> (16 + s)) & q) << (2 * b)
+        return idx
+
+    def classify(self, image):
+        """
+        Per-pixel class flags (BALL | FIELD) for an RGB image.
+        """
+        return self.table.take(self._index(image))
+
+    def mask(self, image, cls):
+        """
+        0/255 mask for one class, drop-in for cv2.inRange on the HSV image.
+        """
+        return self._mask_tables[cls].take(self._index(image))
@@ -0,0 +1,515 @@
+# color_profile.py
+"""
+Colour thresholds per venue, measured instead of hand-edited.
+
+calibrate() looks at a few seconds of frames:
+
+1. the field: HSV histograms of the ROI interior of the median frame
+   (the ball moves, so it isn't in the median); the field colour is
+   the hue peak, its range the 1st..99th percentile around the peak
+   plus a margin, saturation and value open upwards
+2. the ball: what differs from the median frame, isn't field coloured
+   and forms a compact blob; blobs are grouped by hue and the most
+   frequent, most saturated group is the ball. Its pixels give the
+   ball range the same way, and its areas the minimum ball area
+   (MIN_AREA_FRACTION of the median)
+
+The result is a ColorProfile, saved by name and camera settings in a
+small JSON file (profiles.json in the cache directory):
+
+    python color_profile.py [--source picamera] [--seconds 3] [--name venue]
+
+Saving is a locked read-modify-write through a temporary file of its
+own, so table processes closing at once don't lose each other's
+profiles or trip over one .tmp file.
+
+main.py --color-profile NAME loads it at startup (a JSON read; with the
+LUT backend the table comes from the LUT cache). --color-retune SECONDS
+adds a ColorRetuner: the loop hands it a frame with a detected ball
+every few seconds, and on its own thread it re-measures both colours
+and moves the thresholds a fraction of the way towards them, a few
+steps at most per update, so a light change is followed without a
+single bad frame throwing the thresholds off.
+
+Hue is treated as a line 0..179 (cv2.inRange can't wrap), which is
+fine for an orange or yellow ball on green; a red ball would need two
+ranges.
+"""
+import argparse
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+
+import cv2
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:     # not on Windows: saves there are unlocked
+    fcntl = None
+
+import kicker_vision
+from color_lut import CACHE_DIR
+
+log = logging.getLogger('kikicker.color')
+
+DEFAULT_PROFILES = os.path.join(CACHE_DIR, "profiles.json")
+
+# widening of the measured ranges: hue in OpenCV units (180 per turn)
+HUE_MARGIN = 4
+SATURATION_MARGIN = 25
+# value scales with the light: a ball in a shadow this much darker still counts
+VALUE_MARGIN = 0.5
+# minimum ball area as a fraction of the median measured ball area
+MIN_AREA_FRACTION = 0.6
+
+
+class ColorProfile:
+    def __init__(self, ball_range, field_range, min_ball_area, name="default",
+                 camera=None, created=None, samples=0):
+        """
+        ball_range, field_range: (lower HSV, upper HSV) as for cv2.inRange
+        camera:  camera_key() of the settings the profile was made with
+        """
+        self.ball_range = tuple(tuple(int(v) for v in bound) for bound in ball_range)
+        self.field_range = tuple(tuple(int(v) for v in bound) for bound in field_range)
+        self.min_ball_area = int(min_ball_area)
+        self.name = name
+        self.camera = camera
+        self.created = created if created is not None else time.time()
+        self.samples = samples
+
+    @classmethod
+    def default(cls):
+        """
+        The constants in kicker_vision.py.
+        """
+        return cls((kicker_vision.LOWER_ORANGE, kicker_vision.UPPER_ORANGE),
+                   (kicker_vision.LOWER_GREEN, kicker_vision.UPPER_GREEN),
+                   kicker_vision.MIN_BALL_AREA)
+
+    @classmethod
+    def current(cls, colors, name="default", camera=None):
+        """
+        The thresholds a kicker_vision.ColorThresholds is using right now.
+        """
+        return cls(colors.ball_range, colors.field_range, colors.min_ball_area, name, camera)
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "camera": self.camera,
+            "created": self.created,
+            "samples": self.samples,
+            "ball": [list(self.ball_range[0]), list(self.ball_range[1])],
+            "field": [list(self.field_range[0]), list(self.field_range[1])],
+            "min_ball_area": self.min_ball_area,
+        }
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d["ball"], d["field"], d["min_ball_area"], d.get("name", "default"),
+                   d.get("camera"), d.get("created"), d.get("samples", 0))
+
+    def thresholds(self, backend="hsv", bits=8):
+        """
+        A new kicker_vision.ColorThresholds with these thresholds.
+        """
+        return kicker_vision.ColorThresholds(self.ball_range, self.field_range,
+                                             self.min_ball_area, backend, bits)
+
+    def apply(self, colors, cache=True):
+        """
+        Makes `colors` (a kicker_vision.ColorThresholds) use these
+        thresholds (cache: keep the LUT built for them on disk, see
+        ColorThresholds.set).
+        """
+        colors.set(self.ball_range, self.field_range, self.min_ball_area, cache)
+
+    def __repr__(self):
+        return (f"ColorProfile({self.name!r}, ball {self.ball_range}, field {self.field_range}, "
+                f"min area {self.min_ball_area})")
+
+
+# ------------------------------------------------------------
+# profile store
+# ------------------------------------------------------------
+
+def camera_key(source, size, fps):
+    """
+    The camera settings a profile belongs to. Exposure and gain aren't
+    part of it: with auto exposure they drift, which is what re-tuning
+    is for.
+    """
+    return f"{source} {size[0]}x{size[1]}@{fps:g}"
+
+
+def _read(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+
+def save_profile(profile, path=DEFAULT_PROFILES):
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # other processes save to the same file: hold the lock from the read
+    # to the replace, or the last one in drops the others' profiles
+    with open(path + ".lock", "a") as lock:
+        if fcntl is not None:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+        profiles = _read(path)
+        profiles[f"{profile.name}/{profile.camera}"] = profile.to_dict()
+        with tempfile.NamedTemporaryFile("w", dir=directory, prefix=".profiles-",
+                                         suffix=".tmp", delete=False) as f:
+            json.dump(profiles, f, indent=1)
+        try:
+            os.replace(f.name, path)
+        except OSError:
+            os.unlink(f.name)
+            raise
+
+
+def load_profile(name, camera=None, path=DEFAULT_PROFILES):
+    """
+    The profile `name` made with these camera settings; failing that
+    the newest profile of that name (other settings), or None.
+    """
+    profiles = _read(path)
+    exact = profiles.get(f"{name}/{camera}")
+    if exact is not None:
+        return ColorProfile.from_dict(exact)
+    same_name = [p for p in profiles.values() if p.get("name") == name]
+    if not same_name:
+        return None
+    return ColorProfile.from_dict(max(same_name, key=lambda p: p.get("created", 0)))
+
+
+# ------------------------------------------------------------
+# thresholds from pixels
+# ------------------------------------------------------------
+
+def _percentile(hist, q):
+    """
+    Bin holding the q-th percentile (0..100) of a histogram.
+    """
+    cum = np.cumsum(hist)
+    return int(np.searchsorted(cum, q / 100.0 * cum[-1]))
+
+
+def hsv_range(hsv, window, lo=1.0, hi=99.0):
+    """
+    (lower, upper) HSV bounds for the dominant colour among `hsv`
+    pixels ((N, 3) uint8): pixels within `window` of the hue peak,
+    their lo..hi percentiles widened by the margins (value by a factor,
+    light is multiplicative); saturation and value have no upper bound.
+    None if there are no pixels.
+    """
+    if len(hsv) == 0:
+        return None
+    hue = np.bincount(hsv[:, 0], minlength=180)[:180]
+    # peak of the lightly smoothed hue histogram
+    smooth = np.convolve(hue, np.ones(5), mode="same")
+    peak = int(np.argmax(smooth))
+    dist = np.abs(hsv[:, 0].astype(np.int16) - peak)
+    near = hsv[np.minimum(dist, 180 - dist) <= window]
+    if len(near) == 0:
+        return None
+
+    h = np.bincount(near[:, 0], minlength=180)
+    s = np.bincount(near[:, 1], minlength=256)
+    v = np.bincount(near[:, 2], minlength=256)
+    lower = (max(0, _percentile(h, lo) - HUE_MARGIN),
+             max(0, _percentile(s, lo) - SATURATION_MARGIN),
+             int(_percentile(v, lo) * (1.0 - VALUE_MARGIN)))
+    upper = (min(179, _percentile(h, hi) + HUE_MARGIN), 255, 255)
+    return lower, upper
+
+
+def _in_range(hsv, bounds):
+    lower, upper = bounds
+    return np.all((hsv >= lower) & (hsv <= upper), axis=-1)
+
+
+def _ball_blobs(frames, background, roi, field_range, diff_threshold=40, max_area=2000):
+    """
+    (hsv pixels, area) of every compact, ball sized blob that moved
+    against `background` and isn't field coloured.
+    """
+    x, y, w, h = roi
+    bg = background[y:y + h, x:x + w]
+    kernel = np.ones((3, 3), np.uint8)
+    blobs = []
+    for frame in frames:
+        region = frame[y:y + h, x:x + w]
+        hsv = cv2.cvtColor(region, cv2.COLOR_RGB2HSV)
+        # largest channel change: an orange ball on green differs most in
+        # red, even in dim light where the grey levels are close
+        diff = cv2.absdiff(region, bg).max(axis=2)
+        moving = (diff > diff_threshold) & ~_in_range(hsv, field_range)
+        moving = cv2.morphologyEx(moving.astype(np.uint8) * 255, cv2.MORPH_OPEN, kernel)
+        n, labels, stats, _ = cv2.connectedComponentsWithStats(moving, connectivity=8)
+        for i in range(1, n):
+            bx, by, bw, bh, area = stats[i]
+            if not 12 <= area <= max_area or area < 0.5 * bw * bh or min(bw, bh) < 0.35 * max(bw, bh):
+                continue
+            blobs.append((hsv[labels == i], int(area)))
+    return blobs
+
+
+def calibrate(frames, roi=None, previous=None):
+    """
+    ColorProfile measured from RGB frames of play (a few seconds with
+    the ball moving). roi: the field (x, y, w, h), found if None.
+    Thresholds that can't be measured (no field, no moving ball) are
+    kept from `previous` (default: the constants in kicker_vision.py),
+    which also finds the field if roi is None.
+    Returns (profile, report) where report describes what was measured.
+    """
+    if previous is None:
+        previous = ColorProfile.default()
+    step = max(1, len(frames) // 31)
+    background = np.median(np.stack(frames[::step]), axis=0).astype(np.uint8)
+    height, width = background.shape[:2]
+    if roi is None:
+        roi = kicker_vision.find_playfield_roi(background, colors=previous.thresholds())
+    if roi is None:
+        # thresholds too far off to find the field: the middle of the frame
+        roi = (width // 5, height // 5, width * 3 // 5, height * 3 // 5)
+    report = {"roi": tuple(int(v) for v in roi), "frames": len(frames)}
+
+    # ---- field: interior of the ROI on the median frame ----
+    x, y, w, h = roi
+    inner = background[y + h // 10:y + h - h // 10, x + w // 10:x + w - w // 10]
+    field_hsv = cv2.cvtColor(inner, cv2.COLOR_RGB2HSV).reshape(-1, 3)
+    field_range = hsv_range(field_hsv, window=25) or previous.field_range
+    report["field_pixels"] = len(field_hsv)
+
+    # ---- ball: moving compact blobs, the most common saturated hue ----
+    blobs = _ball_blobs(frames, background, roi, field_range)
+    groups = {}
+    for hsv, area in blobs:
+        group = int(np.median(hsv[:, 0])) // 10
+        groups.setdefault(group, []).append((hsv, area))
+    ball_range = previous.ball_range
+    min_area = previous.min_ball_area
+    report["blobs"] = len(blobs)
+    if groups:
+        def weight(members):
+            return len(members) * np.mean([np.median(hsv[:, 1]) for hsv, _ in members])
+        ball = max(groups.values(), key=weight)
+        pixels = np.concatenate([hsv for hsv, _ in ball])
+        ball_range = hsv_range(pixels, window=15, lo=2.0, hi=98.0) or ball_range
+        min_area = max(10, int(MIN_AREA_FRACTION * np.median([a for _, a in ball])))
+        report["ball_blobs"] = len(ball)
+        report["ball_area"] = float(np.median([a for _, a in ball]))
+
+    profile = ColorProfile(ball_range, field_range, min_area, samples=len(frames))
+    return profile, report
+
+
+# ------------------------------------------------------------
+# background re-tune
+# ------------------------------------------------------------
+
+class ColorRetuner:
+    """
+    Follows slow light changes while the loop runs.
+
+    submit() (hot path: a time check, and every `interval` seconds a
+    reference) hands over a frame with its field ROI and ball box. Once
+    `samples` are in, the thread measures the field (ROI interior) and
+    the ball (its box, minus field-coloured pixels) with hsv_range() and
+    moves every threshold `rate` of the way towards the measurement, at
+    most `max_step` per update, then applies the profile to `colors`,
+    the session's kicker_vision.ColorThresholds.
+    """
+
+    def __init__(self, profile, colors, interval=1.0, samples=3, rate=0.5, max_step=8,
+                 on_update=None):
+        self.profile = profile
+        self.colors = colors
+        self.interval = interval
+        self.samples = samples
+        self.rate = rate
+        self.max_step = max_step
+        self.on_update = on_update
+        self._pending = []
+        self._slot = None
+        self._next = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+        self.running = False
+
+        # counters
+        self.taken = 0
+        self.updates = 0
+        self.last_change = None
+
+    def submit(self, frame, roi, result, now=None):
+        if now is None:
+            now = time.monotonic()
+        if now < self._next or self._slot is not None:
+            return
+        self._next = now + self.interval
+        self._slot = (frame, roi, result)
+        self._wake.set()
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+            slot = self._slot
+            if slot is None:
+                continue
+            try:
+                self.add(*slot)
+            except Exception:
+                log.exception("Colour re-tune failed")
+            self._slot = None
+
+    # ------------------------------------------------------------
+
+    def add(self, frame, roi, result):
+        """
+        One sample (normally on the retuner's thread). Returns True if
+        the thresholds changed.
+        """
+        x, y, w, h = (int(v) for v in roi)
+        inner = frame[y + h // 10:y + h - h // 10:2, x + w // 10:x + w - w // 10:2]
+        field = cv2.cvtColor(inner, cv2.COLOR_RGB2HSV).reshape(-1, 3)
+
+        _, _, bx, by, bw, bh = result
+        # the box, grown a quarter: the current range may cut the ball's edge
+        gx, gy = bw // 4, bh // 4
+        box = frame[max(0, by - gy):by + bh + gy, max(0, bx - gx):bx + bw + gx]
+        ball = cv2.cvtColor(box, cv2.COLOR_RGB2HSV).reshape(-1, 3)
+        # area as the detector sees it: pixels in the current ball range
+        area = int(np.count_nonzero(_in_range(ball, self.profile.ball_range)))
+        ball = ball[~_in_range(ball, self.profile.field_range)]
+        self._pending.append((field, ball, area))
+        self.taken += 1
+        if len(self._pending) < self.samples:
+            return False
+
+        pending, self._pending = self._pending, []
+        field_range = hsv_range(np.concatenate([f for f, _, _ in pending]), window=25)
+        ball_range = hsv_range(np.concatenate([b for _, b, _ in pending]), window=15, lo=2.0, hi=98.0)
+        area = MIN_AREA_FRACTION * float(np.median([a for _, _, a in pending]))
+        return self._step(ball_range, field_range, area)
+
+    def _toward(self, current, target):
+        out = []
+        for c, t in zip(current, target):
+            d = self.rate * (t - c)
+            d = max(-self.max_step, min(self.max_step, d))
+            out.append(int(round(c + d)))
+        return tuple(out)
+
+    def _step(self, ball_range, field_range, area):
+        p = self.profile
+        ball = p.ball_range if ball_range is None else tuple(
+            self._toward(c, t) for c, t in zip(p.ball_range, ball_range))
+        field = p.field_range if field_range is None else tuple(
+            self._toward(c, t) for c, t in zip(p.field_range, field_range))
+        min_area = self._toward((p.min_ball_area,), (area,))[0]
+        if ball == p.ball_range and field == p.field_range and min_area == p.min_ball_area:
+            return False
+        profile = ColorProfile(ball, field, min_area, p.name, p.camera, samples=p.samples)
+        # intermediate thresholds: a LUT (if any) isn't worth a cache file
+        profile.apply(self.colors, cache=False)
+        self.profile = profile
+        self.updates += 1
+        self.last_change = time.monotonic()
+        if self.on_update is not None:
+            self.on_update(profile)
+        return True
+
+    def stats(self):
+        p = self.profile
+        return {
+            "ball": p.ball_range,
+            "field": p.field_range,
+            "min_ball_area": p.min_ball_area,
+            "samples": self.taken,
+            "updates": self.updates,
+        }
+
+
+# ------------------------------------------------------------
+# calibration step
+# ------------------------------------------------------------
+
+def _detection_rate(frames, roi, colors):
+    found = sum(kicker_vision.detect_ball(f, roi=roi, colors=colors) is not None for f in frames)
+    return found / len(frames)
+
+
+def main(argv=None):
+    from frame_source import open_source, SOURCES, FRAME_SIZE, FPS
+
+    parser = argparse.ArgumentParser(description='Colour threshold calibration')
+    parser.add_argument('--source', default='picamera', help=' | '.join(SOURCES))
+    parser.add_argument('--seconds', type=float, default=3.0,
+                        help='length of play to sample (keep the ball moving)')
+    parser.add_argument('--name', default='default', help='profile name')
+    parser.add_argument('--out', default=DEFAULT_PROFILES)
+    parser.add_argument('--dry-run', action='store_true', help='measure, but don\'t save')
+    args = parser.parse_args(argv)
+
+    camera = open_source(args.source, size=FRAME_SIZE, fps=FPS)
+    camera.start()
+    frames = []
+    try:
+        for _ in range(int(args.seconds * FPS)):
+            try:
+                frames.append(camera.capture_array())
+            except EOFError:
+                break
+    finally:
+        camera.stop()
+    if len(frames) < 10:
+        print("Not enough frames")
+        return 1
+
+    before = ColorProfile.default()
+    profile, report = calibrate(frames, previous=before)
+    profile.name = args.name
+    profile.camera = camera_key(args.source, FRAME_SIZE, FPS)
+    roi = report["roi"]
+    rate_before = _detection_rate(frames, roi, before.thresholds())
+    rate_after = _detection_rate(frames, roi, profile.thresholds())
+
+    print(f"{len(frames)} frames, field ROI {roi}, {report['blobs']} moving blobs, "
+          f"{report.get('ball_blobs', 0)} taken as the ball")
+    print(f"  ball   {before.ball_range} -> {profile.ball_range}")
+    print(f"  field  {before.field_range} -> {profile.field_range}")
+    print(f"  min ball area {before.min_ball_area} -> {profile.min_ball_area}")
+    print(f"  ball found in {rate_before:.1%} -> {rate_after:.1%} of the frames")
+    if not args.dry_run:
+        save_profile(profile, args.out)
+        print(f"Saved as {args.name!r} for {profile.camera} in {args.out}")
+    return 0
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
@@ -0,0 +1,225 @@
+# debug_view.py
+"""
+Debug overlay off the vision loop.
+
+The loop hands over its latest frame with submit() (a single-slot
+mailbox: a newer frame replaces one not yet drawn) and reports what it
+found with ball()/bounce()/goal(), each an O(1) append. The view thread
+draws at most `fps` frames per second: ROI, ball box, trail, recent
+bounces and a goal banner, then shows them in a window and/or serves
+them as an MJPEG stream (http://host:port/), for Pis without a display.
+Nothing is converted, drawn or encoded on the loop's thread.
+"""
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import cv2
+import numpy as np
+
+BOUNDARY = b"kikickerframe"
+
+
+class _MJPEGHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        view = self.server.view
+        self.send_response(200)
+        self.send_header("Content-Type",
+                         "multipart/x-mixed-replace; boundary=" + BOUNDARY.decode())
+        self.send_header("Cache-Control", "no-cache")
+        self.end_headers()
+        view._clients += 1
+        try:
+            seen = -1
+            while view.running:
+                jpeg, seen = view._next_jpeg(seen)
+                if jpeg is None:
+                    continue
+                self.wfile.write(b"--" + BOUNDARY + b"\r\nContent-Type: image/jpeg\r\n"
+                                 b"Content-Length: " + str(len(jpeg)).encode() + b"\r\n\r\n")
+                self.wfile.write(jpeg + b"\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            view._clients -= 1
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DebugView:
+    def __init__(self, fps=15, window="Kicker Live", stream=None, trail=48,
+                 bounces=8, goal_seconds=2.0, jpeg_quality=70):
+        """
+        window:  OpenCV window title, None = no window
+        stream:  "host:port" or port for the MJPEG server, None = off
+        trail:   ball positions drawn as the trail
+        """
+        self.fps = fps
+        self.window = window
+        self.stream = stream
+        self.goal_seconds = goal_seconds
+        self.jpeg_quality = jpeg_quality
+
+        self._slot = None
+        self._wake = threading.Event()
+        self._trail = deque(maxlen=trail)
+        self._bounces = deque(maxlen=bounces)
+        self._goal = None           # (team, time)
+        self._thread = None
+        self._server = None
+        self.running = False
+        self.quit_requested = False
+
+        # MJPEG: latest encoded frame and its generation
+        self._jpeg = None
+        self._generation = 0
+        self._jpeg_ready = threading.Condition()
+        self._clients = 0
+
+        # counters
+        self.submitted = 0
+        self.drawn = 0
+
+    # ------------------------------------------------------------
+    # vision loop side: O(1), no OpenCV
+    # ------------------------------------------------------------
+
+    def submit(self, frame_rgb, roi, box=None, label=None):
+        """
+        Latest frame with the search ROI and the ball box (x, y, w, h)
+        in frame coordinates. Replaces a frame not drawn yet.
+        """
+        self._slot = (frame_rgb, roi, box, label)
+        self.submitted += 1
+        self._wake.set()
+
+    def ball(self, x, y):
+        self._trail.append((int(x), int(y)))
+
+    def lost(self):
+        self._trail.append(None)
+
+    def bounce(self, x, y, label=""):
+        self._bounces.append((int(x), int(y), label))
+
+    def goal(self, team):
+        self._goal = (team, time.monotonic())
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        if self.stream is not None:
+            host, _, port = str(self.stream).rpartition(":")
+            self._server = ThreadingHTTPServer((host or "0.0.0.0", int(port)), _MJPEGHandler)
+            self._server.daemon_threads = True
+            self._server.view = self
+            threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        with self._jpeg_ready:
+            self._jpeg_ready.notify_all()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    @property
+    def port(self):
+        return self._server.server_address[1] if self._server is not None else None
+
+    def _run(self):
+        period = 1.0 / self.fps
+        next_draw = 0.0
+        try:
+            while self.running:
+                self._wake.wait(0.1)
+                now = time.monotonic()
+                if now < next_draw:
+                    # capped rate: the newest frame waits in the slot
+                    time.sleep(next_draw - now)
+                self._wake.clear()
+                slot, self._slot = self._slot, None
+                if slot is None:
+                    continue
+                next_draw = time.monotonic() + period
+                image = self.render(*slot)
+                self.drawn += 1
+                self._output(image)
+        finally:
+            if self.window is not None:
+                cv2.destroyAllWindows()
+
+    def _output(self, image):
+        if self.window is not None:
+            cv2.imshow(self.window, image)
+            if cv2.waitKey(1) & 0xFF == ord('q'):
+                self.quit_requested = True
+        if self._server is not None and self._clients > 0:
+            ok, jpeg = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, self.jpeg_quality])
+            if ok:
+                with self._jpeg_ready:
+                    self._jpeg = jpeg.tobytes()
+                    self._generation += 1
+                    self._jpeg_ready.notify_all()
+
+    def _next_jpeg(self, seen):
+        with self._jpeg_ready:
+            if self._generation == seen:
+                self._jpeg_ready.wait(1.0)
+            if self._generation == seen:
+                return None, seen
+            return self._jpeg, self._generation
+
+    # ------------------------------------------------------------
+
+    def render(self, frame_rgb, roi, box=None, label=None):
+        """
+        BGR image with all overlays (on the view thread).
+        """
+        image = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
+        rx, ry, rw, rh = (int(v) for v in roi)
+        cv2.rectangle(image, (rx, ry), (rx + rw, ry + rh), (0, 0, 255), 2)
+
+        # trail: polyline pieces between track losses
+        piece = []
+        for p in list(self._trail) + [None]:
+            if p is not None:
+                piece.append(p)
+                continue
+            if len(piece) > 1:
+                cv2.polylines(image, [np.array(piece, np.int32)], False, (0, 200, 255), 1)
+            piece = []
+
+        bounces = list(self._bounces)
+        for i, (x, y, text) in enumerate(bounces):
+            # older bounces fade to grey
+            shade = 80 + 175 * (i + 1) // len(bounces)
+            cv2.circle(image, (x, y), 5, (shade, 0, shade), 2)
+            if text:
+                cv2.putText(image, str(text), (x + 6, y - 6), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.4, (shade, 0, shade), 1)
+
+        if box is not None:
+            x, y, w, h = box
+            cv2.rectangle(image, (x, y), (x + w, y + h), (0, 255, 0), 2)
+            if label:
+                cv2.putText(image, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX,
+                            0.5, (0, 255, 0), 1)
+
+        goal = self._goal
+        if goal is not None and time.monotonic() - goal[1] < self.goal_seconds:
+            cv2.putText(image, f"GOAL TEAM {goal[0]}", (10, 30), cv2.FONT_HERSHEY_SIMPLEX,
+                        0.9, (255, 255, 255), 2)
+        return image
@@ -0,0 +1,118 @@
+# field_model.py
+"""
+Zone lookup over the field ROI.
+
+Every zone layer declared in field_config.json ("zones") is rasterised
+once into a (field_height, field_width) uint8 array of zone IDs, so
+finding the zone of a position is a single array index.
+
+Layer types:
+    {"type": "strips", "axis": "x", "count": 16}
+        equal strips along one axis, IDs 0..count-1
+    {"type": "grid", "cols": 4, "rows": 4}
+        IDs row * cols + col
+    {"type": "rects", "rects": [{"id": 1, "rect": [x0, y0, x1, y1]}, ...]}
+        listed rectangles (later ones win), everything else is 0;
+        corners are inclusive field pixels, negative values count from
+        the far edge like the goal lines
+"""
+import numpy as np
+
+from goal_scored import load_field_config, resolve_coord
+
+
+def _strips(width, height, spec):
+    count = spec["count"]
+    if spec.get("axis", "x") == "x":
+        # same as Quadrant_identifier.classify_region, 0-based
+        ids = np.minimum(np.arange(width) * count // width, count - 1).astype(np.uint8)
+        return np.broadcast_to(ids, (height, width)).copy()
+    ids = np.minimum(np.arange(height) * count // height, count - 1).astype(np.uint8)
+    return np.broadcast_to(ids[:, None], (height, width)).copy()
+
+
+def _grid(width, height, spec):
+    cols, rows = spec["cols"], spec["rows"]
+    col = np.minimum(np.arange(width) * cols // width, cols - 1)
+    row = np.minimum(np.arange(height) * rows // height, rows - 1)
+    return (row[:, None] * cols + col[None, :]).astype(np.uint8)
+
+
+def _rects(width, height, spec):
+    zones = np.zeros((height, width), np.uint8)
+    for entry in spec["rects"]:
+        x0, y0, x1, y1 = entry["rect"]
+        x0, x1 = resolve_coord(x0, width), resolve_coord(x1, width)
+        y0, y1 = resolve_coord(y0, height), resolve_coord(y1, height)
+        zones[max(y0, 0):y1 + 1, max(x0, 0):x1 + 1] = entry["id"]
+    return zones
+
+
+_BUILDERS = {
+    "strips": _strips,
+    "grid": _grid,
+    "rects": _rects,
+}
+
+
+class FieldModel:
+    """
+    Precomputed zone-ID arrays for the current field ROI size.
+    Call set_roi() when the ROI changes; the arrays are rebuilt and
+    swapped in as a whole, so concurrent lookups never see a mix.
+    """
+
+    def __init__(self, field_width, field_height, layout=None):
+        if layout is None:
+            layout = load_field_config()["zones"]
+        self.layout = layout
+        self.field_width = 0
+        self.field_height = 0
+        self._layers = {}
+        self.set_roi(field_width, field_height)
+
+    def set_roi(self, field_width, field_height):
+        layers = {}
+        for name, spec in self.layout.items():
+            zones = _BUILDERS[spec["type"]](field_width, field_height, spec)
+            zones.setflags(write=False)
+            # bytes copy for scalar lookups: indexing it yields a plain int
+            # without going through numpy's scalar machinery
+            layers[name] = (zones, zones.tobytes(), field_width, field_height)
+        # single assignment: readers see either the old or the new layers
+        self._layers = layers
+        self.field_width = field_width
+        self.field_height = field_height
+
+    @property
+    def layers(self):
+        return list(self._layers)
+
+    def zone_map(self, layer):
+        return self._layers[layer][0]
+
+    def zone(self, x, y, layer="quadrant"):
+        """
+        Zone ID at field position (x, y); positions outside are clamped.
+        """
+        _, flat, w, h = self._layers[layer]
+        xi = int(x)
+        yi = int(y)
+        if xi < 0:
+            xi = 0
+        elif xi >= w:
+            xi = w - 1
+        if yi < 0:
+            yi = 0
+        elif yi >= h:
+            yi = h - 1
+        return flat[yi * w + xi]
+
+    def zones(self, xs, ys, layer="quadrant"):
+        """
+        Zone IDs for whole trajectories (arrays of field positions).
+        """
+        zones, _, w, h = self._layers[layer]
+        xi = np.clip(np.asarray(xs).astype(np.intp), 0, w - 1)
+        yi = np.clip(np.asarray(ys).astype(np.intp), 0, h - 1)
+        return zones[yi, xi]
@@ -0,0 +1,168 @@
+# frame_recorder.py
+"""
+Opt-in black-box recorder for the live loop.
+
+Frames, their capture timestamps and detection results go into a
+preallocated, memory-mapped ring on disk:
+
+    <dir>/ring.npy        (N, H, W, 3) uint8 frames
+    <dir>/ring.meta.npy   (N,) META_DTYPE records, seq = -1 for empty slots
+
+A dump of the last few seconds uses the same two-file layout
+(<name>.npy + <name>.meta.npy), so frame_source.RecordingSource (and
+`main.py --source <name>.npy`) can replay either of them.
+"""
+import logging
+import os
+import threading
+from collections import deque
+
+import numpy as np
+
+from pipeline import RingBuffer, DROP_OLDEST
+
+log = logging.getLogger('kikicker.recorder')
+
+META_DTYPE = np.dtype([
+    ("seq", "<i8"),
+    ("timestamp", "<f8"),
+    ("found", "u1"),
+    ("cx", "<i4"), ("cy", "<i4"),
+    ("x", "<i4"), ("y", "<i4"), ("w", "<i4"), ("h", "<i4"),
+])
+
+
+def meta_path(frames_path):
+    """
+    x.npy -> x.meta.npy
+    """
+    return os.path.splitext(frames_path)[0] + ".meta.npy"
+
+
+class _Dump:
+    __slots__ = ("path", "count", "after", "done")
+
+    def __init__(self, path, count, after):
+        self.path = path
+        self.count = count
+        self.after = after      # frames submitted before the request
+        self.done = threading.Event()
+
+
+class FrameRecorder:
+    """
+    submit() only stores a reference to the frame in a bounded queue;
+    the copy into the memory-mapped ring happens on the recorder thread.
+    If the disk falls behind, the oldest queued frames are dropped
+    (counted in `dropped`) instead of slowing the caller down. Dump
+    requests have their own queue and are never dropped.
+    """
+
+    def __init__(self, directory, seconds=10, fps=120, size=(384, 216), queue_size=64):
+        w, h = size
+        self.directory = directory
+        self.fps = fps
+        self.capacity = int(seconds * fps)
+        os.makedirs(directory, exist_ok=True)
+
+        path = os.path.join(directory, "ring.npy")
+        self.frames = np.lib.format.open_memmap(
+            path, mode="w+", dtype=np.uint8, shape=(self.capacity, h, w, 3))
+        self.meta = np.lib.format.open_memmap(
+            meta_path(path), mode="w+", dtype=META_DTYPE, shape=(self.capacity,))
+        self.meta["seq"] = -1
+
+        self.queue = RingBuffer(queue_size, DROP_OLDEST)
+        self.dumps = deque()
+        self.submitted = 0
+        self.written = 0
+        self.running = False
+        self.thread = None
+
+    @property
+    def dropped(self):
+        return self.queue.dropped
+
+    # ------------------------------------------------------------
+
+    def submit(self, seq, timestamp, image, result):
+        """
+        Called from the vision loop. Never copies, never blocks.
+        """
+        self.submitted += 1
+        self.queue.put((seq, timestamp, image, result))
+
+    def save_last(self, seconds, path):
+        """
+        Asks the recorder thread to dump the last `seconds` of the ring
+        to `path` (+ its .meta.npy). Returns an Event set when written.
+        """
+        dump = _Dump(path, min(self.capacity, int(seconds * self.fps)), self.submitted)
+        self.dumps.append(dump)
+        return dump.done
+
+    # ------------------------------------------------------------
+
+    def _write(self, seq, timestamp, image, result):
+        slot = self.written % self.capacity
+        record = self.meta[slot]
+        # invalidate first, so a half-written slot is never replayed
+        record["seq"] = -1
+        self.frames[slot] = image
+        if result is None:
+            record["found"] = 0
+        else:
+            record["found"] = 1
+            (record["cx"], record["cy"], record["x"],
+             record["y"], record["w"], record["h"]) = result
+        record["timestamp"] = timestamp
+        record["seq"] = seq
+        self.written += 1
+
+    def _dump(self, dump):
+        count = min(dump.count, self.written)
+        slots = [(self.written - count + i) % self.capacity for i in range(count)]
+
+        frames = np.lib.format.open_memmap(
+            dump.path, mode="w+", dtype=np.uint8, shape=(count,) + self.frames.shape[1:])
+        meta = np.lib.format.open_memmap(
+            meta_path(dump.path), mode="w+", dtype=META_DTYPE, shape=(count,))
+        for i, slot in enumerate(slots):
+            frames[i] = self.frames[slot]
+            meta[i] = self.meta[slot]
+        frames.flush()
+        meta.flush()
+        del frames, meta
+        dump.done.set()
+
+    def _loop(self):
+        while self.running or len(self.queue) or self.dumps:
+            # a dump waits until every frame submitted before it is
+            # written (or was dropped), or nothing more is coming
+            while self.dumps and (self.written + self.queue.dropped >= self.dumps[0].after
+                                  or not len(self.queue)):
+                dump = self.dumps.popleft()
+                try:
+                    self._dump(dump)
+                except OSError as e:
+                    log.warning("Recorder dump to %s failed: %s", dump.path, e)
+                    dump.done.set()
+            item = self.queue.get(timeout=0.1)
+            if item is not None:
+                self._write(*item)
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.thread = threading.Thread(target=self._loop, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join(timeout=2.0)
+        self.frames.flush()
+        self.meta.flush()
@@ -0,0 +1,344 @@
+# frame_source.py
+"""
+Pluggable frame sources for main.py and the benchmarks.
+
+Every source follows the small part of the Picamera2 API the kicker
+loop uses: start(), capture_array() -> RGB uint8 (H, W, 3), stop().
+Finite sources raise EOFError from capture_array() when they run out
+(unless loop=True).
+"""
+import math
+import os
+import time
+
+import cv2
+import numpy as np
+
+FRAME_SIZE = (384, 216)   # (width, height) used by the live loop
+FPS = 120
+
+
+class FrameSource:
+    def start(self):
+        pass
+
+    def capture_array(self):
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+    def __iter__(self):
+        while True:
+            try:
+                yield self.capture_array()
+            except EOFError:
+                return
+
+
+# ------------------------------------------------------------
+# Camera
+# ------------------------------------------------------------
+
+class PiCameraSource(FrameSource):
+    def __init__(self, size=FRAME_SIZE, fps=FPS, camera=0):
+        """
+        camera: index of the camera (several on a Pi 5 / CM4)
+        """
+        # imported here so everything else runs without a Pi
+        from picamera2 import Picamera2
+
+        self.picam2 = Picamera2(camera)
+        config = self.picam2.create_preview_configuration(
+            raw=self.picam2.sensor_modes[0],
+            main={"size": size},
+            controls={"FrameRate": fps}
+        )
+        self.picam2.configure(config)
+
+    def start(self):
+        self.picam2.start()
+        time.sleep(1.0)
+
+    def capture_array(self):
+        return self.picam2.capture_array()
+
+    def stop(self):
+        self.picam2.stop()
+
+
+# ------------------------------------------------------------
+# Recordings
+# ------------------------------------------------------------
+
+class VideoFileSource(FrameSource):
+    """
+    Any container/codec OpenCV can read. Frames are converted to RGB.
+    """
+
+    def __init__(self, path, loop=False):
+        self.path = path
+        self.loop = loop
+        self.cap = cv2.VideoCapture(path)
+        if not self.cap.isOpened():
+            raise OSError(f"cannot open video: {path}")
+
+    def capture_array(self):
+        ok, frame = self.cap.read()
+        if not ok and self.loop:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            ok, frame = self.cap.read()
+        if not ok:
+            raise EOFError(self.path)
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def stop(self):
+        self.cap.release()
+
+
+class ArrayFrameSource(FrameSource):
+    """
+    Replays an (N, H, W, 3) RGB array. Frames are returned as views,
+    so a memory-mapped array is read straight from disk without copies.
+    """
+
+    def __init__(self, frames, loop=False):
+        self.frames = frames
+        self.loop = loop
+        self.index = 0
+
+    def __len__(self):
+        return len(self.frames)
+
+    def capture_array(self):
+        if self.index >= len(self.frames):
+            if not self.loop or len(self.frames) == 0:
+                raise EOFError("end of recording")
+            self.index = 0
+        frame = self.frames[self.index]
+        self.index += 1
+        return frame
+
+
+class NpyFrameSource(ArrayFrameSource):
+    """
+    .npy dump of shape (N, H, W, 3), memory-mapped by default.
+    """
+
+    def __init__(self, path, loop=False, mmap=True):
+        frames = np.load(path, mmap_mode="r" if mmap else None)
+        if frames.ndim != 4 or frames.shape[3] != 3:
+            raise ValueError(f"expected (N, H, W, 3) frames in {path}, got {frames.shape}")
+        super().__init__(frames, loop)
+
+
+class RecordingSource(ArrayFrameSource):
+    """
+    Frames written by frame_recorder.FrameRecorder: x.npy + x.meta.npy.
+    Slots are replayed in capture order (empty ring slots skipped);
+    the record of the last returned frame is kept in `last_meta`.
+    """
+
+    def __init__(self, path, loop=False):
+        from frame_recorder import meta_path
+
+        frames = np.load(path, mmap_mode="r")
+        meta = np.load(meta_path(path))
+        valid = np.flatnonzero(meta["seq"] >= 0)
+        self.order = valid[np.argsort(meta["seq"][valid], kind="stable")]
+        self.meta = meta[self.order]
+        self.timestamps = self.meta["timestamp"]
+        self.last_meta = None
+        super().__init__(frames, loop)
+
+    def __len__(self):
+        return len(self.order)
+
+    def capture_array(self):
+        if self.index >= len(self.order):
+            if not self.loop or len(self.order) == 0:
+                raise EOFError("end of recording")
+            self.index = 0
+        self.last_meta = self.meta[self.index]
+        frame = self.frames[self.order[self.index]]
+        self.index += 1
+        return frame
+
+
+class RawFrameSource(ArrayFrameSource):
+    """
+    Headerless dump of consecutive RGB frames, memory-mapped.
+    """
+
+    def __init__(self, path, size=FRAME_SIZE, loop=False):
+        w, h = size
+        frames = np.memmap(path, dtype=np.uint8, mode="r").reshape(-1, h, w, 3)
+        super().__init__(frames, loop)
+
+
+# ------------------------------------------------------------
+# Synthetic
+# ------------------------------------------------------------
+
+FIELD_RGB = (40, 140, 40)
+BALL_RGB = (255, 120, 0)
+BORDER_RGB = (90, 90, 90)
+
+
+def rally_script(field, speed=6.0, angle=0.6, frames=600, bounces=None):
+    """
+    Ball moving at `speed` px/frame, reflecting off the field walls.
+    Returns the list of (x, y) ball centres in frame coordinates.
+    If a list is passed as `bounces`, the exact (frame, x, y) of every
+    wall reflection is appended to it (frame is fractional).
+    """
+    fx, fy, fw, fh = field
+    r = 8
+    x_lo, x_hi = fx + r, fx + fw - r
+    y_lo, y_hi = fy + r, fy + fh - r
+    x, y = fx + fw / 3, fy + fh / 2
+    vx, vy = speed * math.cos(angle), speed * math.sin(angle)
+    points = []
+    for i in range(frames):
+        x += vx
+        y += vy
+        # mirror the overshoot back into the field
+        for _ in range(2):
+            hit = None
+            if x < x_lo or x > x_hi:
+                wall = x_lo if x < x_lo else x_hi
+                frac = (x - wall) / vx
+                hit = (i + 1 - frac, wall, y - vy * frac)
+                x = 2 * wall - x
+                vx = -vx
+            elif y < y_lo or y > y_hi:
+                wall = y_lo if y < y_lo else y_hi
+                frac = (y - wall) / vy
+                hit = (i + 1 - frac, x - vx * frac, wall)
+                y = 2 * wall - y
+                vy = -vy
+            if hit is None:
+                break
+            if bounces is not None:
+                bounces.append(hit)
+        points.append((x, y))
+    return points
+
+
+def waypoint_script(waypoints, speed=6.0):
+    """
+    Ball moving along the polyline `waypoints` at `speed` px/frame.
+    """
+    points = []
+    for (x0, y0), (x1, y1) in zip(waypoints, waypoints[1:]):
+        steps = max(1, int(math.hypot(x1 - x0, y1 - y0) / speed))
+        for i in range(1, steps + 1):
+            t = i / steps
+            points.append((x0 + (x1 - x0) * t, y0 + (y1 - y0) * t))
+    return points
+
+
+class SyntheticSource(FrameSource):
+    """
+    Renders an orange ball on a green field along a scripted trajectory.
+    `points` is a list of ball centres (None = ball not visible);
+    the centre of the last rendered frame is kept in `truth`.
+    """
+
+    def __init__(self, points=None, size=FRAME_SIZE, field=None,
+                 ball_radius=7, noise=8, loop=False, seed=0):
+        w, h = size
+        self.field = field or (24, 12, w - 48, h - 24)
+        self.points = points if points is not None else rally_script(self.field)
+        self.ball_radius = ball_radius
+        self.loop = loop
+        self.index = 0
+        self.truth = None
+        self._rng = np.random.default_rng(seed)
+
+        fx, fy, fw, fh = self.field
+        self.background = np.empty((h, w, 3), np.uint8)
+        self.background[:] = BORDER_RGB
+        self.background[fy:fy + fh, fx:fx + fw] = FIELD_RGB
+        if noise:
+            self.background += self._rng.integers(0, noise, self.background.shape, dtype=np.uint8)
+
+    def __len__(self):
+        return len(self.points)
+
+    def capture_array(self):
+        if self.index >= len(self.points):
+            if not self.loop:
+                raise EOFError("end of script")
+            self.index = 0
+        point = self.points[self.index]
+        self.index += 1
+
+        frame = self.background.copy()
+        self.truth = point
+        if point is not None:
+            cx, cy = int(round(point[0])), int(round(point[1]))
+            cv2.circle(frame, (cx, cy), self.ball_radius, BALL_RGB, -1)
+        return frame
+
+
+class PacedSource(FrameSource):
+    """
+    Wraps a source so frames come out no faster than `fps`,
+    e.g. to replay a recording at camera speed.
+    """
+
+    def __init__(self, source, fps=FPS):
+        self.source = source
+        self.period = 1.0 / fps
+        self._next = None
+
+    def start(self):
+        self.source.start()
+        self._next = time.monotonic()
+
+    def capture_array(self):
+        now = time.monotonic()
+        if self._next is None:
+            self._next = now
+        if self._next > now:
+            time.sleep(self._next - now)
+        self._next = max(self._next + self.period, now - self.period)
+        return self.source.capture_array()
+
+    def stop(self):
+        self.source.stop()
+
+
+# ------------------------------------------------------------
+
+SOURCES = ("picamera[:N]", "synthetic", "<file.npy|file.raw|video>")
+
+
+def open_source(spec, size=FRAME_SIZE, fps=FPS, loop=False, realtime=False):
+    """
+    spec: "picamera", "picamera:N" (camera N), "synthetic" or the path
+    of a recording.
+    With realtime=True non-camera sources are paced to `fps`.
+    """
+    if spec == "picamera" or spec.startswith("picamera:"):
+        _, _, camera = spec.partition(":")
+        return PiCameraSource(size=size, fps=fps, camera=int(camera or 0))
+
+    if spec == "synthetic":
+        source = SyntheticSource(size=size, loop=loop)
+    else:
+        if not os.path.exists(spec):
+            raise FileNotFoundError(spec)
+        base, ext = os.path.splitext(spec)
+        ext = ext.lower()
+        if ext == ".npy" and os.path.exists(base + ".meta.npy"):
+            source = RecordingSource(spec, loop=loop)
+        elif ext == ".npy":
+            source = NpyFrameSource(spec, loop=loop)
+        elif ext in (".raw", ".rgb"):
+            source = RawFrameSource(spec, size=size, loop=loop)
+        else:
+            source = VideoFileSource(spec, loop=loop)
+
+    return PacedSource(source, fps) if realtime else source
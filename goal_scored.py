@@ -1,26 +1,176 @@
-def check_goal_scored(curr_pos, goal_latched):
+import json
+import math
+import os
+
+DEFAULT_FIELD_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "field_config.json")
+
+
+def load_field_config(path=DEFAULT_FIELD_CONFIG):
     """
-    Simple position-based goal detection.
-    If ball is inside goal line region → GOAL.
-    Uses FIELD coordinates (pixels).
+    Reads the field description (goal mouths, zones, ...) from JSON.
     """
+    with open(path) as f:
+        return json.load(f)
 
-    if goal_latched:
-        return None, True
 
-    x, y = curr_pos
+def resolve_coord(value, size):
+    """
+    A field-config coordinate along an axis of `size` pixels: negative
+    values are measured from the far edge (like Python indices).
+    """
+    return size + value if value < 0 else value
+
+
+class GoalLine:
+    """
+    One goal mouth: the segment p1-p2 in FIELD coordinates (pixels).
+    """
+    __slots__ = ("team", "p1", "p2")
+
+    def __init__(self, team, p1, p2):
+        self.team = team
+        self.p1 = p1
+        self.p2 = p2
+
+    @classmethod
+    def from_config(cls, entry, field_width, field_height):
+        (x1, y1), (x2, y2) = entry["line"]
+        return cls(
+            entry["team"],
+            (resolve_coord(x1, field_width), resolve_coord(y1, field_height)),
+            (resolve_coord(x2, field_width), resolve_coord(y2, field_height)),
+        )
+
+
+def _point_segment_dist(p, a, b):
+    ax, ay = a
+    dx, dy = b[0] - ax, b[1] - ay
+    length2 = dx * dx + dy * dy
+    if length2 == 0:
+        return math.hypot(p[0] - ax, p[1] - ay)
+    t = ((p[0] - ax) * dx + (p[1] - ay) * dy) / length2
+    t = max(0.0, min(1.0, t))
+    return math.hypot(p[0] - (ax + t * dx), p[1] - (ay + t * dy))
+
+
+def _cross(o, a, b):
+    return (a[0] - o[0]) * (b[1] - o[1]) - (a[1] - o[1]) * (b[0] - o[0])
+
+
+def segment_distance(p1, p2, q1, q2):
+    """
+    Smallest distance between segments p1-p2 and q1-q2 (0 if they cross).
+    A degenerate segment (p1 == p2) is a point.
+    """
+    d1 = _cross(q1, q2, p1)
+    d2 = _cross(q1, q2, p2)
+    d3 = _cross(p1, p2, q1)
+    d4 = _cross(p1, p2, q2)
+    if ((d1 > 0) != (d2 > 0) and d1 != 0 and d2 != 0 and
+            (d3 > 0) != (d4 > 0) and d3 != 0 and d4 != 0):
+        return 0.0
+    return min(
+        _point_segment_dist(p1, q1, q2),
+        _point_segment_dist(p2, q1, q2),
+        _point_segment_dist(q1, p1, p2),
+        _point_segment_dist(q2, p1, p2),
+    )
+
+
+class GoalEngine:
+    """
+    Goal detection against every goal mouth in the field config.
+
+    Each frame the ball's path since the previous frame (prev -> curr,
+    which may be a tracker prediction during dropouts) is tested
+    against each goal line, so a fast ball that jumps over the line
+    between two frames still counts. After a goal the engine stays
+    latched until the ball is more than `reset_distance` pixels away
+    from every goal line again.
+    """
+
+    def __init__(self, field_width, field_height, config=None):
+        if config is None:
+            config = load_field_config()
+        self.config = config
+        self.tolerance = config.get("tolerance", 2)
+        self.reset_distance = config.get("reset_distance", 20)
+        self.latched = False
+        self.set_field_size(field_width, field_height)
+
+    def set_field_size(self, field_width, field_height):
+        self.field_width = field_width
+        self.field_height = field_height
+        self.lines = [GoalLine.from_config(g, field_width, field_height)
+                      for g in self.config["goals"]]
+        # bounding boxes grown by the tolerance, for a cheap early reject
+        t = self.tolerance
+        self._boxes = [
+            (min(g.p1[0], g.p2[0]) - t, min(g.p1[1], g.p2[1]) - t,
+             max(g.p1[0], g.p2[0]) + t, max(g.p1[1], g.p2[1]) + t)
+            for g in self.lines
+        ]
+
+    def reset(self):
+        self.latched = False
+
+    def check(self, curr_pos, prev_pos=None):
+        """
+        Returns the scoring team ("TEAM1"/"TEAM2") or None.
+        """
+        if prev_pos is None:
+            prev_pos = curr_pos
 
-    # --------------------------------
-    # LEFT TEAM GOAL REGION
-    # Line: (50,13) -> (79,13)
-    # --------------------------------
-    GOAL_X_MIN = 50
-    GOAL_X_MAX = 79
-    GOAL_Y = 13
-    Y_TOLERANCE = 2   # +/- pixels
+        if self.latched:
+            if all(_point_segment_dist(curr_pos, g.p1, g.p2) > self.reset_distance
+                   for g in self.lines):
+                self.latched = False
+            return None
+
+        px, py = prev_pos
+        cx, cy = curr_pos
+        for g, (x0, y0, x1, y1) in zip(self.lines, self._boxes):
+            if (max(px, cx) < x0 or min(px, cx) > x1 or
+                    max(py, cy) < y0 or min(py, cy) > y1):
+                continue
+            if segment_distance(prev_pos, curr_pos, g.p1, g.p2) <= self.tolerance:
+                self.latched = True
+                return g.team
+        return None
+
+    def check_path(self, points):
+        """
+        Same as check() along a polyline (e.g. several predicted positions).
+        """
+        team = None
+        for prev, curr in zip(points, points[1:]):
+            team = self.check(curr, prev) or team
+        return team
+
+
+_engines = {}
+
+
+def check_goal_scored(curr_pos, goal_latched, prev_pos=None, field_size=None):
+    """
+    Stateless wrapper kept for existing callers: returns (team, goal_latched).
+    `field_size` (w, h) is needed for goal lines given relative to the far edge.
+    """
+    if goal_latched:
+        return None, True
 
-    if (GOAL_X_MIN <= x <= GOAL_X_MAX and
-        GOAL_Y - Y_TOLERANCE <= y <= GOAL_Y + Y_TOLERANCE):
-        return "TEAM2", True   # Left team scored
+    key = field_size
+    if key not in _engines:
+        w, h = field_size if field_size is not None else (0, 0)
+        config = load_field_config()
+        if field_size is None:
+            # only the lines given in absolute coordinates can be used
+            config = dict(config, goals=[
+                g for g in config["goals"] if min(min(p) for p in g["line"]) >= 0
+            ])
+        _engines[key] = GoalEngine(w, h, config)
 
-    return None, False
+    engine = _engines[key]
+    engine.reset()
+    team = engine.check(curr_pos, prev_pos)
+    return team, team is not None
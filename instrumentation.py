@@ -0,0 +1,361 @@
+# instrumentation.py
+"""
+Low-overhead telemetry for the kicker loop.
+
+- Histogram: fixed-memory latency histogram (log-spaced bins from 1 us
+  to 10 s), so p50/p99/max cost nothing to keep at 120 FPS
+- ThreadHistograms: one Histogram per writing thread, read as their
+  sum, for stages several workers run at once
+- Instruments: named histograms, counters and gauges (callables read
+  only when a snapshot is taken); wrap() times any callable
+- StatsServer: the snapshot as JSON over HTTP (GET /stats) or a Unix
+  socket (one JSON document per connection)
+- EventLog: rate-limited key=value log lines, replacing per-frame prints
+
+    inst = Instruments()
+    t0 = perf_counter()
+    ...
+    inst.record("detect", perf_counter() - t0)
+    inst.count("misses")
+    print(inst.summary())
+"""
+import json
+import logging
+import math
+import os
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+perf_counter = time.perf_counter
+
+
+class Histogram:
+    """
+    Counts of values (seconds) in log-spaced bins, `per_decade` bins per
+    factor of 10 between `lo` and `hi`; values outside land in the first
+    or last bin. Percentiles are accurate to one bin (~12% with the
+    default 20 per decade); count, mean and max are exact.
+    One writer at a time; readers may see a record half-applied.
+    """
+    __slots__ = ("lo", "per_decade", "counts", "count", "total", "max", "_log_lo", "_last")
+
+    def __init__(self, lo=1e-6, hi=10.0, per_decade=20):
+        self.lo = lo
+        self.per_decade = per_decade
+        self._log_lo = math.log10(lo)
+        n = int(math.ceil((math.log10(hi) - self._log_lo) * per_decade)) + 1
+        self.counts = [0] * n
+        self._last = n - 1
+        self.reset()
+
+    def reset(self):
+        self.counts = [0] * len(self.counts)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value):
+        if value > self.lo:
+            i = int((math.log10(value) - self._log_lo) * self.per_decade)
+            if i > self._last:
+                i = self._last
+        else:
+            i = 0
+        self.counts[i] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def add(self, other):
+        """
+        Fold in the counts of `other` (same lo/hi/per_decade).
+        """
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.count += other.count
+        self.total += other.total
+        if other.max > self.max:
+            self.max = other.max
+
+    def percentile(self, p):
+        """
+        Upper edge of the bin holding the p-th percentile (0..100).
+        """
+        if not self.count:
+            return 0.0
+        rank = p / 100.0 * self.count
+        seen = 0
+        for i, c in enumerate(self.counts):
+            seen += c
+            if seen >= rank and c:
+                edge = 10 ** (self._log_lo + (i + 1) / self.per_decade)
+                return min(edge, self.max)
+        return self.max
+
+    def snapshot(self):
+        """
+        Summary in milliseconds.
+        """
+        return {
+            "count": self.count,
+            "mean_ms": self.total / self.count * 1e3 if self.count else 0.0,
+            "p50_ms": self.percentile(50) * 1e3,
+            "p99_ms": self.percentile(99) * 1e3,
+            "max_ms": self.max * 1e3,
+        }
+
+
+class ThreadHistograms:
+    """
+    A Histogram for each thread that records, so several writers never
+    share one; count, percentile() and snapshot() read the sum of all
+    of them (a merged copy per call, so readers only cost the reader).
+    """
+
+    def __init__(self, **kwargs):
+        self._kwargs = kwargs
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.shards = []
+
+    def _shard(self):
+        h = Histogram(**self._kwargs)
+        with self._lock:
+            self.shards = self.shards + [h]     # readers iterate the old list
+        self._local.histogram = h
+        return h
+
+    def record(self, value):
+        h = getattr(self._local, "histogram", None)
+        if h is None:
+            h = self._shard()
+        h.record(value)
+
+    def merged(self):
+        m = Histogram(**self._kwargs)
+        for h in self.shards:
+            m.add(h)
+        return m
+
+    def reset(self):
+        for h in self.shards:
+            h.reset()
+
+    @property
+    def count(self):
+        return sum(h.count for h in self.shards)
+
+    def percentile(self, p):
+        return self.merged().percentile(p)
+
+    def snapshot(self):
+        return self.merged().snapshot()
+
+
+class Instruments:
+    def __init__(self):
+        self.histograms = {}
+        self.counters = {}
+        self.gauges = {}
+        self.started = time.monotonic()
+        # counters at the last summary(), for per-interval rates
+        self._last_summary = (self.started, {})
+
+    def histogram(self, name, histogram=None):
+        """
+        The histogram called `name` (created, or `histogram` registered).
+        """
+        if histogram is not None:
+            self.histograms[name] = histogram
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histograms[name] = Histogram()
+        return h
+
+    def record(self, name, seconds):
+        h = self.histograms.get(name)
+        if h is None:
+            h = self.histogram(name)
+        h.record(seconds)
+
+    def count(self, name, n=1):
+        self.counters[name] = self.counters.get(name, 0) + n
+
+    def gauge(self, name, fn):
+        """
+        fn() is called (on the reader's thread) for every snapshot.
+        """
+        self.gauges[name] = fn
+
+    def wrap(self, name, fn, threads=1):
+        """
+        fn, timed into histogram `name`; with threads > 1 (fn called
+        from several threads at once) each thread records into its own.
+        """
+        h = self.histogram(name, ThreadHistograms() if threads > 1 else None)
+        record = h.record
+
+        def timed(*args, **kwargs):
+            t0 = perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                record(perf_counter() - t0)
+        return timed
+
+    # ------------------------------------------------------------
+
+    def snapshot(self):
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception as e:
+                gauges[name] = f"error: {e}"
+        return {
+            "uptime_s": time.monotonic() - self.started,
+            "latency": {name: h.snapshot() for name, h in list(self.histograms.items())},
+            "counters": dict(self.counters),
+            "gauges": gauges,
+        }
+
+    def summary(self, rate_counter="frames"):
+        """
+        Compact one-line status: the rate of `rate_counter` since the
+        last summary, p50/p99 of every histogram and all counters.
+        """
+        now = time.monotonic()
+        last_t, last = self._last_summary
+        counters = dict(self.counters)
+        self._last_summary = (now, counters)
+        elapsed = now - last_t
+        rate = (counters.get(rate_counter, 0) - last.get(rate_counter, 0)) / elapsed if elapsed > 0 else 0.0
+        parts = [f"{rate_counter}/s {rate:.0f}"]
+        for name, h in list(self.histograms.items()):
+            if h.count:
+                parts.append(f"{name} {h.percentile(50) * 1e3:.2f}/{h.percentile(99) * 1e3:.2f}ms")
+        parts += [f"{name} {value}" for name, value in counters.items() if name != rate_counter]
+        return " | ".join(parts)
+
+
+# ------------------------------------------------------------
+# stats endpoint
+# ------------------------------------------------------------
+
+class _HTTPHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.rstrip("/") not in ("", "/stats"):
+            self.send_error(404)
+            return
+        body = json.dumps(self.server.instruments.snapshot(), default=str).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class _UnixHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        body = json.dumps(self.server.instruments.snapshot(), default=str).encode()
+        self.request.sendall(body + b"\n")
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class StatsServer:
+    """
+    Serves Instruments.snapshot() as JSON on a background thread.
+
+    address: "unix:/path/to.sock", "host:port" or a port number (HTTP)
+    """
+
+    def __init__(self, instruments, address):
+        self.instruments = instruments
+        self.address = str(address)
+        self._server = None
+        self._thread = None
+
+    def start(self):
+        if self.address.startswith("unix:"):
+            path = self.address[len("unix:"):]
+            if os.path.exists(path):
+                os.unlink(path)
+            server = _UnixServer(path, _UnixHandler)
+        else:
+            host, _, port = self.address.rpartition(":")
+            server = ThreadingHTTPServer((host or "127.0.0.1", int(port)), _HTTPHandler)
+            server.daemon_threads = True
+        server.instruments = self.instruments
+        self._server = server
+        self._thread = threading.Thread(target=server.serve_forever, daemon=True)
+        self._thread.start()
+
+    @property
+    def port(self):
+        if self._server is None or self.address.startswith("unix:"):
+            return None
+        return self._server.server_address[1]
+
+    def stop(self):
+        if self._server is None:
+            return
+        self._server.shutdown()
+        self._server.server_close()
+        if self.address.startswith("unix:"):
+            try:
+                os.unlink(self.address[len("unix:"):])
+            except OSError:
+                pass
+        self._server = None
+
+
+# ------------------------------------------------------------
+# rate-limited logging
+# ------------------------------------------------------------
+
+class EventLog:
+    """
+    key=value log lines through `logging`, at most one per `interval`
+    seconds for each kind of event; how many were held back is added
+    to the next line that goes out. The check comes before any
+    formatting, so a suppressed event costs a dict lookup.
+
+        events = EventLog("kikicker", intervals={"goal": 0})
+        events.event("ball", x=12.5, y=40)
+    """
+
+    def __init__(self, name="kikicker", interval=1.0, intervals=None, level=logging.INFO):
+        self.logger = logging.getLogger(name)
+        self.interval = interval
+        self.intervals = dict(intervals or {})
+        self.level = level
+        self._next = {}
+        self.suppressed = {}
+
+    def event(self, kind, **fields):
+        now = time.monotonic()
+        if now < self._next.get(kind, 0.0):
+            self.suppressed[kind] = self.suppressed.get(kind, 0) + 1
+            return False
+        self._next[kind] = now + self.intervals.get(kind, self.interval)
+        if not self.logger.isEnabledFor(self.level):
+            return False
+        held = self.suppressed.pop(kind, 0)
+        parts = [kind]
+        for key, value in fields.items():
+            if isinstance(value, float):
+                value = f"{value:.1f}"
+            parts.append(f"{key}={value}")
+        if held:
+            parts.append(f"(+{held} suppressed)")
+        self.logger.log(self.level, " ".join(parts))
+        return True
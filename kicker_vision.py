@@ -2,6 +2,8 @@
 import cv2
 import numpy as np
 
+from color_lut import ColorLUT, BALL, FIELD
+
 # Ball color in HSV (orange)
 LOWER_ORANGE = np.array([10, 120, 129])
 UPPER_ORANGE = np.array([40, 255, 255])
@@ -11,38 +13,185 @@ MIN_BALL_AREA = 100
 LOWER_GREEN = np.array([30, 50, 30])
 UPPER_GREEN = np.array([80, 255, 255])
 
+# Colour classification backend:
+#   "hsv" - cvtColor(RGB2HSV) + inRange on every call
+#   "lut" - precomputed RGB -> class table (see color_lut.py)
+COLOR_BACKENDS = ("hsv", "lut")
+
+
+def _build_lut(ball_range, field_range, bits, cache=True):
+    bounds = {BALL: ball_range, FIELD: field_range}
+    if not cache:
+        return ColorLUT.build(bounds, bits=bits)
+    return ColorLUT.load_or_build(bounds, bits=bits)
+
+
+def _hsv_range(bounds):
+    return tuple(np.asarray(v, np.uint8) for v in bounds)
+
 
-def find_playfield_roi(image, debug=False):
+class ColorThresholds:
     """
-    Detects the green field and returns its bounding box (x, y, w, h),
-    or None if not found.
-    If debug=True, shows step-by-step windows.
+    The colours one session (table) looks for: ball and field HSV
+    ranges, the minimum ball area and the classification backend.
+    Each TableSession keeps its own, so a colour profile or re-tune of
+    one table never reaches another in the same process. What the
+    masks read is swapped as one tuple (`state`), so a mask never mixes
+    an old lower with a new upper bound, or old ranges with a new LUT.
     """
 
-    # 1) Convert to HSV (input image is expected in RGB)
+    def __init__(self, ball_range=(LOWER_ORANGE, UPPER_ORANGE),
+                 field_range=(LOWER_GREEN, UPPER_GREEN), min_ball_area=MIN_BALL_AREA,
+                 backend="hsv", bits=8):
+        self.backend = "hsv"
+        self.bits = bits
+        # (ball range, field range, minimum ball area, LUT or None)
+        self.state = (_hsv_range(ball_range), _hsv_range(field_range), int(min_ball_area), None)
+        self.set_backend(backend, bits)
+
+    @property
+    def ball_range(self):
+        return self.state[0]
+
+    @property
+    def field_range(self):
+        return self.state[1]
+
+    @property
+    def min_ball_area(self):
+        return self.state[2]
+
+    def set_backend(self, name, bits=8):
+        """
+        Selects how the ball/field masks are computed.
+        The LUT is built (or loaded from the on-disk cache) here, once.
+        """
+        if name not in COLOR_BACKENDS:
+            raise ValueError(f"unknown colour backend: {name}")
+        ball_range, field_range, min_area, _ = self.state
+        lut = None if name == "hsv" else _build_lut(ball_range, field_range, bits)
+        self.backend = name
+        self.bits = bits
+        self.state = (ball_range, field_range, min_area, lut)
+
+    def set(self, ball_range, field_range, min_area=None, cache=True):
+        """
+        Replaces the HSV ranges (and the minimum ball area) while the loop
+        runs. With the LUT backend the new table is built (or loaded from
+        the cache) before anything is swapped, so call this off the hot
+        path when the thresholds are new. cache=False: build in memory
+        only, for thresholds that won't be seen again (re-tuning).
+        """
+        ball_range = _hsv_range(ball_range)
+        field_range = _hsv_range(field_range)
+        if min_area is None:
+            min_area = self.min_ball_area
+        lut = None
+        if self.backend == "lut":
+            lut = _build_lut(ball_range, field_range, self.bits, cache)
+        self.state = (ball_range, field_range, int(min_area), lut)
+
+
+# the constants above, for callers that don't pass their own; never changed
+DEFAULT_COLORS = ColorThresholds()
+
+
+def orange_mask(image, colors=None):
+    """
+    0/255 mask of ball-coloured pixels in an RGB image.
+    """
+    (lower, upper), _, _, lut = (colors or DEFAULT_COLORS).state
+    if lut is not None:
+        return lut.mask(image, BALL)
     hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    return cv2.inRange(hsv, lower, upper)
 
-    # 2) Green mask
-    mask = cv2.inRange(hsv, LOWER_GREEN, UPPER_GREEN)
+
+def green_mask(image, colors=None):
+    """
+    0/255 mask of field-coloured pixels in an RGB image.
+    """
+    _, (lower, upper), _, lut = (colors or DEFAULT_COLORS).state
+    if lut is not None:
+        return lut.mask(image, FIELD)
+    hsv = cv2.cvtColor(image, cv2.COLOR_RGB2HSV)
+    return cv2.inRange(hsv, lower, upper)
+
+
+def _field_contour(image, kernel_size=50, colors=None):
+    """
+    (mask, closed mask, largest green contour or None).
+    """
+    # 1+2) Green mask (input image is expected in RGB)
+    mask = green_mask(image, colors)
 
     # 3) Close gaps
-    kernel = np.ones((50, 50), np.uint8)
-    closed = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, kernel)
+    # (on a zero border: with the default border the erosion can't
+    # take back what the dilation grew within a kernel of the edge)
+    kernel = np.ones((kernel_size, kernel_size), np.uint8)
+    k = kernel_size
+    padded = cv2.copyMakeBorder(mask, k, k, k, k, cv2.BORDER_CONSTANT, value=0)
+    closed = cv2.morphologyEx(padded, cv2.MORPH_CLOSE, kernel)[k:-k, k:-k]
 
     # 4) Find contours on closed mask
     contours, _ = cv2.findContours(closed, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
+        return mask, closed, None
+
+    # 5) Select largest green area
+    return mask, closed, max(contours, key=cv2.contourArea)
+
+
+def find_playfield_corners(image, colors=None):
+    """
+    The four corners of the green field as a (4, 2) float32 array,
+    ordered top-left, top-right, bottom-right, bottom-left (image
+    coordinates), or None if not found. Unlike the bounding box they
+    follow a tilted or perspective-distorted field.
+    """
+    _, _, largest = _field_contour(image, colors=colors)
+    if largest is None:
+        return None
+
+    hull = cv2.convexHull(largest)
+    perimeter = cv2.arcLength(hull, True)
+    quad = None
+    for eps in (0.01, 0.02, 0.03, 0.05, 0.08):
+        approx = cv2.approxPolyDP(hull, eps * perimeter, True)
+        if len(approx) == 4:
+            quad = approx.reshape(4, 2).astype(np.float32)
+            break
+    if quad is None:
+        # no clean quadrilateral: the rotated bounding rectangle
+        quad = cv2.boxPoints(cv2.minAreaRect(hull)).astype(np.float32)
+
+    # TL has the smallest x + y, BR the largest; TR the smallest y - x
+    s = quad.sum(axis=1)
+    d = quad[:, 1] - quad[:, 0]
+    return np.array([quad[np.argmin(s)], quad[np.argmin(d)],
+                     quad[np.argmax(s)], quad[np.argmax(d)]], np.float32)
+
+
+def find_playfield_roi(image, debug=False, kernel_size=50, colors=None):
+    """
+    Detects the green field and returns its bounding box (x, y, w, h),
+    or None if not found.
+    kernel_size: gap-closing kernel; scale it down with the image.
+    colors: the session's ColorThresholds (None: the defaults).
+    If debug=True, shows step-by-step windows.
+    """
+
+    mask, closed, largest = _field_contour(image, kernel_size, colors)
+    if largest is None:
         if debug:
             print("No contours found.")
         return None
 
-    # 5) Select largest green area
-    largest = max(contours, key=cv2.contourArea)
     x, y, w, h = cv2.boundingRect(largest)
 
     # DEBUG: Show contour on the original image
     if debug:
-        cv2.imshow("Step 1 - HSV", hsv)
+        cv2.imshow("Step 1 - HSV", cv2.cvtColor(image, cv2.COLOR_RGB2HSV))
         cv2.imshow("Step 2 - Green Mask BEFORE Closing", mask)
         cv2.imshow("Step 3 - Green Mask AFTER Closing", closed)
         # For visualization convert RGB->BGR for correct color display in OpenCV
@@ -57,40 +206,161 @@ def find_playfield_roi(image, debug=False):
 
 
 
-def detect_ball(frame, debug=False):
+def _detect_in_region(frame, x0, y0, x1, y1, colors=None):
     """
-    Detects the orange ball in a frame.
-    Returns (cx, cy, x, y, w, h) or None if no ball.
+    Runs the orange threshold + contour search only on frame[y0:y1, x0:x1].
+    Returns (cx, cy, x, y, w, h) in full-frame coordinates, or None.
     """
-    # frame is expected in RGB
-    hsv = cv2.cvtColor(frame, cv2.COLOR_RGB2HSV)
-    mask = cv2.inRange(hsv, LOWER_ORANGE, UPPER_ORANGE)
+    region = frame[y0:y1, x0:x1]
+    if region.size == 0:
+        return None
+
+    colors = colors or DEFAULT_COLORS
+    mask = orange_mask(region, colors)
 
     contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
     if not contours:
         return None
 
     c = max(contours, key=cv2.contourArea)
-    if cv2.contourArea(c) < MIN_BALL_AREA:
+    if cv2.contourArea(c) < colors.min_ball_area:
         return None
 
     x, y, w, h = cv2.boundingRect(c)
+    x += x0
+    y += y0
     cx = x + w // 2
     cy = y + h // 2
-    # If debug is requested, show a visualization (convert to BGR for display)
-    if debug:
-        dbg = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
-        cv2.rectangle(dbg, (x, y), (x + w, y + h), (0, 255, 0), 2)
-        label = f"{cx},{cy}"
-        cv2.putText(dbg, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
-                    (0, 255, 0), 2, cv2.LINE_AA)
-        cv2.imshow("Detect Ball - Debug", dbg)
-        # non-blocking short wait so window updates
-        cv2.waitKey(1)
-
     return (cx, cy, x, y, w, h)
 
 
+def _show_ball_debug(frame, result):
+    # convert to BGR for display
+    cx, cy, x, y, w, h = result
+    dbg = cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
+    cv2.rectangle(dbg, (x, y), (x + w, y + h), (0, 255, 0), 2)
+    label = f"{cx},{cy}"
+    cv2.putText(dbg, label, (x, y - 10), cv2.FONT_HERSHEY_SIMPLEX, 0.7,
+                (0, 255, 0), 2, cv2.LINE_AA)
+    cv2.imshow("Detect Ball - Debug", dbg)
+    # non-blocking short wait so window updates
+    cv2.waitKey(1)
+
+
+def detect_ball(frame, debug=False, roi=None, colors=None):
+    """
+    Detects the orange ball in a frame.
+    If roi=(x, y, w, h) is given, only that part of the frame is searched.
+    colors: the session's ColorThresholds (None: the defaults).
+    Returns (cx, cy, x, y, w, h) in frame coordinates or None if no ball.
+    """
+    # frame is expected in RGB
+    if roi is None:
+        result = _detect_in_region(frame, 0, 0, frame.shape[1], frame.shape[0], colors)
+    else:
+        rx, ry, rw, rh = roi
+        result = _detect_in_region(frame, rx, ry, rx + rw, ry + rh, colors)
+
+    # If debug is requested, show a visualization
+    if debug and result is not None:
+        _show_ball_debug(frame, result)
+
+    return result
+
+
+class BallTracker:
+    """
+    Stateful wrapper around detect_ball for the live loop.
+
+    - unlocked: searches the whole field ROI
+    - locked:   searches only a `window` x `window` box around the
+                position predicted from the last two detections
+    After `max_misses` consecutive misses in the window it unlocks
+    and goes back to the full-ROI search.
+    Frames must be passed in capture order.
+    """
+
+    def __init__(self, roi=None, window=64, max_misses=5, colors=None):
+        self.roi = roi
+        self.colors = colors or DEFAULT_COLORS
+        self.window = window
+        self.max_misses = max_misses
+        self.reset()
+
+    def reset(self):
+        self.locked = False
+        self.misses = 0
+        self._last = None   # (cx, cy)
+        self._vel = (0, 0)
+
+    def set_roi(self, roi):
+        self.roi = roi
+        self.reset()
+
+    def _roi_bounds(self, frame):
+        if self.roi is None:
+            return 0, 0, frame.shape[1], frame.shape[0]
+        rx, ry, rw, rh = self.roi
+        return rx, ry, rx + rw, ry + rh
+
+    def predicted(self):
+        """
+        Predicted ball centre for the next frame, or None when unlocked.
+        """
+        if not self.locked:
+            return None
+        # constant velocity, extrapolated over the frames missed so far
+        steps = self.misses + 1
+        return (self._last[0] + self._vel[0] * steps,
+                self._last[1] + self._vel[1] * steps)
+
+    def detect(self, frame, debug=False):
+        """
+        Same contract as detect_ball: (cx, cy, x, y, w, h) or None.
+        """
+        rx0, ry0, rx1, ry1 = self._roi_bounds(frame)
+
+        if self.locked:
+            px, py = self.predicted()
+            half = self.window // 2
+            x0 = max(rx0, int(px) - half)
+            y0 = max(ry0, int(py) - half)
+            x1 = min(rx1, int(px) + half)
+            y1 = min(ry1, int(py) + half)
+        else:
+            x0, y0, x1, y1 = rx0, ry0, rx1, ry1
+
+        result = _detect_in_region(frame, x0, y0, x1, y1, self.colors) if x0 < x1 and y0 < y1 else None
+
+        if result is None:
+            self._missed()
+            return None
+
+        self._found(result[0], result[1])
+
+        if debug:
+            _show_ball_debug(frame, result)
+
+        return result
+
+    def _missed(self):
+        if self.locked:
+            self.misses += 1
+            if self.misses >= self.max_misses:
+                self.reset()
+
+    def _found(self, cx, cy):
+        if self.locked:
+            # velocity per frame, including frames where the ball was missed
+            steps = self.misses + 1
+            self._vel = ((cx - self._last[0]) / steps, (cy - self._last[1]) / steps)
+        else:
+            self._vel = (0, 0)
+        self._last = (cx, cy)
+        self.locked = True
+        self.misses = 0
+
+
 def quantize_to_bits(field_x, field_y, field_width, field_height):
     """
     Maps field-local pixel coords to:
@@ -1,173 +1,118 @@
 # libraries
-import time
 import argparse
-
-# hardware libraries
-import cv2
-from picamera2 import Picamera2
+import logging
 
 # own libraries
-from kicker_vision import find_playfield_roi, detect_ball, quantize_to_bits
-from bla_glib import BLAAdvertiserGLib
-from bla_payload import Bounce, BLA_Payload
-from bounce import detect_bounce
-from goal_check import check_goal_scored   # goal detection logic
+from kicker_vision import COLOR_BACKENDS
+from background_detector import DETECTORS
+from bla import BACKENDS as BLE_BACKENDS, MODES as BLE_MODES
+from pipeline import DROP_OLDEST, DROP_POLICIES
+from frame_source import SOURCES
+from instrumentation import StatsServer
+from calibration import DEFAULT_CALIBRATION
+from table_session import TableSession, Supervisor, load_tables   # one table / several
 
 parser = argparse.ArgumentParser(description='Kicker')
-parser.add_argument('--debug', action='store_true')
-args = parser.parse_args()
-debug = args.debug
-
-# -------------------------------
-# Camera configuration
-# -------------------------------
-FPS = 120
-picam2 = Picamera2()
-config = picam2.create_preview_configuration(
-    raw=picam2.sensor_modes[0],
-    main={"size": (384, 216)},
-    controls={"FrameRate": FPS}
-)
-picam2.configure(config)
-picam2.start()
-time.sleep(1.0)
-
-# -------------------------------
-# Initial frame & ROI
-# -------------------------------
-initial_frame_rgb = picam2.capture_array()
-field_roi = find_playfield_roi(initial_frame_rgb, debug=debug)
-
-if field_roi is None:
-    fx, fy = 0, 0
-    fw, fh = initial_frame_rgb.shape[1], initial_frame_rgb.shape[0]
-else:
-    fx, fy, fw, fh = field_roi
-
-# -------------------------------
-# BLE advertiser & payload
-# -------------------------------
-adv = BLAAdvertiserGLib(interval=0.005)
-adv.start()
-
-payload = BLA_Payload()
-bounce_state = {}
-
-# -------------------------------
-# REQUIRED STATE VARIABLES
-# -------------------------------
-prev_pos = None
-goal_latched = False
-
-try:
-    start_time = time.time()
-    frame_count = 0
-    bounces = 0
-
-    while True:
-        frame_rgb = picam2.capture_array()
-
-        result = detect_ball(frame_rgb, debug=debug)
-        if result is not None:
-            cx, cy, x, y, w, h = result
-
-            # Convert to field coordinates
-            field_x = cx - fx
-            field_y = cy - fy
-
-            # Quantized bits ONLY for BLE/debug
-            x_7bit, y_6bit = quantize_to_bits(field_x, field_y, fw, fh)
-            print("Ball:", field_x, field_y, "| bits:", x_7bit, y_6bit)
-
-            # -------------------------------
-            # GOAL DETECTION
-            # -------------------------------
-            goal, goal_latched = check_goal_scored(
-                curr_pos=(field_x, field_y),
-                prev_pos=prev_pos,
-                goal_latched=goal_latched
-            )
-
-            if goal == "TEAM1":
-                print("⚽ GOAL! TEAM 1 SCORED")
-                payload.team1_scored()
-
-            elif goal == "TEAM2":
-                print("⚽ GOAL! TEAM 2 SCORED")
-                payload.team2_scored()
-
-            # -------------------------------
-            # Reset goal latch when ball
-            # returns to field center
-            # -------------------------------
-            if goal_latched:
-                if 20 < field_x < fw - 20:
-                    goal_latched = False
-
-            # -------------------------------
-            # Bounce detection
-            # -------------------------------
-            bounce_coords = detect_bounce(field_x, field_y, fw, fh, bounce_state)
-            if bounce_coords is not None:
-                bx, by = bounce_coords
-                print(f"Bounce detected at ({bx}, {by})")
-
-            # -------------------------------
-            # BLE payload handling
-            # -------------------------------
-            if frame_count == 35 or bounces == 4:
-                bounces = 0
-                data = payload.to_bytes()
-                adv.set_custom_payload(data)
-
-            if frame_count % 10 == 0:
-                bounces += 1
-                payload.add_bounce(Bounce(field_x, field_y, 13, 5))
-
-            # -------------------------------
-            # UPDATE PREVIOUS POSITION
-            # -------------------------------
-            prev_pos = (field_x, field_y)
-
-        # -------------------------------
-        # Debug display
-        # -------------------------------
-        if debug:
-            window_name = 'Kicker Live'
-            cv2.namedWindow(window_name, cv2.WINDOW_NORMAL)
-
-            display_frame = cv2.cvtColor(frame_rgb, cv2.COLOR_RGB2BGR)
-            cv2.rectangle(display_frame, (fx, fy), (fx + fw, fy + fh), (0, 0, 255), 2)
-
-            if result is not None:
-                cv2.rectangle(display_frame, (x, y), (x + w, y + h), (0, 255, 0), 2)
-                cv2.putText(
-                    display_frame,
-                    f"{x_7bit},{y_6bit}",
-                    (x, y - 10),
-                    cv2.FONT_HERSHEY_SIMPLEX,
-                    0.7,
-                    (0, 255, 0),
-                    2
-                )
-
-            cv2.imshow(window_name, display_frame)
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-
-        # FPS counter
-        if time.time() - start_time >= 1.0:
-            print(f"FPS: {frame_count}")
-            frame_count = 1
-            start_time = time.time()
-
-        frame_count += 1
-
-except KeyboardInterrupt:
-    pass
-
-finally:
-    adv.stop()
-    picam2.stop()
-    if debug:
-        cv2.destroyAllWindows()
+parser.add_argument('--debug', action='store_true',
+                    help='overlay window (drawn on its own thread)')
+parser.add_argument('--debug-stream', metavar='PORT',
+                    help='serve the overlay as MJPEG on [host:]port (headless)')
+parser.add_argument('--debug-fps', type=float, default=15.0,
+                    help='overlay frame rate cap')
+parser.add_argument('--workers', type=int, default=1,
+                    help='number of detection worker threads')
+parser.add_argument('--queue-size', type=int, default=4,
+                    help='capacity of each inter-stage ring buffer')
+parser.add_argument('--drop-policy', choices=DROP_POLICIES, default=DROP_OLDEST,
+                    help='what to do when a stage falls behind')
+parser.add_argument('--detector', choices=DETECTORS, default='contour',
+                    help='contour: largest orange contour, background: orange AND '
+                         'not background, blobs filtered by size/shape/prediction')
+parser.add_argument('--no-tracking', action='store_true',
+                    help='search the whole field ROI on every frame')
+parser.add_argument('--color-backend', choices=COLOR_BACKENDS, default='hsv',
+                    help='hsv: cvtColor + inRange, lut: precomputed RGB lookup table')
+parser.add_argument('--color-profile', metavar='NAME',
+                    help='colour thresholds saved by color_profile.py under NAME')
+parser.add_argument('--color-retune', type=float, default=0.0, metavar='SECONDS',
+                    help='seconds between background colour threshold re-tune samples (0 = off)')
+parser.add_argument('--source', default='picamera',
+                    help='frame source: ' + ' | '.join(SOURCES))
+parser.add_argument('--loop', action='store_true',
+                    help='replay a recording/synthetic source forever')
+parser.add_argument('--calibration', nargs='?', const=DEFAULT_CALIBRATION, metavar='PATH',
+                    help='map ball positions through a saved lens/perspective calibration')
+parser.add_argument('--roi-interval', type=float, default=1.0,
+                    help='seconds between background field ROI checks (0 = off)')
+parser.add_argument('--record', metavar='DIR',
+                    help='keep a memory-mapped ring of recent frames in DIR')
+parser.add_argument('--record-seconds', type=float, default=10.0,
+                    help='length of the recording ring')
+parser.add_argument('--incident-seconds', type=float, default=5.0,
+                    help='seconds saved from the ring when a goal fires')
+parser.add_argument('--ble-backend', choices=BLE_BACKENDS, default='hci',
+                    help='hci: raw HCI socket, hcitool: one process per command, fake: no radio')
+parser.add_argument('--ble-payload', type=int, choices=(1, 2), default=2,
+                    help='payload format: 2 = delta coded, with sequence numbers for '
+                         'receivers\' gap detection; 1 = fixed 27 bits/bounce after the name, '
+                         'for old receivers (no sequence numbers)')
+parser.add_argument('--ble-name', default='',
+                    help='local name advertised with payload format 2, e.g. "kk" (default none: '
+                         'every byte goes to bounces; format 1 always sends "kikicker")')
+parser.add_argument('--ble-device', type=int, default=0,
+                    help='HCI controller number (hciN)')
+parser.add_argument('--ble-mode', choices=BLE_MODES, default='legacy',
+                    help='extended/periodic advertising if the controller supports it')
+parser.add_argument('--ble-position-rate', type=float, default=30.0,
+                    help='ball position samples per second (extended/periodic only, 0 = off)')
+parser.add_argument('--ble-min-interval', type=float, default=0.02,
+                    help='seconds within which payload updates are coalesced')
+parser.add_argument('--ble-max-staleness', type=float, default=1.0,
+                    help='rebuild the advertised payload at least this often')
+parser.add_argument('--stats', metavar='ADDRESS',
+                    help='serve live stats as JSON: port, host:port (HTTP) or unix:/path')
+parser.add_argument('--tables', metavar='FILE',
+                    help='run several tables from a JSON list of per-table options, '
+                         'one pinned process each (see table_session.py)')
+parser.add_argument('--log-level', default='INFO',
+                    choices=('DEBUG', 'INFO', 'WARNING', 'ERROR'))
+parser.add_argument('--log-interval', type=float, default=1.0,
+                    help='seconds between log lines of the same kind (ball, bounce, stats)')
+
+
+def main():
+    args = parser.parse_args()
+    logging.basicConfig(level=args.log_level, format='%(asctime)s %(levelname)s %(message)s')
+    log = logging.getLogger('kikicker')
+
+    if args.tables:
+        supervisor = Supervisor(load_tables(args.tables, args), interval=args.log_interval)
+        stats_server = None
+        if args.stats:
+            stats_server = StatsServer(supervisor, args.stats)
+            stats_server.start()
+            log.info(f"Stats on {args.stats}")
+        try:
+            supervisor.run()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            supervisor.stop()
+            if stats_server is not None:
+                stats_server.stop()
+        return
+
+    session = TableSession(args)
+    try:
+        session.start()
+        session.run()
+
+    except KeyboardInterrupt:
+        pass
+
+    finally:
+        session.close()
+
+
+if __name__ == '__main__':
+    main()
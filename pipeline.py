@@ -0,0 +1,264 @@
+# pipeline.py
+import logging
+import threading
+import time
+from collections import deque
+
+from instrumentation import EventLog
+
+DROP_OLDEST = "drop-oldest"
+BLOCK = "block"
+DROP_POLICIES = (DROP_OLDEST, BLOCK)
+
+
+class Frame:
+    """
+    One captured frame travelling through the pipeline.
+    `seq` and `timestamp` are set by the capture stage,
+    `result` is filled in by the detection stage.
+    """
+    __slots__ = ("seq", "timestamp", "image", "result")
+
+    def __init__(self, seq, timestamp, image):
+        self.seq = seq
+        self.timestamp = timestamp
+        self.image = image
+        self.result = None
+
+
+class RingBuffer:
+    """
+    Bounded FIFO between two pipeline stages.
+    When full, `put` either drops the oldest item (drop-oldest)
+    or waits for the consumer (block).
+    Thread-safe.
+    """
+
+    def __init__(self, capacity, policy=DROP_OLDEST, on_drop=None):
+        if capacity < 1:
+            raise ValueError("capacity must be >= 1")
+        if policy not in DROP_POLICIES:
+            raise ValueError(f"unknown drop policy: {policy}")
+        self.capacity = capacity
+        self.policy = policy
+        self.dropped = 0
+        self.on_drop = on_drop
+        self._items = deque()
+        self._closed = False
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return len(self._items)
+
+    def put(self, item):
+        """
+        Returns False if the buffer was closed while waiting.
+        """
+        with self._cond:
+            if self.policy == BLOCK:
+                while len(self._items) >= self.capacity and not self._closed:
+                    self._cond.wait()
+            elif len(self._items) >= self.capacity:
+                old = self._items.popleft()
+                self.dropped += 1
+                if self.on_drop is not None:
+                    self.on_drop(old)
+
+            if self._closed:
+                return False
+            self._items.append(item)
+            self._cond.notify_all()
+            return True
+
+    def get(self, timeout=None):
+        """
+        Returns the oldest item, or None on timeout / when closed and empty.
+        """
+        with self._cond:
+            if not self._items and not self._closed:
+                self._cond.wait(timeout)
+            if not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+
+class Pipeline:
+    """
+    Staged capture -> detect -> publish pipeline.
+
+    - capture: one thread calling `capture()` and stamping each frame;
+               EOFError from `capture()` ends the run once all
+               captured frames are published; any other exception
+               ends it the same way, is logged, and run() raises it
+    - detect:  `workers` threads calling `detect(image)` on each frame;
+               a frame whose detect() raises is logged and skipped
+    - publish: `publish(frame)` runs in the thread that calls `run()`,
+               strictly in sequence order (results from several workers
+               are re-ordered, frames dropped by a full buffer are skipped)
+
+    Stages are joined by bounded RingBuffers with the given drop policy.
+    """
+
+    def __init__(self, capture, detect, publish, queue_size=4,
+                 policy=DROP_OLDEST, workers=1):
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.capture = capture
+        self.detect = detect
+        self.publish = publish
+        self.workers = workers
+
+        self.capture_queue = RingBuffer(queue_size, policy, on_drop=self._dropped)
+        self.result_queue = RingBuffer(queue_size, policy, on_drop=self._dropped)
+
+        self.running = False
+        self.threads = []
+        self._workers_left = 0
+        self._workers_lock = threading.Lock()
+
+        # counters
+        self.captured = 0
+        self.published = 0
+        self.reordered = 0
+        self.failed = 0         # frames whose detect() raised
+        self.capture_error = None   # what ended capture, if not EOFError
+        self._errors = EventLog('kikicker.pipeline', level=logging.ERROR)
+
+        # sequence numbers that will never reach the publish stage
+        self._lost = set()
+
+    # ------------------------------------------------------------
+
+    def _dropped(self, frame):
+        self._lost.add(frame.seq)
+
+    def _capture_loop(self):
+        seq = 0
+        try:
+            while self.running:
+                try:
+                    image = self.capture()
+                except EOFError:
+                    break
+                except Exception as e:
+                    # a dead camera: finish what was captured, run() raises it
+                    self.capture_error = e
+                    self._errors.event('capture_failed', frame=seq, error=repr(e))
+                    break
+                frame = Frame(seq, time.monotonic(), image)
+                seq += 1
+                self.captured = seq
+                if not self.capture_queue.put(frame):
+                    break
+        finally:
+            # the workers stop once the queue is closed and empty
+            self.capture_queue.close()
+
+    def _detect_loop(self):
+        try:
+            while self.running:
+                frame = self.capture_queue.get(timeout=0.1)
+                if frame is None:
+                    if self.capture_queue.closed:
+                        break
+                    continue
+                try:
+                    frame.result = self.detect(frame.image)
+                except Exception as e:
+                    # one bad frame: skip it, the publish stage moves past its seq
+                    self.failed += 1
+                    self._lost.add(frame.seq)
+                    self._errors.event('detect_failed', frame=frame.seq, error=repr(e))
+                    continue
+                if not self.result_queue.put(frame):
+                    break
+        finally:
+            # the last worker out tells the publish stage nothing more is
+            # coming, however it left
+            with self._workers_lock:
+                self._workers_left -= 1
+                if self._workers_left == 0:
+                    self.result_queue.close()
+
+    # ------------------------------------------------------------
+
+    def queue_depths(self):
+        """
+        Current depth and drop count of every inter-stage buffer.
+        """
+        return {
+            "capture": len(self.capture_queue),
+            "capture_dropped": self.capture_queue.dropped,
+            "result": len(self.result_queue),
+            "result_dropped": self.result_queue.dropped,
+        }
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self.capture_error = None
+        self._workers_left = self.workers
+        self.threads = [threading.Thread(target=self._capture_loop, daemon=True)]
+        for _ in range(self.workers):
+            self.threads.append(threading.Thread(target=self._detect_loop, daemon=True))
+        for t in self.threads:
+            t.start()
+
+    def run(self):
+        """
+        Start the background stages and run the publish stage in the
+        calling thread until stop() is called (or publish returns False).
+        If capture() failed, its exception is raised once everything
+        captured before it is published, so a supervising process sees
+        the table die instead of hang.
+        """
+        self.start()
+        pending = {}   # seq -> frame that overtook an earlier one
+        next_seq = 0
+        try:
+            while self.running:
+                frame = self.result_queue.get(timeout=0.1)
+                if frame is None:
+                    if self.result_queue.closed:
+                        break
+                    continue
+                pending[frame.seq] = frame
+                if frame.seq != next_seq:
+                    self.reordered += 1
+
+                # publish everything that is now contiguous
+                while True:
+                    if next_seq in pending:
+                        self.published += 1
+                        if self.publish(pending.pop(next_seq)) is False:
+                            return
+                    elif next_seq in self._lost:
+                        self._lost.discard(next_seq)
+                    else:
+                        break
+                    next_seq += 1
+        finally:
+            self.stop()
+        if self.capture_error is not None:
+            raise self.capture_error
+
+    def stop(self):
+        self.running = False
+        self.capture_queue.close()
+        self.result_queue.close()
+        for t in self.threads:
+            if t is not threading.current_thread():
+                t.join(timeout=1.0)
+        self.threads = []
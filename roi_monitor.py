@@ -0,0 +1,216 @@
+# roi_monitor.py
+"""
+Background re-validation of the field ROI.
+
+find_playfield_roi used to run once at startup; if the camera is bumped
+or the light changes, every field coordinate is off until a restart.
+ROIMonitor takes a frame from the hot loop every `interval` seconds
+(submit() only stores a reference) and, on its own thread:
+
+1. finds the field on a frame downscaled by `scale` (with the closing
+   kernel scaled along), which costs a fraction of the full search
+2. smooths the measured ROI with an exponential moving average
+3. applies hysteresis: the smoothed ROI has to be more than `drift`
+   pixels away from the current one for `confirm` checks in a row
+   (and the count only restarts once it is back within drift / 2)
+4. only then recomputes the ROI on the full-resolution frame and, if
+   it really moved, calls prepare(roi) and publishes (roi, prepared)
+   as `current`, a single attribute assignment. Either way the average
+   restarts from the full-resolution result, and how far the downscaled
+   search was off is subtracted from later measurements
+
+With follow=False a confirmed move is only reported (`stale`); drift is
+then measured from where the field was found, so the full search runs
+once per move instead of every `confirm` checks.
+
+prepare() builds everything that depends on the ROI (field model, goal
+lines, ...) off the hot path; the loop just compares `current` with
+what it last used and swaps its references.
+"""
+import logging
+import threading
+import time
+
+import cv2
+
+from kicker_vision import find_playfield_roi
+
+log = logging.getLogger('kikicker.roi')
+
+# closing kernel of find_playfield_roi at full resolution
+FULL_KERNEL = 50
+
+
+class ROIMonitor:
+    def __init__(self, roi, interval=1.0, scale=0.25, alpha=0.5, drift=6.0,
+                 confirm=3, prepare=None, follow=True, colors=None):
+        """
+        roi:      the ROI the loop currently uses (x, y, w, h)
+        prepare:  called with a new ROI on the monitor thread; its result
+                  is published with it
+        follow:   False only reports drift (`stale`), e.g. while a fixed
+                  calibration is in use
+        colors:   the session's ColorThresholds (None: the defaults)
+        """
+        self.interval = interval
+        self.scale = scale
+        self.alpha = alpha
+        self.drift = drift
+        self.confirm = confirm
+        self.prepare = prepare
+        self.follow = follow
+        self.colors = colors
+        self.current = (tuple(roi), prepare(tuple(roi)) if prepare else None)
+
+        self._smoothed = [float(v) for v in roi]
+        # where drift is measured from: `current`'s ROI, or with
+        # follow=False the stale position the full search last reported
+        self._reference = tuple(roi)
+        # downscaled minus full-resolution result, from the last full search
+        self._offset = [0.0] * 4
+        self._pending = 0
+        self._frame = None
+        self._next = 0.0
+        self._wake = threading.Event()
+        self._thread = None
+        self.running = False
+        self.stale = False
+
+        # counters
+        self.checks = 0
+        self.misses = 0
+        self.recomputes = 0
+        self.moves = 0
+        self.check_time = 0.0
+
+    @property
+    def roi(self):
+        return self.current[0]
+
+    # ------------------------------------------------------------
+    # hot path
+    # ------------------------------------------------------------
+
+    def submit(self, frame, now=None):
+        """
+        Offers the latest frame. Cheap: a time comparison, and every
+        `interval` seconds a reference handed to the monitor thread.
+        """
+        if now is None:
+            now = time.monotonic()
+        if now < self._next or self._frame is not None:
+            return
+        self._next = now + self.interval
+        self._frame = frame
+        self._wake.set()
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        if self.running:
+            return
+        self.running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self.running = False
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+
+    def _run(self):
+        while self.running:
+            self._wake.wait()
+            self._wake.clear()
+            frame = self._frame
+            if frame is None:
+                continue
+            try:
+                self.check(frame)
+            except Exception:
+                log.exception("ROI check failed")
+            self._frame = None
+
+    # ------------------------------------------------------------
+
+    def _measure(self, frame):
+        small = cv2.resize(frame, None, fx=self.scale, fy=self.scale,
+                           interpolation=cv2.INTER_AREA)
+        kernel = max(3, int(round(FULL_KERNEL * self.scale)))
+        found = find_playfield_roi(small, kernel_size=kernel, colors=self.colors)
+        if found is None:
+            return None
+        return [v / self.scale for v in found]
+
+    def check(self, frame):
+        """
+        One validation round (normally on the monitor thread).
+        Returns True if a new ROI was published.
+        """
+        t0 = time.perf_counter()
+        self.checks += 1
+        try:
+            measured = self._measure(frame)
+            if measured is None:
+                # field hidden (a hand, the lights off): keep what we have
+                self.misses += 1
+                return False
+
+            a = self.alpha
+            s = self._smoothed
+            for i, (v, o) in enumerate(zip(measured, self._offset)):
+                s[i] += a * (v - o - s[i])
+
+            deviation = max(abs(v - r) for v, r in zip(s, self._reference))
+            if deviation > self.drift:
+                self._pending += 1
+            elif deviation < self.drift / 2:
+                self._pending = 0
+            if self._pending < self.confirm:
+                return False
+
+            # drift confirmed: the expensive full-resolution search
+            self._pending = 0
+            self.recomputes += 1
+            full = find_playfield_roi(frame, colors=self.colors)
+            if full is None:
+                # start over from the reference, or the same drift is
+                # confirmed again `confirm` checks later, forever
+                self._smoothed = [float(v) for v in self._reference]
+                return False
+            # the downscaled search can be off by a few pixels for good
+            # (rounding, the scaled kernel): correct for that from now on
+            self._offset = [m - f for m, f in zip(measured, full)]
+            self._smoothed = [float(v) for v in full]
+            roi = self.current[0]
+            if max(abs(v - r) for v, r in zip(full, roi)) <= self.drift:
+                # back where `current` is (or never left)
+                self._reference = roi
+                self.stale = False
+                return False
+            if not self.follow:
+                # report it once; only a further move searches again
+                self._reference = full
+                self.stale = True
+                return False
+            prepared = self.prepare(full) if self.prepare else None
+            # single assignment: the loop sees the old or the new pair
+            self.current = (full, prepared)
+            self._reference = full
+            self.moves += 1
+            return True
+        finally:
+            self.check_time = time.perf_counter() - t0
+
+    def stats(self):
+        return {
+            "roi": self.current[0],
+            "checks": self.checks,
+            "misses": self.misses,
+            "recomputes": self.recomputes,
+            "moves": self.moves,
+            "stale": self.stale,
+            "check_ms": self.check_time * 1e3,
+        }
@@ -1,43 +1,313 @@
+# spped_compute.py
+"""
+Ball metrics in physical units.
+
+Positions come in field pixels (relative to the field ROI) together
+with their frame timestamps. The ROI spans the table's playing surface,
+whose size in centimetres is the "table" section of field_config.json,
+so x and y each get their own cm-per-pixel scale.
+
+Over a sliding window of the last `window` samples, x(t) and y(t) are
+fitted as quadratics (least squares, t = 0 at the newest sample):
+
+    speed         |v| in m/s
+    angle         direction of v in radians 0..2pi (field axes, y down)
+    acceleration  |a| in m/s^2
+    power         m * (a . v) in W, the rate at which the ball gains
+                  kinetic energy: large and positive while it is shot
+
+MetricsEngine.update() is the per-frame streaming API, batch() computes
+the same values for a whole replay at once, vectorized over all windows.
+quantize() maps speed and angle to the 8-bit fields of a BLA Bounce.
+"""
 import math
 
-def compute_ball_metrics(prev_pos, curr_pos, prev_frame, curr_frame):
+import numpy as np
+
+from goal_scored import load_field_config
+
+# 8-bit Bounce fields: 256 angle steps per turn, speed in steps of
+# SPEED_STEP m/s (255 = 12.75 m/s and above)
+ANGLE_STEPS = 256
+SPEED_STEP = 0.05
+
+
+def quantize(speed, angle):
+    """
+    (angle, speed) as the 8-bit values of a Bounce.
+    speed in m/s, angle in radians.
+    """
+    a = int(round(angle % (2 * math.pi) * ANGLE_STEPS / (2 * math.pi))) & 0xFF
+    s = min(int(round(speed / SPEED_STEP)), 255)
+    return a, s
+
+
+def _solve(n, s1, s2, s3, s4, x0, x1, x2, y0, y1, y2):
+    """
+    Least-squares quadratic p(u) = c0 + c1 u + c2 u^2 for x and y from
+    the window sums (s_k = sum u^k, x_k = sum x u^k, ...).
+    Returns (c1x, c2x, c1y, c2y, det); works on floats and arrays alike.
+    """
+    # Cramer's rule on [[n, s1, s2], [s1, s2, s3], [s2, s3, s4]];
+    # c0 isn't needed, only the cofactors for c1 and c2
+    m00 = s2 * s4 - s3 * s3
+    m01 = s1 * s4 - s2 * s3
+    m02 = s1 * s3 - s2 * s2
+    det = n * m00 - s1 * m01 + s2 * m02
+    k10 = s2 * s3 - s1 * s4
+    k11 = n * s4 - s2 * s2
+    k12 = s1 * s2 - n * s3
+    k20 = s1 * s3 - s2 * s2
+    k21 = s1 * s2 - n * s3
+    k22 = n * s2 - s1 * s1
+    c1x = k10 * x0 + k11 * x1 + k12 * x2
+    c2x = k20 * x0 + k21 * x1 + k22 * x2
+    c1y = k10 * y0 + k11 * y1 + k12 * y2
+    c2y = k20 * y0 + k21 * y1 + k22 * y2
+    return c1x, c2x, c1y, c2y, det
+
+
+class BallMetrics:
+    """
+    Metrics of one sample: velocity (vx, vy) in m/s, speed, angle,
+    acceleration (ax, ay and magnitude), power; see the module docs.
+    """
+    __slots__ = ("t", "vx", "vy", "ax", "ay", "speed", "angle", "acceleration", "power")
+
+    def __init__(self, t, vx, vy, ax, ay, mass):
+        self.t = t
+        self.vx = vx
+        self.vy = vy
+        self.ax = ax
+        self.ay = ay
+        self.speed = math.hypot(vx, vy)
+        self.angle = math.atan2(vy, vx) % (2 * math.pi)
+        self.acceleration = math.hypot(ax, ay)
+        self.power = mass * (ax * vx + ay * vy)
+
+    def bits(self):
+        """
+        (angle, speed) for a Bounce.
+        """
+        return quantize(self.speed, self.angle)
+
+    def __repr__(self):
+        return (f"BallMetrics(speed={self.speed:.2f} m/s, angle={self.angle:.2f}, "
+                f"acceleration={self.acceleration:.1f} m/s^2, power={self.power:.2f} W)")
+
+
+class MetricsEngine:
+    def __init__(self, field_width, field_height, table=None, window=5):
+        """
+        table:   {"width_cm", "height_cm", "ball_mass_g"}, the playing
+                 surface the field ROI covers (x, y) and the ball mass;
+                 defaults to field_config.json
+        window:  samples per fit (at least 3)
+        """
+        if table is None:
+            table = load_field_config()["table"]
+        self.table = table
+        self.window = max(3, window)
+        self.mass = table.get("ball_mass_g", 20.0) / 1000.0
+        self._t = [0.0] * self.window
+        self._x = [0.0] * self.window
+        self._y = [0.0] * self.window
+        self.set_field_size(field_width, field_height)
+        self.reset()
+
+    def set_field_size(self, field_width, field_height):
+        self.field_width = field_width
+        self.field_height = field_height
+        # metres per field pixel along x and y
+        self.scale_x = self.table["width_cm"] / 100.0 / field_width
+        self.scale_y = self.table["height_cm"] / 100.0 / field_height
+
+    def reset(self):
+        """
+        Forgets the window, e.g. when the track is lost.
+        """
+        self._head = 0
+        self._len = 0
+        self.last = None
+
+    def to_cm(self, x, y):
+        """
+        Field pixels -> centimetres on the table (scalars or arrays).
+        """
+        return x * self.scale_x * 100.0, y * self.scale_y * 100.0
+
+    def direction_bits(self, velocity):
+        """
+        (angle, speed) for a Bounce from a velocity in field px/s,
+        e.g. the Kalman tracker's.
+        """
+        vx = velocity[0] * self.scale_x
+        vy = velocity[1] * self.scale_y
+        return quantize(math.hypot(vx, vy), math.atan2(vy, vx))
+
+    # ------------------------------------------------------------
+    # streaming
+    # ------------------------------------------------------------
+
+    def update(self, t, position):
+        """
+        Feeds the ball position (field px, or None if there is none) of
+        the frame taken at time t (seconds). Returns the BallMetrics of
+        this sample, or None until `window` consecutive samples are in.
+        """
+        if position is None:
+            self.reset()
+            return None
+        i = self._head
+        self._t[i] = t
+        self._x[i] = position[0] * self.scale_x
+        self._y[i] = position[1] * self.scale_y
+        self._head = (i + 1) % self.window
+        if self._len < self.window:
+            self._len += 1
+            if self._len < self.window:
+                return None
+
+        # oldest sample first, like the batch windows
+        order = range(self._head, self._head + self.window)
+        span = t - self._t[self._head]
+        if span <= 0:
+            return None
+        s1 = s2 = s3 = s4 = 0.0
+        x0 = x1 = x2 = y0 = y1 = y2 = 0.0
+        w = self.window
+        for j in order:
+            j %= w
+            u = (self._t[j] - t) / span
+            uu = u * u
+            x, y = self._x[j], self._y[j]
+            s1 += u
+            s2 += uu
+            s3 += uu * u
+            s4 += uu * uu
+            x0 += x
+            x1 += x * u
+            x2 += x * uu
+            y0 += y
+            y1 += y * u
+            y2 += y * uu
+        c1x, c2x, c1y, c2y, det = _solve(w, s1, s2, s3, s4, x0, x1, x2, y0, y1, y2)
+        if abs(det) < 1e-12:
+            return None
+        # back from u = (t_i - t) / span to seconds
+        d1 = det * span
+        d2 = det * span * span
+        self.last = BallMetrics(t, c1x / d1, c1y / d1, 2 * c2x / d2, 2 * c2y / d2, self.mass)
+        return self.last
+
+    # ------------------------------------------------------------
+    # batch
+    # ------------------------------------------------------------
+
+    def batch(self, t, x, y):
+        """
+        Metrics for a whole replay: t (seconds), x, y (field px, NaN
+        where there was no position) as equal-length arrays.
+
+        Returns a dict of arrays ("vx", "vy", "ax", "ay", "speed",
+        "angle", "acceleration", "power") aligned with the input; a
+        sample is NaN where update() would have returned None.
+        """
+        t = np.asarray(t, np.float64)
+        x = np.asarray(x, np.float64) * self.scale_x
+        y = np.asarray(y, np.float64) * self.scale_y
+        n = len(t)
+        w = self.window
+        out = {k: np.full(n, np.nan) for k in
+               ("vx", "vy", "ax", "ay", "speed", "angle", "acceleration", "power")}
+        if n < w:
+            return out
+
+        # one row per window, the newest sample last
+        tw = np.lib.stride_tricks.sliding_window_view(t, w)
+        xw = np.lib.stride_tricks.sliding_window_view(x, w)
+        yw = np.lib.stride_tricks.sliding_window_view(y, w)
+        span = tw[:, -1] - tw[:, 0]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            u = (tw - tw[:, -1:]) / span[:, None]
+            uu = u * u
+            c1x, c2x, c1y, c2y, det = _solve(
+                float(w), u.sum(1), uu.sum(1), (uu * u).sum(1), (uu * uu).sum(1),
+                xw.sum(1), (xw * u).sum(1), (xw * uu).sum(1),
+                yw.sum(1), (yw * u).sum(1), (yw * uu).sum(1))
+            # same rejections as update(): a gap in the window (NaN),
+            # no time elapsed, a degenerate fit
+            bad = ~(span > 0) | ~(np.abs(det) >= 1e-12)
+            d1 = det * span
+            d2 = d1 * span
+            vx = c1x / d1
+            vy = c1y / d1
+            ax = 2 * c2x / d2
+            ay = 2 * c2y / d2
+        for arr in (vx, vy, ax, ay):
+            arr[bad] = np.nan
+
+        sl = slice(w - 1, None)
+        out["vx"][sl] = vx
+        out["vy"][sl] = vy
+        out["ax"][sl] = ax
+        out["ay"][sl] = ay
+        out["speed"][sl] = np.hypot(vx, vy)
+        out["angle"][sl] = np.arctan2(vy, vx) % (2 * np.pi)
+        out["acceleration"][sl] = np.hypot(ax, ay)
+        out["power"][sl] = self.mass * (ax * vx + ay * vy)
+        return out
+
+    def batch_bits(self, metrics):
+        """
+        Vectorized quantize() over batch() output: (angle, speed) uint8
+        arrays (0 where the metrics are NaN).
+        """
+        angle = np.nan_to_num(metrics["angle"])
+        speed = np.nan_to_num(metrics["speed"])
+        a = np.round(angle * ANGLE_STEPS / (2 * np.pi)).astype(np.int64) & 0xFF
+        s = np.minimum(np.round(speed / SPEED_STEP), 255).astype(np.int64)
+        return a.astype(np.uint8), s.astype(np.uint8)
+
+
+def compute_ball_metrics(prev_pos, curr_pos, prev_frame, curr_frame, fps=120):
     """
     Computes speed and angle when coordinates are in centimeters.
-    
+
     Args:
         prev_pos: (x1, y1) in centimeters
         curr_pos: (x2, y2) in centimeters
         prev_frame: int
         curr_frame: int
-    
+        fps: camera frame rate
+
     Returns:
         (speed_m_s, angle_rad, distance_cm)
+
+    Two-point version kept for old callers; MetricsEngine works from
+    field pixels and real timestamps.
     """
     x1, y1 = prev_pos
     x2, y2 = curr_pos
-    
+
     # Distance in centimeters
     dx = x2 - x1
     dy = y2 - y1
     distance_cm = math.hypot(dx, dy)
-    
+
     # Convert to meters
     distance_m = distance_cm / 100.0
-    
+
     # Time calculation
-    fps = 120
     frame_diff = curr_frame - prev_frame
     time_s = frame_diff / fps if frame_diff > 0 else 0.0
-    
+
     # Speed in m/s
     speed_m_s = distance_m / time_s if time_s > 0 else 0.0
-    
+
     # Angle calculation
     angle_rad = math.atan2(dy, dx)
     if angle_rad < 0:
         angle_rad += 2 * math.pi
-    
-    return speed_m_s, angle_rad, distance_cm
 
-# Your example
-print(compute_ball_metrics((1000, 620), (30, 120), 20, 30))
+    return speed_m_s, angle_rad, distance_cm
@@ -0,0 +1,766 @@
+# table_session.py
+"""
+Several tables from one compute box.
+
+TableSession is one table: frame source, field ROI and everything built
+on it (FieldState), ball trackers, goal latch (in the GoalEngine),
+bounce detector, BLE payload buffer and advertiser, recorder, debug
+view and telemetry. Nothing lives at module level any more, and the
+options are main.py's argument namespace, so a single table still runs
+as `python main.py ...`.
+
+Supervisor runs one session per table, each in its own process pinned
+to its own cores (os.sched_setaffinity): tables don't share a GIL or
+fight over a core, so one busy table can't stretch another's frame
+latency. Every session sends a telemetry snapshot once per interval;
+the supervisor serves them together with totals (snapshot(), e.g.
+through a StatsServer) and restarts a table whose process died.
+
+    python main.py --tables tables.json --stats 8080
+
+tables.json is a list of per-table overrides of main.py's options
+("-" or "_" both work), plus "name" and "cpus":
+
+    [{"name": "left",  "source": "picamera:0", "ble_device": 0},
+     {"name": "right", "source": "picamera:1", "ble_device": 1, "cpus": [2, 3]}]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from functools import partial
+
+from kicker_vision import find_playfield_roi, detect_ball, quantize_to_bits, BallTracker
+from background_detector import BackgroundBallDetector
+from bla import BLAAdvertiser
+from bla_buffer import BLAEventBuffer, Bounce
+from Bounce_detection import BounceDetector
+from tracker import KalmanTracker
+from goal_scored import GoalEngine
+from field_model import FieldModel
+from spped_compute import MetricsEngine
+from pipeline import Pipeline
+from frame_source import open_source, FRAME_SIZE, FPS
+from frame_recorder import FrameRecorder
+from instrumentation import Instruments, StatsServer, EventLog, perf_counter
+from debug_view import DebugView
+from calibration import load_calibration
+from roi_monitor import ROIMonitor
+from color_profile import ColorProfile, ColorRetuner, load_profile, save_profile, camera_key
+
+TABLE_LOG_FORMAT = '%(asctime)s %(levelname)s %(name)s %(message)s'
+
+
+class FieldState:
+    """
+    Everything derived from the field ROI. A moved field gets a new
+    FieldState, built on the ROI monitor's thread and swapped in whole.
+    """
+    __slots__ = ("roi", "calibration", "offset", "width", "height",
+                 "goal_engine", "field_model", "metrics", "bounce_detector")
+
+    def __init__(self, roi, calibration=None):
+        self.roi = roi
+        self.calibration = calibration
+        if calibration is not None:
+            # calibrated field: fixed size, positions from the tables
+            self.offset = None
+            self.width, self.height = calibration.field_size
+        else:
+            self.offset = (roi[0], roi[1])
+            self.width, self.height = roi[2], roi[3]
+        w, h = self.width, self.height
+        self.goal_engine = GoalEngine(w, h)     # goal mouths from field_config.json
+        self.field_model = FieldModel(w, h)     # zone layout from field_config.json
+        self.metrics = MetricsEngine(w, h)      # table size from field_config.json
+        # the Kalman filter already smooths, so no extra moving average
+        self.bounce_detector = BounceDetector(w, h, noise_filter_size=1)
+
+    def to_field(self, cx, cy):
+        if self.offset is None:
+            return self.calibration.to_field(cx, cy)
+        return cx - self.offset[0], cy - self.offset[1]
+
+    def to_image(self, x, y):
+        """
+        Frame position of a field position (debug overlay only).
+        """
+        if self.offset is None:
+            return self.calibration.to_image(x, y)
+        return x + self.offset[0], y + self.offset[1]
+
+
+def make_advertiser(options, buffer):
+    """
+    The BLE advertiser main.py's options ask for, advertising `buffer`
+    (not started yet).
+    """
+    return BLAAdvertiser(
+        interval=options.ble_max_staleness,
+        backend=options.ble_backend,
+        device=options.ble_device,
+        min_interval=options.ble_min_interval,
+        buffer=buffer,
+        payload_version=options.ble_payload,
+        name=options.ble_name.encode() or None,
+        mode=options.ble_mode,
+    )
+
+
+class TableSession:
+    def __init__(self, options, name=None):
+        """
+        options: main.py's arguments (argparse.Namespace)
+        name:    table name for logs and stats, None for a lone table
+        """
+        self.options = options
+        self.name = name
+        self.log = logging.getLogger('kikicker' if name is None else f'kikicker.{name}')
+        # goals are rare and always logged; per-frame events at most once per interval
+        self.events = EventLog(self.log.name, interval=options.log_interval,
+                               intervals={'goal': 0.0})
+        self.instruments = Instruments()
+        # this table's payload; BLAData's process-wide buffer stays unused
+        self.buffer = BLAEventBuffer()
+        self.ball_track = KalmanTracker()
+
+        self.camera = None
+        self.view = None
+        self.calibration = None
+        self.roi_monitor = None
+        self.colors = None
+        self.retuner = None
+        self.field = None
+        self.tracker = None
+        self.recorder = None
+        self.adv = None
+        self.pipeline = None
+        self.stats_server = None
+        self.position_every = 0
+
+        # publish stage state
+        self.prev_pos = None
+        self.peak_speed = 0.0
+        self.status_time = 0.0
+
+    def profile_name(self):
+        """
+        Name this table's re-tuned colour profile is saved (and looked
+        for) under: --color-profile, with "@table" appended when the
+        table is one of several, which all inherit the same profile.
+        """
+        name = self.options.color_profile
+        if not name or self.name is None:
+            return name
+        return f"{name}@{self.name}"
+
+    # ------------------------------------------------------------
+
+    def start(self):
+        """
+        Opens the camera, finds the field and starts the helpers.
+        The pipeline itself runs in run().
+        """
+        opt = self.options
+        # this table's colours: the profile's ranges (or the defaults)
+        # and backend together, so the LUT is built (or loaded) once
+        camera = camera_key(opt.source, FRAME_SIZE, FPS)
+        profile = None
+        if opt.color_profile:
+            # this table's re-tuned copy first, then the shared profile
+            own = self.profile_name()
+            if own != opt.color_profile:
+                profile = load_profile(own, camera)
+            if profile is None:
+                profile = load_profile(opt.color_profile, camera)
+            if profile is None:
+                self.log.warning(f"No colour profile {opt.color_profile!r}, using the defaults")
+            else:
+                if profile.camera != camera:
+                    self.log.warning(f"Colour profile {opt.color_profile!r} was made for "
+                                     f"{profile.camera}, not {camera}")
+        if profile is None:
+            profile = ColorProfile.default()
+            profile.camera = camera
+        profile.name = self.profile_name() or "default"
+        self.colors = profile.thresholds(opt.color_backend)
+        if opt.color_retune > 0:
+            self.retuner = ColorRetuner(profile, self.colors, interval=opt.color_retune)
+            self.retuner.start()
+
+        self.camera = open_source(opt.source, size=FRAME_SIZE, fps=FPS,
+                                  loop=opt.loop, realtime=True)
+        self.camera.start()
+
+        # -------------------------------
+        # Initial frame & ROI
+        # -------------------------------
+        initial_frame_rgb = self.camera.capture_array()
+        field_roi = find_playfield_roi(initial_frame_rgb, debug=opt.debug, colors=self.colors)
+
+        # overlay on its own thread: the loop only hands over references
+        if opt.debug or opt.debug_stream:
+            title = 'Kicker Live' if self.name is None else f'Kicker Live {self.name}'
+            self.view = DebugView(fps=opt.debug_fps, window=title if opt.debug else None,
+                                  stream=opt.debug_stream)
+            self.view.start()
+
+        if field_roi is None:
+            field_roi = (0, 0, initial_frame_rgb.shape[1], initial_frame_rgb.shape[0])
+        # search area in the frame (x, y, w, h)
+        roi = field_roi
+
+        # -------------------------------
+        # Optional calibration (see calibration.py):
+        # field coordinates come from its lookup tables
+        # -------------------------------
+        if opt.calibration:
+            self.calibration = load_calibration(opt.calibration)
+            if self.calibration is None:
+                self.log.warning(f"No calibration at {opt.calibration}, using the bounding box")
+            else:
+                roi = self.calibration.roi
+
+        # a calibration is tied to the camera pose: if the field moves,
+        # the monitor only warns (recalibrate) instead of following it
+        self.roi_monitor = ROIMonitor(roi, interval=opt.roi_interval or 1.0,
+                                      prepare=partial(FieldState, calibration=self.calibration),
+                                      follow=self.calibration is None,
+                                      colors=self.colors)
+        if opt.roi_interval > 0:
+            self.roi_monitor.start()
+        self.field = self.roi_monitor.current[1]
+
+        # The tracking window and the background model rely on frames
+        # arriving in order, so they are only used with a single
+        # detection worker.
+        if opt.detector == 'background' and opt.workers > 1:
+            self.log.warning("The background detector needs --workers 1, using contours")
+        elif opt.detector == 'background':
+            self.tracker = BackgroundBallDetector(roi=self.roi_monitor.roi,
+                                                  gate=None if opt.no_tracking else 48,
+                                                  colors=self.colors)
+            self.instruments.gauge('detector', self.tracker.stats)
+        elif not opt.no_tracking and opt.workers == 1:
+            self.tracker = BallTracker(roi=self.roi_monitor.roi, colors=self.colors)
+
+        if opt.record:
+            self.recorder = FrameRecorder(
+                opt.record,
+                seconds=opt.record_seconds,
+                fps=FPS,
+                size=(initial_frame_rgb.shape[1], initial_frame_rgb.shape[0])
+            )
+            self.recorder.start()
+
+        # -------------------------------
+        # BLE advertiser & payload
+        # -------------------------------
+        self.adv = make_advertiser(opt, self.buffer)
+        self.adv.start()
+
+        # position samples only fit into extended advertising data
+        if self.adv.extended and opt.ble_position_rate > 0:
+            self.position_every = max(1, int(round(FPS / opt.ble_position_rate)))
+
+        inst = self.instruments
+        self.pipeline = Pipeline(
+            capture=inst.wrap('capture', self.camera.capture_array),
+            detect=inst.wrap('detect', self.detect, threads=opt.workers),
+            publish=inst.wrap('publish', self.publish),
+            queue_size=opt.queue_size,
+            policy=opt.drop_policy,
+            workers=opt.workers,
+        )
+
+        # -------------------------------
+        # Telemetry: payload packing runs on the advertiser thread,
+        # the rest is read only when someone asks
+        # -------------------------------
+        pipeline = self.pipeline
+        inst.histogram('payload', self.adv.pack_times)
+        inst.gauge('queues', pipeline.queue_depths)
+        inst.gauge('pipeline', lambda: {"captured": pipeline.captured,
+                                        "published": pipeline.published,
+                                        "reordered": pipeline.reordered,
+                                        "failed": pipeline.failed})
+        inst.gauge('ble', self.adv.stats)
+        inst.gauge('roi', self.roi_monitor.stats)
+        if self.retuner is not None:
+            inst.gauge('color', self.retuner.stats)
+        inst.gauge('log_suppressed', lambda: dict(self.events.suppressed))
+        if opt.stats:
+            self.stats_server = StatsServer(inst, opt.stats)
+            self.stats_server.start()
+            self.log.info(f"Stats on {opt.stats}")
+
+    def run(self):
+        """
+        Runs the pipeline in the calling thread until the source ends,
+        the overlay's 'q' or stop().
+        """
+        self.status_time = time.time()
+        self.pipeline.run()
+
+    def stop(self):
+        """
+        Ends run(); safe from any thread.
+        """
+        if self.pipeline is not None:
+            self.pipeline.stop()
+
+    def close(self):
+        """
+        Releases everything start() opened (also after a failed start).
+        """
+        if self.pipeline is not None:
+            self.pipeline.stop()
+        if self.recorder is not None:
+            self.recorder.stop()
+        if self.adv is not None:
+            self.adv.stop()
+        if self.roi_monitor is not None:
+            self.roi_monitor.stop()
+        if self.retuner is not None:
+            self.retuner.stop()
+            if self.retuner.updates and self.options.color_profile:
+                # the next start begins from where the light is now
+                # (under profile_name(): other tables keep their own)
+                save_profile(self.retuner.profile)
+                self.log.info(f"Colour profile {self.retuner.profile.name!r} saved "
+                              f"after {self.retuner.updates} re-tunes")
+        if self.stats_server is not None:
+            self.stats_server.stop()
+        if self.camera is not None:
+            self.camera.stop()
+        if self.view is not None:
+            self.view.stop()
+
+    def snapshot(self):
+        snapshot = self.instruments.snapshot()
+        snapshot["table"] = self.name
+        return snapshot
+
+    # ------------------------------------------------------------
+    # pipeline stages
+    # ------------------------------------------------------------
+
+    def detect(self, frame_rgb):
+        roi = self.roi_monitor.roi
+        tracker = self.tracker
+        if tracker is not None:
+            if tracker.roi is not roi:
+                tracker.set_roi(roi)
+            return tracker.detect(frame_rgb)
+        return detect_ball(frame_rgb, roi=roi, colors=self.colors)
+
+    def save_incident(self, seq):
+        if self.recorder is not None:
+            path = os.path.join(self.options.record, f"incident_{int(time.time())}_{seq}.npy")
+            self.recorder.save_last(self.options.incident_seconds, path)
+
+    def publish(self, frame):
+        opt = self.options
+        view = self.view
+        events = self.events
+        instruments = self.instruments
+        buffer = self.buffer
+        adv = self.adv
+        ball_track = self.ball_track
+
+        # capture to publish: what a table's latency budget is about
+        instruments.record('latency', time.monotonic() - frame.timestamp)
+        frame_rgb = frame.image
+        result = frame.result
+        if opt.roi_interval > 0:
+            self.roi_monitor.submit(frame_rgb)
+            current = self.roi_monitor.current[1]
+            if current is not self.field:
+                # the field moved: positions so far are in the old frame
+                self.field = current
+                ball_track.reset()
+                self.prev_pos = None
+                instruments.count('roi_moves')
+                self.log.warning(f"Field ROI moved to {current.roi}")
+        field = self.field
+        if self.recorder is not None:
+            self.recorder.submit(frame.seq, frame.timestamp, frame_rgb, result)
+
+        instruments.count('frames')
+        measurement = None
+        if result is None:
+            instruments.count('misses')
+            if view is not None:
+                view.lost()
+                view.submit(frame_rgb, field.roi)
+        else:
+            cx, cy, x, y, w, h = result
+
+            # Convert to field coordinates
+            measurement = field.to_field(cx, cy)
+
+            # Quantized bits ONLY for BLE/debug
+            x_7bit, y_6bit = quantize_to_bits(measurement[0], measurement[1],
+                                              field.width, field.height)
+            buffer.set_initial_coord(x_7bit, y_6bit)
+            if self.position_every and frame.seq % self.position_every == 0:
+                buffer.add_position(frame.seq, x_7bit, y_6bit)
+                adv.notify("position")
+            events.event('ball', x=measurement[0], y=measurement[1], bits=f"{x_7bit},{y_6bit}")
+            if self.retuner is not None:
+                self.retuner.submit(frame_rgb, field.roi, result)
+            if view is not None:
+                view.ball(cx, cy)
+                view.submit(frame_rgb, field.roi, (x, y, w, h), f"{x_7bit},{y_6bit}")
+
+        # -------------------------------
+        # Kalman tracking: filters detections and
+        # bridges short dropouts by prediction
+        # -------------------------------
+        t0 = perf_counter()
+        position = ball_track.step(measurement, frame.timestamp)
+        ball = field.metrics.update(frame.timestamp, position)
+        instruments.record('track', perf_counter() - t0)
+        if ball is not None and ball.speed > self.peak_speed:
+            self.peak_speed = ball.speed
+
+        if position is not None:
+            field_x = int(round(position[0]))
+            field_y = int(round(position[1]))
+
+            # -------------------------------
+            # GOAL DETECTION
+            # (path since the previous frame vs. every goal line,
+            #  latched until the ball leaves the goal area)
+            # -------------------------------
+            t0 = perf_counter()
+            goal = field.goal_engine.check(
+                curr_pos=(field_x, field_y),
+                prev_pos=self.prev_pos
+            )
+            instruments.record('goal', perf_counter() - t0)
+
+            if goal == "TEAM1" or goal == "TEAM2":
+                team = 1 if goal == "TEAM1" else 2
+                events.event('goal', team=team, frame=frame.seq)
+                instruments.count('goals')
+                if view is not None:
+                    view.goal(team)
+                buffer.push_goal(team)
+                adv.notify("goal")
+                self.save_incident(frame.seq)
+
+            # -------------------------------
+            # Bounce detection
+            # -------------------------------
+            t0 = perf_counter()
+            bounce_coords = field.bounce_detector.update(field_x, field_y)
+            instruments.record('bounce', perf_counter() - t0)
+            if bounce_coords is not None:
+                # sub-frame estimate from the incoming/outgoing segments
+                refined = ball_track.locate_bounce()
+                if refined is not None:
+                    _, bx, by = refined
+                else:
+                    bx, by = bounce_coords
+                quad = field.field_model.zone(bx, by)
+                instruments.count('bounces')
+                events.event('bounce', x=bx, y=by, quadrant=quad)
+                if view is not None:
+                    view.bounce(*field.to_image(bx, by), label=quad)
+
+                # -------------------------------
+                # BLE payload: the scheduler decides when it goes on air
+                # -------------------------------
+                angle, speed = field.metrics.direction_bits(ball_track.velocity)
+                buffer.add_bounce(Bounce(angle, speed, frame.seq, quad))
+                adv.notify("bounce")
+
+            # -------------------------------
+            # UPDATE PREVIOUS POSITION
+            # -------------------------------
+            self.prev_pos = (field_x, field_y)
+
+        else:
+            # track lost: don't join the next detection to a stale position
+            self.prev_pos = None
+
+        # the overlay window's 'q' ends the run
+        if view is not None and view.quit_requested:
+            return False
+
+        # compact status line (stage latencies p50/p99, counters, queues)
+        if time.time() - self.status_time >= opt.log_interval:
+            queues = self.pipeline.queue_depths()
+            self.log.info(f"{instruments.summary()} | dropped {queues['capture_dropped']}+"
+                          f"{queues['result_dropped']} | ble {adv.updates} updates "
+                          f"{adv.failures} failures | peak {self.peak_speed:.2f} m/s")
+            if self.roi_monitor.stale:
+                self.log.warning("Field moved since calibration: run calibration.py again")
+            self.peak_speed = 0.0
+            self.status_time = time.time()
+
+
+# ------------------------------------------------------------
+# several tables
+# ------------------------------------------------------------
+
+def load_tables(path, defaults):
+    """
+    One option namespace per table in the JSON file `path` (a list, or
+    {"tables": [...]}), each entry overriding `defaults` (main.py's
+    arguments). Endpoints that can't be shared (--stats, --debug-stream)
+    are not inherited, --record becomes a directory per table, and
+    --color-profile is where each table's own re-tuned copy starts from
+    (TableSession.profile_name).
+    """
+    with open(path) as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries["tables"]
+
+    base = dict(vars(defaults), stats=None, debug_stream=None, tables=None, cpus=None)
+    tables = []
+    for i, entry in enumerate(entries, 1):
+        options = dict(base, name=f"table{i}")
+        for key, value in entry.items():
+            key = key.replace("-", "_")
+            if key not in options:
+                raise ValueError(f"{path}: table {i}: unknown option {key!r}")
+            options[key] = value
+        if defaults.record and "record" not in entry:
+            options["record"] = os.path.join(defaults.record, options["name"])
+        if any(t.name == options["name"] for t in tables):
+            raise ValueError(f"{path}: table name {options['name']!r} used twice")
+        tables.append(argparse.Namespace(**options))
+    return tables
+
+
+def assign_cpus(tables, available=None):
+    """
+    {name: [cpu, ...]}: tables with "cpus" keep them, the others split
+    the remaining cores into equal contiguous blocks (and share cores
+    round-robin when there are more tables than cores).
+    """
+    if available is None:
+        available = os.sched_getaffinity(0) if hasattr(os, "sched_getaffinity") else range(os.cpu_count() or 1)
+    fixed = {t.name: sorted(t.cpus) for t in tables if t.cpus}
+    taken = {c for cpus in fixed.values() for c in cpus}
+    free = sorted(set(available) - taken) or sorted(available)
+    rest = [t.name for t in tables if not t.cpus]
+    out = dict(fixed)
+    if not rest:
+        return out
+    per_table = len(free) // len(rest)
+    for i, name in enumerate(rest):
+        if per_table:
+            out[name] = free[i * per_table:(i + 1) * per_table]
+        else:
+            out[name] = [free[i % len(free)]]
+    return out
+
+
+def _run_table(options, cpus, snapshots, stop, interval):
+    """
+    Body of a table's process: pin, run the session, report snapshots
+    (as JSON, so nothing unpicklable has to cross the queue).
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        # OpenCV's own pool would otherwise start a thread per core of the box
+        import cv2
+        cv2.setNumThreads(len(cpus))
+    logging.basicConfig(level=options.log_level, format=TABLE_LOG_FORMAT)
+    session = TableSession(options, options.name)
+    finished = threading.Event()
+
+    def report():
+        # stop is polled, not waited on: a process that exits while
+        # waiting on a multiprocessing Event leaves the parent's set() hanging
+        due = time.monotonic() + interval
+        while not finished.wait(0.1):
+            if stop.is_set():
+                session.stop()
+                return
+            if time.monotonic() >= due:
+                due += interval
+                snapshots.put((options.name, os.getpid(), json.dumps(session.snapshot(), default=str)))
+
+    try:
+        session.start()
+        threading.Thread(target=report, daemon=True).start()
+        session.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        finished.set()
+        session.close()
+        snapshots.put((options.name, os.getpid(), json.dumps(session.snapshot(), default=str)))
+
+
+class _Table:
+    __slots__ = ("options", "cpus", "process", "restarts", "started", "snapshot",
+                 "received", "frames", "fps", "done")
+
+    def __init__(self, options, cpus):
+        self.options = options
+        self.cpus = cpus
+        self.process = None
+        self.restarts = 0
+        self.started = 0.0
+        self.snapshot = None
+        self.received = 0.0
+        self.frames = None
+        self.fps = 0.0
+        self.done = False
+
+
+class Supervisor:
+    def __init__(self, tables, interval=1.0, max_restarts=5, restart_delay=2.0):
+        """
+        tables:        option namespaces with .name and .cpus (load_tables)
+        interval:      seconds between snapshots from each table
+        max_restarts:  per table; a table that keeps dying is given up
+        """
+        self.interval = interval
+        self.max_restarts = max_restarts
+        self.restart_delay = restart_delay
+        self.log = logging.getLogger('kikicker')
+        cpus = assign_cpus(tables)
+        self.tables = {t.name: _Table(t, cpus[t.name]) for t in tables}
+        # spawn: a fresh interpreter per table, no threads or locks
+        # inherited from this process
+        self._mp = multiprocessing.get_context("spawn")
+        self._snapshots = self._mp.Queue()
+        self._stop = self._mp.Event()
+        self.started = time.monotonic()
+        self.running = False
+
+    def _spawn(self, table):
+        table.process = self._mp.Process(
+            target=_run_table, name=f"kikicker-{table.options.name}", daemon=True,
+            args=(table.options, table.cpus, self._snapshots, self._stop, self.interval))
+        table.process.start()
+        table.started = time.monotonic()
+        self.log.info(f"Table {table.options.name}: pid {table.process.pid} on cpus {table.cpus}")
+
+    def start(self):
+        self._stop.clear()
+        self.running = True
+        for table in self.tables.values():
+            self._spawn(table)
+
+    def run(self):
+        """
+        Collects snapshots and watches the table processes until every
+        table has ended or stop() is called.
+        """
+        self.start()
+        try:
+            while self.running:
+                self._collect(timeout=0.2)
+                self._watch()
+                if all(t.done for t in self.tables.values()):
+                    break
+        finally:
+            self.stop()
+
+    def _collect(self, timeout):
+        try:
+            item = self._snapshots.get(timeout=timeout)
+        except queue.Empty:
+            return
+        while True:
+            self._received(*item)
+            try:
+                item = self._snapshots.get_nowait()
+            except queue.Empty:
+                return
+
+    def _received(self, name, pid, snapshot):
+        table = self.tables.get(name)
+        if table is None:
+            return
+        snapshot = json.loads(snapshot)
+        now = time.monotonic()
+        frames = snapshot["counters"].get("frames", 0)
+        if table.frames is not None and frames >= table.frames and now > table.received:
+            table.fps = (frames - table.frames) / (now - table.received)
+        table.frames = frames
+        table.received = now
+        snapshot["pid"] = pid
+        table.snapshot = snapshot
+
+    def _watch(self):
+        for name, table in self.tables.items():
+            process = table.process
+            if table.done or process is None or process.is_alive():
+                continue
+            if process.exitcode == 0 or not self.running:
+                # the source ran out (or 'q' in its overlay)
+                self.log.info(f"Table {name} finished")
+                table.done = True
+            elif table.restarts >= self.max_restarts:
+                self.log.error(f"Table {name} died (exit code {process.exitcode}), giving up")
+                table.done = True
+            elif time.monotonic() - table.started >= self.restart_delay:
+                table.restarts += 1
+                table.frames = None
+                self.log.warning(f"Table {name} died (exit code {process.exitcode}), "
+                                 f"restart {table.restarts}/{self.max_restarts}")
+                self._spawn(table)
+
+    def stop(self, timeout=5.0):
+        self.running = False
+        self._stop.set()
+        deadline = time.monotonic() + timeout
+        for table in self.tables.values():
+            if table.process is not None:
+                table.process.join(max(0.0, deadline - time.monotonic()))
+                if table.process.is_alive():
+                    table.process.terminate()
+                    table.process.join(1.0)
+        # final snapshots sent on the way out
+        self._collect(timeout=0)
+
+    # ------------------------------------------------------------
+
+    def snapshot(self):
+        """
+        Per-table snapshots plus totals: counters summed, frame rates
+        summed, and for every histogram the worst table's p99.
+        """
+        now = time.monotonic()
+        tables = {}
+        counters = {}
+        worst = {}
+        fps = 0.0
+        for name, table in list(self.tables.items()):
+            process = table.process
+            entry = {
+                "cpus": table.cpus,
+                "alive": process is not None and process.is_alive(),
+                "restarts": table.restarts,
+                "fps": table.fps,
+                "age_s": now - table.received if table.snapshot is not None else None,
+            }
+            snapshot = table.snapshot
+            if snapshot is not None:
+                entry.update(snapshot)
+                for key, value in snapshot["counters"].items():
+                    counters[key] = counters.get(key, 0) + value
+                for key, latency in snapshot["latency"].items():
+                    if latency["p99_ms"] >= worst.get(key, {"p99_ms": -1.0})["p99_ms"]:
+                        worst[key] = {"p99_ms": latency["p99_ms"], "table": name}
+                if entry["alive"]:
+                    fps += table.fps
+            tables[name] = entry
+        return {
+            "uptime_s": now - self.started,
+            "tables": tables,
+            "totals": {"fps": fps, "counters": counters, "worst_p99_ms": worst},
+        }
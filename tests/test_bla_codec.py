@@ -0,0 +1,236 @@
+# tests/test_bla_codec.py
+"""
+Round trips of the v1/v2/v3 payload formats and the advertising data
+framing around them.
+"""
+import numpy as np
+import pytest
+
+from bla_codec import (Bounce, BLAEncoder, BLAEncoderV2, BLAEncoderV3, capacity, encode,
+                       encoded_length, decode, decode_v2, decode_v3, adv_header, frame_payload,
+                       parse_adv_data, parse_manufacturer_data, payload_room, split_adv_data,
+                       NAME, SEQUENCED, V2_MAX_BOUNCES)
+
+
+def _reference_encode(goal, init_x, init_y, bounces, max_payload):
+    # the bit-by-bit packing loop the firmware side was written against
+    acc = bits = 0
+    for value, n in ((goal, 2), (init_x, 7), (init_y, 6)):
+        acc = (acc << n) | (value & ((1 << n) - 1))
+        bits += n
+    for b in bounces:
+        if (bits + 27 + 7) // 8 > max_payload:
+            break
+        for value, n in ((b.angle, 8), (b.speed, 8), (b.frame, 7), (b.quad, 4)):
+            acc = (acc << n) | (value & ((1 << n) - 1))
+            bits += n
+    pad = (8 - bits % 8) % 8
+    return (acc << pad).to_bytes((bits + pad) // 8, "big")
+
+
+def _random_bounces(rng, n):
+    return [Bounce(*(int(v) for v in rng.integers(0, 256, 4))) for _ in range(n)]
+
+
+def _rally(rng, n):
+    # mostly small steps, some jumps, like real rallies
+    bounces, frame, quad, speed, angle = [], 0, 0, 20, 0
+    for _ in range(n):
+        frame += int(rng.integers(6, 140))
+        quad = int(rng.integers(0, 16)) if rng.random() < 0.3 else quad
+        speed += int(rng.integers(-12, 12))
+        angle += int(rng.integers(-24, 24)) if rng.random() < 0.7 else 128
+        bounces.append(Bounce(angle, speed, frame, quad))
+    return bounces
+
+
+# ------------------------------------------------------------
+# v1
+# ------------------------------------------------------------
+
+def test_v1_readme_sample():
+    assert decode(bytes.fromhex("464454f01c80")) == (1, 12, 34, [Bounce(42, 120, 7, 2)])
+
+
+def test_v1_capacity_and_length():
+    assert capacity(18) == 4
+    assert [encoded_length(n) for n in range(4)] == [2, 6, 9, 12]
+    assert capacity(1) == 0
+
+
+def test_v1_matches_reference_and_round_trips():
+    rng = np.random.default_rng(5)
+    for _ in range(2000):
+        max_payload = int(rng.integers(2, 32))
+        goal, x, y = (int(v) for v in rng.integers(0, [3, 256, 256]))
+        bounces = _random_bounces(rng, int(rng.integers(0, capacity(max_payload) + 3)))
+        data = encode(goal, x, y, bounces, max_payload)
+        assert data == _reference_encode(goal, x, y, bounces, max_payload)
+        assert len(data) <= max_payload
+        assert decode(data) == (goal & 3, x & 0x7F, y & 0x3F, bounces[:capacity(max_payload)])
+
+
+def test_v1_encoder_counts_and_reuses_buffer():
+    encoder = BLAEncoder(18)
+    bounces = [Bounce(i, i, i, i) for i in range(10)]
+    first = bytes(encoder.encode(0, 1, 2, bounces))
+    assert encoder.count == 4
+    encoder.encode(0, 1, 2, [])
+    assert encoder.count == 0
+    assert decode(first)[3] == bounces[:4]
+
+
+def test_v1_too_short():
+    with pytest.raises(ValueError):
+        decode(b"\x00")
+
+
+# ------------------------------------------------------------
+# v2
+# ------------------------------------------------------------
+
+def _v2_round_trip(bounces, max_payload=31, goal=2, x=100, y=50):
+    encoder = BLAEncoderV2(max_payload)
+    data = bytes(encoder.encode(goal, x, y, bounces))
+    assert len(data) <= max_payload
+    assert decode_v2(data) == (goal, x, y, bounces[:encoder.count])
+    return encoder.count, data
+
+
+def test_v2_random_rallies_round_trip():
+    rng = np.random.default_rng(7)
+    for _ in range(2000):
+        max_payload = int(rng.integers(3, 32))
+        bounces = _rally(rng, int(rng.integers(0, 20)))
+        count, _ = _v2_round_trip(bounces, max_payload)
+        # never fewer than the worst case promises
+        assert count >= min(len(bounces), capacity(max_payload, 2))
+
+
+def test_v2_empty():
+    assert _v2_round_trip([]) == (0, bytes.fromhex("b26400"))
+
+
+@pytest.mark.parametrize("second", [
+    Bounce(10, 100, 16, 3),             # same quadrant: the 1-bit run code
+    Bounce(10, 100, 16, 4),             # next quadrant
+    Bounce(10, 100, 16, 0),
+    Bounce(10, 100, 16, 15),
+    Bounce(255, 0, 16, 3),              # speed and angle are sent whole
+    Bounce(10, 100, 14, 3),             # closer than V2_MIN_GAP: longest frame code
+    Bounce(10, 100, 13, 3),
+    Bounce(10, 100, 12, 3),             # frame going back
+    Bounce(10, 100, 140, 3),            # frame wrapping through 127
+])
+def test_v2_delta_paths(second):
+    first = Bounce(10, 100, 13, 3)
+    assert _v2_round_trip([first, second])[0] == 2
+
+
+def test_v2_quadrant_runs():
+    bounces = [Bounce(7 * i, 3 * i, 5 * i, 6) for i in range(8)]
+    _, run = _v2_round_trip(bounces)
+    changing = [Bounce(b.angle, b.speed, b.frame, i) for i, b in enumerate(bounces)]
+    _, no_run = _v2_round_trip(changing)
+    # 4 bits saved per repeated quadrant
+    assert len(no_run) * 8 - len(run) * 8 >= 4 * 7 - 7
+
+
+def test_v2_packs_more_than_v1():
+    # typical rally: frames 3..40 apart, quadrants changing or repeating
+    rng = np.random.default_rng(11)
+    bounces, frame, quad = [], 0, 0
+    for _ in range(15):
+        frame += int(rng.integers(3, 40))
+        quad = quad if rng.random() < 0.25 else int(rng.integers(0, 16))
+        bounces.append(Bounce(int(rng.integers(0, 256)), int(rng.integers(0, 256)), frame, quad))
+    # in one advertising packet: v1 after the name, sequenced v2 without one
+    v1_room = payload_room(adv_header(1))
+    v2_room = payload_room(adv_header(2, None), 2, sequenced=True)
+    assert _v2_round_trip(bounces, v2_room)[0] > capacity(v1_room)
+
+
+def test_v2_worst_case_capacity_holds():
+    # every delta takes its longest code
+    bounces = [Bounce(128 * (i & 1), 128 * (i & 1), 2 * i, 15 * (i & 1))
+               for i in range(V2_MAX_BOUNCES)]
+    for max_payload in range(3, 32):
+        count, _ = _v2_round_trip(bounces, max_payload)
+        assert count >= capacity(max_payload, 2)
+
+
+def test_v2_bounce_limit():
+    bounces = [Bounce(0, 0, i, 0) for i in range(40)]
+    assert _v2_round_trip(bounces, 200)[0] == V2_MAX_BOUNCES
+
+
+def test_v2_truncated():
+    _, data = _v2_round_trip([Bounce(1, 2, 3, 4), Bounce(5, 6, 7, 8)])
+    with pytest.raises(ValueError):
+        decode_v2(data[:-2])
+
+
+# ------------------------------------------------------------
+# v3
+# ------------------------------------------------------------
+
+def test_v3_round_trip():
+    rng = np.random.default_rng(3)
+    for _ in range(500):
+        max_payload = int(rng.integers(8, 250))
+        bounces = _rally(rng, int(rng.integers(0, 10)))
+        frame, positions = int(rng.integers(0, 128)), []
+        for _ in range(int(rng.integers(0, 60))):
+            frame = (frame + int(rng.integers(1, 6))) & 0x7F
+            positions.append((frame, int(rng.integers(0, 128)), int(rng.integers(0, 64))))
+        encoder = BLAEncoderV3(max_payload)
+        data = bytes(encoder.encode(1, 20, 30, bounces, positions))
+        assert len(data) <= max_payload
+        assert decode_v3(data) == (1, 20, 30, bounces[:encoder.count],
+                                   positions[:encoder.position_count])
+
+
+def test_v3_truncated():
+    data = bytes(BLAEncoderV3(40).encode(0, 1, 2, [Bounce(1, 2, 3, 4)], [(1, 2, 3), (2, 3, 4)]))
+    with pytest.raises(ValueError):
+        decode_v3(data[:3])
+
+
+# ------------------------------------------------------------
+# advertising data framing
+# ------------------------------------------------------------
+
+def test_v1_framing():
+    header = adv_header(1)
+    payload = encode(1, 2, 3, [Bounce(4, 5, 6, 7)], payload_room(header))
+    data = frame_payload(header, payload)
+    assert len(data) <= 31
+    assert parse_adv_data(data) == (1, None, None, payload)
+    assert split_adv_data(data) == (1, payload)
+
+
+@pytest.mark.parametrize("version", [2, 3])
+@pytest.mark.parametrize("name", [None, b"kk", NAME])
+def test_unsequenced_framing(version, name):
+    header = adv_header(version, name)
+    data = frame_payload(header, b"\x12\x34", version)
+    assert data.endswith(bytes([version]) + b"\x12\x34")
+    assert parse_adv_data(data) == (version, None, None, b"\x12\x34")
+
+
+@pytest.mark.parametrize("version", [2, 3])
+def test_sequenced_framing(version):
+    header = adv_header(version, None)
+    assert payload_room(header, version, sequenced=True) == payload_room(header, version) - 2
+    data = frame_payload(header, b"\xab", version, seq=257, first=300)
+    # version byte with the 0x80 flag, then seq and first mod 256
+    assert data[-4:] == bytes([version | SEQUENCED, 1, 44, 0xAB])
+    assert parse_adv_data(data) == (version, 1, 44, b"\xab")
+
+
+def test_manufacturer_data_rejects_other_packets():
+    assert parse_manufacturer_data(b"") is None
+    assert parse_manufacturer_data(b"\x01\x00") is None          # v1 is never manufacturer data
+    assert parse_manufacturer_data(b"\x09\x00") is None          # unknown version
+    assert parse_manufacturer_data(bytes([2 | SEQUENCED, 5])) is None   # seq bytes missing
+    assert parse_adv_data(bytes.fromhex("020106") + b"\x05\xff\x34\x12\x02\x00") is None
@@ -0,0 +1,95 @@
+# tests/test_bla_receiver.py
+"""
+The receiver against what the advertiser sends with main.py's default
+options: de-duplication, gap detection and the reassembled bounce log.
+"""
+import numpy as np
+import pytest
+
+from bla_buffer import BLAEventBuffer
+from bla_codec import Bounce
+from bla_receiver import BLAReceiver
+from main import parser
+from table_session import make_advertiser
+
+
+def _default_advertiser():
+    # everything as `python main.py` would have it, minus the radio
+    options = parser.parse_args(["--ble-backend", "fake"])
+    buffer = BLAEventBuffer(capacity=256)
+    return make_advertiser(options, buffer), buffer
+
+
+def _packets(adv, buffer, bounces_per_step, seed=0):
+    """
+    Distinct packets as the controller would advertise them, each with
+    the stream indices of the bounces it carries.
+    """
+    rng = np.random.default_rng(seed)
+    packets, index, frame = [], 0, 0
+    for count in bounces_per_step:
+        for _ in range(count):
+            frame += int(rng.integers(3, 30))
+            buffer.add_bounce(Bounce(int(rng.integers(0, 256)), int(rng.integers(0, 256)),
+                                     frame, int(rng.integers(0, 16))))
+        before = buffer.pending_bounces()
+        packet = adv._build_packet()
+        sent = before - buffer.pending_bounces()
+        if packets and packet == packets[-1][0]:
+            continue
+        packets.append((packet, list(range(index, index + sent))))
+        index += sent
+    return packets
+
+
+def test_default_options_advertise_sequenced_packets():
+    adv, _ = _default_advertiser()
+    assert adv.payload_version == 2
+    assert adv.name is None
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_gaps_detected_with_default_options(seed):
+    adv, buffer = _default_advertiser()
+    rng = np.random.default_rng(seed)
+    packets = _packets(adv, buffer, rng.integers(0, 4, 300), seed)
+    receiver = BLAReceiver(simulate=True)
+    receiver.start()
+
+    lost_packets = lost_bounces = 0
+    expected = []
+    for n, (packet, carried) in enumerate(packets):
+        # first and last always arrive, so every loss lies between two received packets
+        if 0 < n < len(packets) - 1 and rng.random() < 0.15:
+            lost_packets += 1
+            lost_bounces += len(carried)
+            continue
+        for _ in range(int(rng.integers(1, 4))):
+            receiver.inject_packet(packet)      # advertisements repeat
+        expected += carried
+    receiver.stop()
+
+    assert lost_packets > 0
+    assert receiver.lost_packets == lost_packets
+    assert receiver.lost_bounces == lost_bounces
+    gaps = [e for e in receiver.events if e.kind == "gap"]
+    assert sum(e.data for e in gaps) == lost_bounces
+    log = receiver.bounce_log()
+    base = log[0].index - expected[0]
+    assert [e.index - base for e in log] == expected
+
+
+def test_repeats_and_late_packets_are_dropped():
+    adv, buffer = _default_advertiser()
+    packets = _packets(adv, buffer, [2, 1, 3, 1])
+    receiver = BLAReceiver(simulate=True)
+    receiver.start()
+    for packet, _ in packets:
+        receiver.inject_packet(packet)
+        receiver.inject_packet(packet)
+    receiver.inject_packet(packets[1][0])
+    receiver.stop()
+    stats = receiver.stats()
+    assert stats["duplicates"] == len(packets) + 1
+    assert stats["lost_packets"] == 0
+    assert [e.index for e in receiver.bounce_log()] == list(range(receiver.bounces))
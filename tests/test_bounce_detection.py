@@ -0,0 +1,105 @@
+# tests/test_bounce_detection.py
+"""
+BounceDetector and detect_bounces_batch must make exactly the decisions
+detect_bounce makes, point for point.
+"""
+import numpy as np
+import pytest
+
+from Bounce_detection import detect_bounce, BounceDetector, detect_bounces_batch
+from frame_source import rally_script
+
+FIELD = (336, 192)
+
+
+def _trajectories(count=40, length=400, seed=1):
+    """
+    Jittered synthetic rallies with garbage coordinates, spurious blobs
+    and a resting ball at the end.
+    """
+    rng = np.random.default_rng(seed)
+    w, h = FIELD
+    trajectories = []
+    for _ in range(count):
+        speed = float(rng.uniform(0.5, 30))
+        angle = float(rng.uniform(0, 2 * np.pi))
+        traj = []
+        for x, y in rally_script((0, 0, w, h), speed=speed, angle=angle, frames=length):
+            x += rng.normal(0, 1.5)
+            y += rng.normal(0, 1.5)
+            r = rng.random()
+            if r < 0.01:
+                x = -5
+            elif r < 0.03:
+                x, y = w // 2, h // 2
+            traj.append((int(x), int(y)))
+        traj += [traj[-1]] * 30
+        trajectories.append(traj)
+    return trajectories
+
+
+TRAJECTORIES = _trajectories()
+
+
+def _reference(traj, **params):
+    w, h = FIELD
+    state = {}
+    return [detect_bounce(x, y, w, h, state, **params) for x, y in traj]
+
+
+def test_traces_have_bounces():
+    # the equivalence checks below are only worth something if they fire
+    assert sum(b is not None for traj in TRAJECTORIES for b in _reference(traj)) > 100
+
+
+@pytest.mark.parametrize("index", range(len(TRAJECTORIES)))
+def test_detector_matches_function(index):
+    traj = TRAJECTORIES[index]
+    detector = BounceDetector(*FIELD)
+    assert [detector.update(x, y) for x, y in traj] == _reference(traj)
+
+
+@pytest.mark.parametrize("index", range(len(TRAJECTORIES)))
+def test_batch_matches_function(index):
+    traj = TRAJECTORIES[index]
+    expected = [(i, b) for i, b in enumerate(_reference(traj)) if b is not None]
+    xs, ys = np.array(traj).T
+    idx, coords = detect_bounces_batch(xs, ys, *FIELD)
+    assert list(zip(idx.tolist(), map(tuple, coords.tolist()))) == expected
+
+
+def test_parameters_are_honoured():
+    params = dict(velocity_threshold=8.0, angle_threshold=30.0, min_frames_between=3)
+    for traj in TRAJECTORIES[:10]:
+        expected = _reference(traj, **params)
+        detector = BounceDetector(*FIELD, **params)
+        assert [detector.update(x, y) for x, y in traj] == expected
+        xs, ys = np.array(traj).T
+        idx, _ = detect_bounces_batch(xs, ys, *FIELD, **params)
+        assert idx.tolist() == [i for i, b in enumerate(expected) if b is not None]
+
+
+def test_batch_takes_integral_floats():
+    # float arrays of whole pixels, with garbage the range check drops as
+    # given (-0.4 is off the field, not 0) and NaN for frames without a ball
+    rng = np.random.default_rng(3)
+    for traj in TRAJECTORIES[:10]:
+        xs, ys = np.array(traj, np.float64).T
+        gone = rng.random(len(xs)) < 0.05
+        xs[gone] = rng.choice([-0.4, np.nan, FIELD[0] + 0.5], gone.sum())
+        reference = _reference(zip(xs.tolist(), ys.tolist()))
+        expected = [(i, b) for i, b in enumerate(reference) if b is not None]
+        idx, coords = detect_bounces_batch(xs, ys, *FIELD)
+        assert list(zip(idx.tolist(), map(tuple, coords.tolist()))) == expected
+
+
+def test_batch_rejects_fractional_coordinates():
+    xs, ys = np.array(TRAJECTORIES[0], np.float64).T
+    xs[5] += 0.25
+    with pytest.raises(ValueError):
+        detect_bounces_batch(xs, ys, *FIELD)
+
+
+def test_batch_rejects_unknown_parameters():
+    with pytest.raises(TypeError):
+        detect_bounces_batch(np.zeros(3), np.zeros(3), *FIELD, velocity=1.0)
@@ -0,0 +1,38 @@
+# tests/test_color_profile.py
+"""
+The profile store when several table processes save to it at once.
+"""
+import multiprocessing
+
+from color_profile import ColorProfile, load_profile, save_profile
+from main import parser
+from table_session import TableSession
+
+
+def _save_many(path, table, count):
+    for i in range(count):
+        profile = ColorProfile.default()
+        profile.name, profile.camera, profile.samples = f"venue@{table}", "cam", i
+        save_profile(profile, path)
+
+
+def test_concurrent_saves_keep_every_profile(tmp_path):
+    path = str(tmp_path / "profiles.json")
+    ctx = multiprocessing.get_context("fork")
+    processes = [ctx.Process(target=_save_many, args=(path, f"table{i}", 25)) for i in range(4)]
+    for p in processes:
+        p.start()
+    for p in processes:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+    for i in range(4):
+        assert load_profile(f"venue@table{i}", "cam", path).samples == 24
+    # nothing left behind but the file and its lock
+    assert sorted(f.name for f in tmp_path.iterdir()) == ["profiles.json", "profiles.json.lock"]
+
+
+def test_tables_re_tune_their_own_copy():
+    options = parser.parse_args(["--color-profile", "venue"])
+    assert TableSession(options).profile_name() == "venue"
+    assert TableSession(options, "table2").profile_name() == "venue@table2"
+    assert TableSession(parser.parse_args([]), "table2").profile_name() is None
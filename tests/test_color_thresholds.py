@@ -0,0 +1,48 @@
+# tests/test_color_thresholds.py
+"""
+Colour thresholds belong to a session: applying a profile or re-tuning
+one table leaves the others (and the defaults) alone.
+"""
+import numpy as np
+
+import kicker_vision
+from color_profile import ColorProfile, ColorRetuner
+from kicker_vision import ColorThresholds, DEFAULT_COLORS, orange_mask
+
+
+def _orange(rgb):
+    return np.full((4, 4, 3), rgb, np.uint8)
+
+
+def test_profile_applies_to_one_session_only():
+    # a dark orange the default value bound (129) rejects
+    dark = _orange((110, 50, 10))
+    table_a, table_b = ColorThresholds(), ColorThresholds()
+    ColorProfile(((5, 120, 60), (40, 255, 255)), table_a.field_range, 80).apply(table_a)
+
+    assert orange_mask(dark, table_a).all()
+    assert not orange_mask(dark, table_b).any()
+    assert not orange_mask(dark).any()
+    assert table_a.min_ball_area == 80
+    assert table_b.min_ball_area == DEFAULT_COLORS.min_ball_area == kicker_vision.MIN_BALL_AREA
+
+
+def test_retune_moves_its_own_thresholds():
+    colors, other = ColorThresholds(), ColorThresholds()
+    retuner = ColorRetuner(ColorProfile.default(), colors, max_step=4)
+    assert retuner._step(((10, 120, 60), (40, 255, 255)), None, 100)
+    assert tuple(colors.ball_range[0]) == (10, 120, 125)
+    assert tuple(other.ball_range[0]) == tuple(DEFAULT_COLORS.ball_range[0]) == (10, 120, 129)
+
+
+def test_lut_backend_matches_hsv_after_set():
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 256, (32, 32, 3), dtype=np.uint8)
+    hsv, lut = ColorThresholds(), ColorThresholds()
+    lut.set_backend("lut", bits=5)
+    profile = ColorProfile(((0, 60, 40), (60, 255, 255)), ((40, 40, 20), (90, 255, 255)), 50)
+    profile.apply(hsv)
+    profile.apply(lut, cache=False)
+    assert lut.state[3] is not None
+    mismatched = np.count_nonzero(orange_mask(frame, hsv) != orange_mask(frame, lut))
+    assert mismatched < frame.shape[0] * frame.shape[1] // 10
@@ -0,0 +1,46 @@
+# tests/test_instrumentation.py
+"""
+Histograms written from several threads, as the detect stage is with
+--workers > 1.
+"""
+import threading
+
+import numpy as np
+import pytest
+
+from instrumentation import Histogram, Instruments, ThreadHistograms
+
+
+def test_threaded_wrap_loses_no_records():
+    inst = Instruments()
+    timed = inst.wrap("detect", lambda: None, threads=4)
+    threads = [threading.Thread(target=lambda: [timed() for _ in range(20000)]) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    h = inst.histograms["detect"]
+    assert len(h.shards) == 4
+    assert h.count == 80000
+    assert inst.snapshot()["latency"]["detect"]["count"] == 80000
+
+
+def test_merged_matches_one_histogram():
+    values = np.random.default_rng(1).lognormal(-7, 2, 5000)
+    single, threaded = Histogram(), ThreadHistograms()
+    chunks = np.array_split(values, 3)
+
+    def write(chunk):
+        for v in chunk:
+            threaded.record(float(v))
+    for chunk in chunks:
+        t = threading.Thread(target=write, args=(chunk,))
+        t.start()
+        t.join()
+    for v in values:
+        single.record(float(v))
+    merged, expected = threaded.snapshot(), single.snapshot()
+    assert merged.pop("mean_ms") == pytest.approx(expected.pop("mean_ms"))
+    assert merged == expected
+    threaded.reset()
+    assert threaded.count == 0
@@ -0,0 +1,67 @@
+# tests/test_pipeline.py
+"""
+The pipeline ends, and says why, when a stage fails.
+"""
+import threading
+
+import pytest
+
+from pipeline import Pipeline, BLOCK
+
+
+def _run(pipeline):
+    # run() in a thread, so a hang fails the test instead of blocking it
+    outcome = {}
+
+    def target():
+        try:
+            pipeline.run()
+        except Exception as e:
+            outcome["error"] = e
+    t = threading.Thread(target=target, daemon=True)
+    t.start()
+    t.join(timeout=5.0)
+    assert not t.is_alive(), "run() did not return"
+    return outcome.get("error")
+
+
+def _capture(fail_after, error):
+    count = iter(range(1 << 30))
+
+    def capture():
+        n = next(count)
+        if n == fail_after:
+            raise error
+        return n
+    return capture
+
+
+@pytest.mark.parametrize("workers", [1, 3])
+def test_capture_error_ends_the_run(workers):
+    published = []
+    pipeline = Pipeline(_capture(20, RuntimeError("camera gone")), lambda image: image,
+                        published.append, policy=BLOCK, workers=workers)
+    error = _run(pipeline)
+    assert isinstance(error, RuntimeError)
+    assert [f.result for f in published] == list(range(20))
+    assert pipeline.captured == 20
+
+
+def test_end_of_source_is_not_an_error():
+    published = []
+    pipeline = Pipeline(_capture(10, EOFError()), lambda image: image, published.append,
+                        policy=BLOCK)
+    assert _run(pipeline) is None
+    assert len(published) == 10
+
+
+def test_detect_error_skips_the_frame():
+    def detect(image):
+        if image == 3:
+            raise ValueError("bad frame")
+        return image
+    published = []
+    pipeline = Pipeline(_capture(8, EOFError()), detect, published.append, policy=BLOCK)
+    assert _run(pipeline) is None
+    assert [f.result for f in published] == [0, 1, 2, 4, 5, 6, 7]
+    assert pipeline.failed == 1
@@ -0,0 +1,58 @@
+# tests/test_roi_monitor.py
+"""
+ROIMonitor runs the full-resolution search once per real change of the
+field, whether it follows the move or only reports it.
+"""
+import pytest
+
+import roi_monitor
+from roi_monitor import ROIMonitor
+
+ROI = (24, 12, 336, 192)
+
+
+def _monitor(monkeypatch, field, offset=0, **kwargs):
+    """
+    A monitor whose searches see the field at field[0] (a list, so the
+    test can move it); the downscaled one `offset` px off in x.
+    """
+    monitor = ROIMonitor(ROI, **kwargs)
+    monkeypatch.setattr(monitor, "_measure", lambda frame: [field[0][0] + offset, *field[0][1:]])
+    monkeypatch.setattr(roi_monitor, "find_playfield_roi", lambda frame, colors=None: field[0])
+    return monitor
+
+
+def _checks(monitor, n):
+    for _ in range(n):
+        monitor.check(None)
+
+
+def test_steady_downscale_error_searches_once(monkeypatch):
+    monitor = _monitor(monkeypatch, [ROI], offset=9)
+    _checks(monitor, 40)
+    assert (monitor.recomputes, monitor.moves) == (1, 0)
+
+
+@pytest.mark.parametrize("follow", [True, False])
+def test_move_searches_once(monkeypatch, follow):
+    field = [ROI]
+    monitor = _monitor(monkeypatch, field, follow=follow)
+    _checks(monitor, 5)
+    moved = (36, 4, 336, 192)
+    field[0] = moved
+    _checks(monitor, 30)
+    assert monitor.recomputes == 1
+    assert monitor.moves == (1 if follow else 0)
+    assert monitor.stale == (not follow)
+    assert monitor.roi == (moved if follow else ROI)
+
+
+def test_stale_clears_when_the_field_comes_back(monkeypatch):
+    field = [(36, 4, 336, 192)]
+    monitor = _monitor(monkeypatch, field, follow=False)
+    _checks(monitor, 10)
+    assert monitor.stale
+    field[0] = ROI
+    _checks(monitor, 10)
+    assert not monitor.stale
+    assert monitor.recomputes == 2
@@ -0,0 +1,245 @@
+# tracker.py
+"""
+2D constant-velocity Kalman tracker for the ball.
+
+State is (x, y, vx, vy) in field pixels / seconds. With the white-noise
+acceleration model, x and y have the same dynamics, noise and update
+times, so both axes share one 2x2 covariance [[p00, p01], [p01, p11]]
+kept in slots; a step is a handful of float operations and allocates
+nothing but its return tuple.
+"""
+import math
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+class KalmanTracker:
+    __slots__ = (
+        "process_noise", "measurement_noise", "max_missed",
+        "x", "y", "vx", "vy",
+        "p00", "p01", "p11",
+        "_dt", "_q11", "_q12", "_q22",
+        "time", "initialized", "missed",
+        # ring of recent raw measurements (for bounce localisation)
+        "_hist_t", "_hist_x", "_hist_y", "_hist_head", "_hist_len",
+    )
+
+    def __init__(self, process_noise=5000.0, measurement_noise=2.0,
+                 max_missed=6, history=16):
+        """
+        process_noise:     acceleration noise density (px/s^2)^2 * s
+        measurement_noise: std-dev of a detection in pixels
+        max_missed:        frames bridged by prediction before the track is dropped
+        """
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        self.max_missed = max_missed
+
+        self._hist_t = np.zeros(history)
+        self._hist_x = np.zeros(history)
+        self._hist_y = np.zeros(history)
+        self.reset()
+
+    def reset(self):
+        self.initialized = False
+        self.missed = 0
+        self.time = 0.0
+        self.x = self.y = self.vx = self.vy = 0.0
+        self.p00 = self.p01 = self.p11 = 0.0
+        self._dt = -1.0
+        self._hist_head = 0
+        self._hist_len = 0
+
+    @property
+    def position(self) -> Optional[Tuple[float, float]]:
+        if not self.initialized:
+            return None
+        return (self.x, self.y)
+
+    @property
+    def velocity(self) -> Optional[Tuple[float, float]]:
+        if not self.initialized:
+            return None
+        return (self.vx, self.vy)
+
+    # ------------------------------------------------------------
+
+    def _predict(self, t):
+        dt = t - self.time
+        if dt <= 0:
+            return
+        if dt != self._dt:
+            # white-noise acceleration Q, recomputed only when dt changes
+            q = self.process_noise
+            self._dt = dt
+            self._q11 = q * dt ** 3 / 3
+            self._q12 = q * dt ** 2 / 2
+            self._q22 = q * dt
+
+        self.x += self.vx * dt
+        self.y += self.vy * dt
+        # P = F P F^T + Q
+        p01, p11 = self.p01, self.p11
+        self.p00 += dt * (2.0 * p01 + dt * p11) + self._q11
+        self.p01 = p01 + dt * p11 + self._q12
+        self.p11 = p11 + self._q22
+        self.time = t
+
+    def _remember(self, t, x, y):
+        i = self._hist_head
+        self._hist_t[i] = t
+        self._hist_x[i] = x
+        self._hist_y[i] = y
+        self._hist_head = (i + 1) % len(self._hist_t)
+        if self._hist_len < len(self._hist_t):
+            self._hist_len += 1
+
+    # ------------------------------------------------------------
+
+    def update(self, x, y, t) -> Tuple[float, float]:
+        """
+        Feeds a detection at time t (seconds). Returns the filtered position.
+        """
+        self._remember(t, x, y)
+        self.missed = 0
+
+        if not self.initialized:
+            self.x, self.y = float(x), float(y)
+            self.vx = self.vy = 0.0
+            self.p00 = self.measurement_noise ** 2
+            self.p01 = 0.0
+            # unknown velocity: a few hundred px/s either way
+            self.p11 = 500.0 ** 2
+            self.time = t
+            self.initialized = True
+            return (self.x, self.y)
+
+        self._predict(t)
+
+        # gain K = P H^T / (H P H^T + R), H selects the position
+        p00, p01 = self.p00, self.p01
+        s = p00 + self.measurement_noise ** 2
+        k0 = p00 / s
+        k1 = p01 / s
+
+        ex = x - self.x
+        ey = y - self.y
+        self.x += k0 * ex
+        self.y += k0 * ey
+        self.vx += k1 * ex
+        self.vy += k1 * ey
+
+        # P = (I - K H) P
+        self.p11 -= k1 * p01
+        self.p01 = (1.0 - k0) * p01
+        self.p00 = (1.0 - k0) * p00
+
+        return (self.x, self.y)
+
+    def predict(self, t) -> Optional[Tuple[float, float]]:
+        """
+        Call for frames without a detection. Bridges up to max_missed
+        frames with the constant-velocity prediction; returns None once
+        the track is lost.
+        """
+        if not self.initialized:
+            return None
+        self.missed += 1
+        if self.missed > self.max_missed:
+            self.reset()
+            return None
+        self._predict(t)
+        return (self.x, self.y)
+
+    def step(self, measurement, t) -> Optional[Tuple[float, float]]:
+        """
+        update() if measurement is an (x, y) pair, predict() if None.
+        """
+        if measurement is None:
+            return self.predict(t)
+        return self.update(measurement[0], measurement[1], t)
+
+    # ------------------------------------------------------------
+
+    def locate_bounce(self, window=8, min_side=2) -> Optional[Tuple[float, float, float]]:
+        """
+        Sub-frame bounce estimate from the last `window` raw detections.
+
+        Splits them into an incoming and an outgoing segment (the split
+        with the smallest total line-fit residual), fits each as
+        constant-velocity motion p(t) = a + b t, and returns the time and
+        position where the two fitted paths come closest, i.e. their
+        intersection, clamped to the gap between the two segments.
+        Returns (t, x, y) or None if there are too few detections.
+        """
+        n = min(window, self._hist_len)
+        if n < 2 * min_side:
+            return None
+
+        size = len(self._hist_t)
+        idx = [(self._hist_head - n + i) % size for i in range(n)]
+        t = self._hist_t[idx]
+        x = self._hist_x[idx]
+        y = self._hist_y[idx]
+        t0 = t[0]
+        t = t - t0
+
+        best = None
+        for k in range(min_side, n - min_side + 1):
+            fin = _fit_line(t[:k], x[:k], y[:k])
+            fout = _fit_line(t[k:], x[k:], y[k:])
+            err = fin[4] + fout[4]
+            if best is None or err < best[0]:
+                best = (err, k, fin, fout)
+
+        _, k, (ax1, bx1, ay1, by1, _), (ax2, bx2, ay2, by2, _) = best
+
+        # closest approach of the two paths: minimise |p_in(t) - p_out(t)|^2
+        dax, day = ax1 - ax2, ay1 - ay2
+        dbx, dby = bx1 - bx2, by1 - by2
+        denom = dbx * dbx + dby * dby
+        lo, hi = t[k - 1], t[k]
+        if denom > 1e-9:
+            tb = -(dax * dbx + day * dby) / denom
+            tb = min(max(tb, lo), hi)
+        else:
+            tb = 0.5 * (lo + hi)
+
+        bx = 0.5 * ((ax1 + bx1 * tb) + (ax2 + bx2 * tb))
+        by = 0.5 * ((ay1 + by1 * tb) + (ay2 + by2 * tb))
+        return (tb + t0, bx, by)
+
+
+def _fit_line(t, x, y):
+    """
+    Least-squares x = ax + bx t, y = ay + by t.
+    Returns (ax, bx, ay, by, squared residual).
+    """
+    n = len(t)
+    tm = t.mean()
+    dt = t - tm
+    var = float(dt @ dt)
+    xm = x.mean()
+    ym = y.mean()
+    if var > 0:
+        bx = float(dt @ (x - xm)) / var
+        by = float(dt @ (y - ym)) / var
+    else:
+        bx = by = 0.0
+    ax = xm - bx * tm
+    ay = ym - by * tm
+    if n <= 2:
+        err = 0.0
+    else:
+        rx = x - (ax + bx * t)
+        ry = y - (ay + by * t)
+        err = float(rx @ rx + ry @ ry)
+    return ax, bx, ay, by, err
+
+
+def bounce_error(estimate, truth) -> float:
+    """
+    Distance in pixels between a (t, x, y) estimate and a true (x, y).
+    """
+    return math.hypot(estimate[1] - truth[0], estimate[2] - truth[1])